@@ -0,0 +1,254 @@
+# admission.py
+"""
+Admission control in front of generation.
+
+Two layers, both cheap to check before any model work starts:
+- Token buckets: one per caller (user_id, or the client address when there is
+  none) and one global, each refilling at `rate` requests/second up to `burst`.
+  An empty bucket turns the request away at once with the time until the next
+  token, for `Retry-After`.
+- A cap on in-flight generations per instance, with a bounded FIFO wait
+  queue: a request that finds every slot taken waits up to `queue_timeout`
+  for one; when the queue itself is full it is turned away immediately.
+
+Buckets live in a pluggable backend: the in-process one below is the default;
+a store shared by all instances only needs to implement `RateLimitBackend`.
+The in-flight cap is per instance by design (it protects this process).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Request turned away (HTTP 429); `retry_after` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Too many requests ({reason.replace('_', ' ')}); retry in {retry_after:.1f}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def admission_key(user_id: Optional[str], client_address: Optional[str]) -> str:
+    """Bucket key: the user_id, else the client address (anonymous callers share by address)."""
+    if user_id and user_id != "unknown":
+        return f"user:{user_id}"
+    return f"addr:{client_address or 'unknown'}"
+
+
+# ---------- token buckets ----------
+class RateLimitBackend:
+    """Interface for token bucket stores; `take` must be atomic per key."""
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Take one token: 0.0 if taken, else seconds until one is available."""
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Thread-safe token buckets; the least recently used are dropped past `max_keys`."""
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # A dropped bucket comes back full, which only errs on the lenient side
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# ---------- in-flight cap ----------
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class Slot:
+    """One in-flight generation; `release()` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", waited: float = 0.0):
+        self._controller = controller
+        self.waited = waited
+        self._admitted_at = controller._clock()
+
+    def release(self) -> None:
+        controller, self._controller = self._controller, None
+        if controller is not None:
+            controller._release(controller._clock() - self._admitted_at)
+
+
+class AdmissionController:
+    """
+    Rate limits (`check`) and the in-flight cap (`acquire` / `aacquire`).
+    A rate or limit left as None is not enforced, so `AdmissionController()`
+    admits everything.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend = None,
+        user_rate: float = None,
+        user_burst: float = None,
+        global_rate: float = None,
+        global_burst: float = None,
+        max_in_flight: int = None,
+        max_queue: int = 0,
+        queue_timeout: float = 5.0,
+        clock=time.monotonic,
+    ):
+        self.backend = backend or InMemoryRateLimitBackend(clock=clock)
+        self.user_rate = user_rate or None
+        self.user_burst = user_burst or max(1.0, user_rate or 1.0)
+        self.global_rate = global_rate or None
+        self.global_burst = global_burst or max(1.0, global_rate or 1.0)
+        self.max_in_flight = max_in_flight or None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        # Recent time a generation holds its slot, for the queue-full Retry-After
+        self._hold_seconds = 1.0
+        self._counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_user_rate": 0,
+            "rejected_global_rate": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+            "peak_in_flight": 0,
+            "peak_waiting": 0,
+        }
+
+    # ---- token buckets ----
+    def check(self, key: str) -> None:
+        """Take a token from `key`'s bucket, then the global one; raises AdmissionRejected."""
+        if self.user_rate:
+            wait = self.backend.take(key, self.user_rate, self.user_burst)
+            if wait:
+                self._reject("user_rate", wait)
+        if self.global_rate:
+            # A request turned away here has still spent its caller's token
+            wait = self.backend.take("global", self.global_rate, self.global_burst)
+            if wait:
+                self._reject("global_rate", wait)
+
+    def _reject(self, reason: str, retry_after: float):
+        with self._lock:
+            self._counters[f"rejected_{reason}"] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    # ---- in-flight cap ----
+    def _enter_or_queue(self, wake):
+        """(slot, None) when admitted now, (None, waiter) when queued; raises when the queue is full."""
+        with self._lock:
+            if self.max_in_flight is None or (self._in_flight < self.max_in_flight and not self._waiters):
+                self._in_flight += 1
+                self._counters["admitted"] += 1
+                self._counters["peak_in_flight"] = max(self._counters["peak_in_flight"], self._in_flight)
+                return Slot(self), None
+            if len(self._waiters) >= self.max_queue:
+                self._counters["rejected_queue_full"] += 1
+                ahead = len(self._waiters) + 1
+                raise AdmissionRejected("queue_full", self._hold_seconds * ahead / self.max_in_flight)
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            self._counters["queued"] += 1
+            self._counters["peak_waiting"] = max(self._counters["peak_waiting"], len(self._waiters))
+            return None, waiter
+
+    def _give_up(self, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Leave the queue; False if a slot was handed over meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            if timed_out:
+                self._counters["rejected_queue_timeout"] += 1
+            return True
+
+    def _admitted(self, started: float) -> Slot:
+        waited = self._clock() - started
+        with self._lock:
+            self._counters["admitted"] += 1
+        return Slot(self, waited)
+
+    def acquire(self, timeout: float = None) -> Slot:
+        """Slot for one generation, waiting in the queue if every slot is taken."""
+        started = self._clock()
+        event = threading.Event()
+        slot, waiter = self._enter_or_queue(event.set)
+        if slot is not None:
+            return slot
+        timeout = self.queue_timeout if timeout is None else timeout
+        if not event.wait(timeout) and self._give_up(waiter):
+            raise AdmissionRejected("queue_timeout", timeout)
+        return self._admitted(started)
+
+    async def aacquire(self, timeout: float = None) -> Slot:
+        """`acquire` for async callers; waits without blocking the event loop."""
+        started = self._clock()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        slot, waiter = self._enter_or_queue(wake)
+        if slot is not None:
+            return slot
+        timeout = self.queue_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self._give_up(waiter):
+                raise AdmissionRejected("queue_timeout", timeout) from None
+        except asyncio.CancelledError:
+            # Hand back a slot granted just as the caller went away
+            if not self._give_up(waiter, timed_out=False):
+                self._release()
+            raise
+        return self._admitted(started)
+
+    def _release(self, held: float = None) -> None:
+        with self._lock:
+            if held is not None:
+                self._hold_seconds += 0.1 * (held - self._hold_seconds)
+            if self._waiters:
+                # Hand the slot straight to the longest waiter; in_flight is unchanged
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            else:
+                self._in_flight -= 1
+                return
+        waiter.wake()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, in_flight=self._in_flight, waiting=len(self._waiters))
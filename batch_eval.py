@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Batch evaluation: run many `{history, message}` items through the entrypoint.
+
+Items are fanned out with bounded concurrency and an optional requests/second
+limit, and each result is written as one JSONL line as soon as it completes
+(completion order, not input order), with the item's id, latency, status,
+reply and error. Use it to re-run recorded conversations after a prompt change.
+
+Targets:
+    --url URL    the deployed function (identity token from `gcloud`, or --token)
+    --local      main.app_async in-process, with this machine's credentials
+
+Input is JSONL (one item per line) or a JSON list; items without an "id" are
+numbered by position.
+
+Usage:
+    python batch_eval.py items.jsonl --url https://.../cv-gemini-2-5-bucket -c 16 --rps 8 > results.jsonl
+    python batch_eval.py items.jsonl --local -c 32 -o results.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TextIO
+
+DEFAULT_URL = "https://us-central1-christinevalmy.cloudfunctions.net/cv-gemini-2-5-bucket"
+# Retries of an item turned away with 429, waiting Retry-After (else backoff) between them
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_MAX_WAIT_SECONDS = 30.0
+
+Send = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def read_items(path: str) -> Iterator[Dict[str, Any]]:
+    """Items from a JSONL file (or a JSON list), numbered when they carry no id."""
+    with open(path) as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            items = json.load(f)
+        else:
+            items = (json.loads(line) for line in f if line.strip())
+        for i, item in enumerate(items):
+            item.setdefault("id", i)
+            yield item
+
+
+def request_body(item: Dict[str, Any]) -> Dict[str, Any]:
+    thread_id = str(item.get("thread_id", item["id"]))
+    return {
+        "message": item["message"],
+        "history": item.get("history") or [],
+        # One user per item, so the server's per-user rate limit applies per conversation
+        "user_id": item.get("user_id", f"batch-eval-{thread_id}"),
+        "thread_id": thread_id,
+    }
+
+
+def retry_after(headers, retry: int) -> float:
+    """Seconds to wait before retrying a 429: its Retry-After, else exponential backoff."""
+    try:
+        wait = float(headers.get("retry-after", ""))
+    except ValueError:
+        wait = 2.0 ** retry
+    return min(max(wait, 0.0), RATE_LIMIT_MAX_WAIT_SECONDS)
+
+
+async def evaluate(
+    items,
+    send: Send,
+    out: TextIO,
+    concurrency: int = 8,
+    rps: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Send every item and write one JSONL result per item as it completes.
+    At most `concurrency` requests are in flight; `rps` caps the start rate.
+    Returns a summary.
+    """
+    queue: "asyncio.Queue" = asyncio.Queue(maxsize=concurrency * 2)
+    limiter = RateLimiter(rps, burst=concurrency) if rps else None
+    summary = {"items": 0, "ok": 0, "errors": 0, "latency_seconds": []}
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if limiter:
+                await limiter.acquire()
+            started = time.perf_counter()
+            record: Dict[str, Any] = {"id": item["id"], "message": item.get("message")}
+            try:
+                payload = await send(item)
+                record.update(
+                    status=payload.get("status_code", 200),
+                    response=payload.get("response"),
+                    model=payload.get("model"),
+                    ttft=payload.get("ttft"),
+                    error=payload.get("error"),
+                )
+            except Exception as e:
+                record.update(status=None, response=None, error=f"{type(e).__name__}: {e}")
+            record["latency"] = round(time.perf_counter() - started, 3)
+
+            ok = record["status"] == 200 and not record.get("error")
+            summary["items"] += 1
+            summary["ok" if ok else "errors"] += 1
+            summary["latency_seconds"].append(record["latency"])
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    try:
+        for item in items:
+            # Bounded queue: a huge input file is read as workers make room
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+
+    latencies: List[float] = sorted(summary.pop("latency_seconds"))
+    if latencies:
+        summary["latency_p50"] = latencies[len(latencies) // 2]
+        summary["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return summary
+
+
+def http_sender(client, url: str, token: Optional[str], sleep=asyncio.sleep) -> Send:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    async def send(item: Dict[str, Any]) -> Dict[str, Any]:
+        body = request_body(item)
+        resp = await client.post(url, json=body, headers=headers)
+        for retry in range(RATE_LIMIT_RETRIES):
+            if resp.status_code != 429:
+                break
+            await sleep(retry_after(resp.headers, retry))
+            resp = await client.post(url, json=body, headers=headers)
+        try:
+            payload = resp.json()
+        except ValueError:
+            payload = {"error": resp.text[:500]}
+        payload.setdefault("status_code", resp.status_code)
+        if resp.status_code != 200:
+            payload["status_code"] = resp.status_code
+        return payload
+
+    return send
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        if args.local:
+            import main
+            from starlette.applications import Starlette
+            from starlette.routing import Route
+
+            asgi = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+            transport = httpx.ASGITransport(app=asgi)
+            client = httpx.AsyncClient(transport=transport, base_url="http://local", timeout=args.timeout)
+            url, token = "/", None
+        else:
+            client = httpx.AsyncClient(timeout=args.timeout, limits=limits)
+            url = args.url
+            token = args.token or subprocess.getoutput("gcloud auth print-identity-token").strip()
+        async with client:
+            return await evaluate(
+                read_items(args.items), http_sender(client, url, token), out, args.concurrency, args.rps
+            )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("items", help="JSONL (or JSON list) of {id?, history, message}")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default=DEFAULT_URL, help="function URL (default: production)")
+    target.add_argument("--local", action="store_true", help="call main.app_async in-process")
+    parser.add_argument("--token", help="identity token (default: gcloud auth print-identity-token)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--rps", type=float, help="max requests started per second")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("-o", "--out", help="write JSONL results here instead of stdout")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = asyncio.run(run(args))
+    summary["wall_seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the chat entrypoint.
+
+Replays multi-turn conversations (shaped like history.json) against `main.app`
+or `main.app_async` in-process, with a fake Gemini that streams chunks after a
+configurable time-to-first-token and inter-chunk delay and fails a fraction of
+calls, and a fake Vertex AI Search backend. Nothing leaves the machine.
+
+Reports p50/p95/p99 latency and TTFT, throughput, errors and per-stage
+timings from the reply logs; `--json` saves the report and `--baseline`
+compares against a saved one.
+
+Usage:
+    python bench_load.py                                  # history.json, 8 concurrent conversations
+    python bench_load.py --concurrency 32 --conversations 200 --ttft 0.8 --failure-rate 0.05
+    python bench_load.py --target async --stream --json after.json --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+REPLY = (
+    "Hi there! I'm so glad you reached out. We offer **Skin Care**, Cosmetology, "
+    "Manicure and Barbering in New Jersey, and Esthetics, Nails and Makeup in New "
+    "York. The next start dates are coming up soon. What sparks your interest "
+    "the most, and which campus is closer to you?"
+)
+
+
+class FakeGemini:
+    """Streams REPLY in chunks; sync and async (`.aio`) model APIs plus caches."""
+
+    def __init__(self, ttft: float, inter_chunk: float, chunks: int, failure_rate: float, seed: int):
+        self.ttft = ttft
+        self.inter_chunk = inter_chunk
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        words = REPLY.split(" ")
+        step = max(1, -(-len(words) // chunks))
+        self.pieces = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+        self.calls = 0
+        self.failures = 0
+        self.models = SimpleNamespace(generate_content_stream=self._stream)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content_stream=self._astream))
+        self.caches = SimpleNamespace(create=self._create_cache, update=self._create_cache)
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            self.failures += fail
+        return fail
+
+    @staticmethod
+    def _error():
+        from google.genai import errors
+
+        return errors.APIError(503, {"error": {"code": 503, "message": "fake overload", "status": "UNAVAILABLE"}})
+
+    def _create_cache(self, **kwargs):
+        return SimpleNamespace(name=f"cachedContents/fake-{self.calls}", expire_time=None)
+
+    def _stream(self, model, contents, config):
+        if self._should_fail():
+            raise self._error()
+
+        def chunks():
+            time.sleep(self.ttft)
+            for i, piece in enumerate(self.pieces):
+                if i:
+                    time.sleep(self.inter_chunk)
+                yield SimpleNamespace(text=piece)
+
+        return chunks()
+
+    async def _astream(self, model, contents, config):
+        if self._should_fail():
+            raise self._error()
+
+        async def chunks():
+            await asyncio.sleep(self.ttft)
+            for i, piece in enumerate(self.pieces):
+                if i:
+                    await asyncio.sleep(self.inter_chunk)
+                yield SimpleNamespace(text=piece)
+
+        return chunks()
+
+
+def load_conversations(paths: List[str]) -> List[List[str]]:
+    """User turns of each conversation; a file holds one history or a list of them."""
+    conversations = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        histories = data if data and isinstance(data[0], list) else [data]
+        for history in histories:
+            turns = [
+                item["text"]
+                for item in history
+                if item.get("role") == "user" and (item.get("text") or "").strip()
+            ]
+            if turns:
+                conversations.append(turns)
+    if not conversations:
+        raise SystemExit("no user turns found in " + ", ".join(paths))
+    return conversations
+
+
+def install_fakes(args):
+    """Import main and swap its external clients for local fakes."""
+    os.environ.setdefault("LOG_FLUSH_INTERVAL", "0.5")
+    import main
+    from log_pipeline import BackgroundLogger, ListSink
+    from retrieval import FakeSearchBackend, Retriever, SearchResult
+
+    fake = FakeGemini(args.ttft, args.inter_chunk, args.chunks, args.failure_rate, args.seed)
+    main._client = fake
+    sink = ListSink()
+    main.logger = BackgroundLogger(sink, max_queue=100000, batch_size=500)
+    docs = [
+        SearchResult("Esthetics, Nails and Makeup programs are offered at the New York campus.", "https://fake/ny"),
+        SearchResult("Skin Care, Cosmetology, Manicure and Barbering run in Wayne, New Jersey.", "https://fake/nj"),
+        SearchResult("Tuition, fees and payment plans are discussed with an admissions advisor.", "https://fake/pricing"),
+    ]
+    main.retriever = Retriever(FakeSearchBackend(docs, latency=args.search_latency), cache=main.retriever.cache)
+    main.RESPONSE_CACHE_ENABLED = not args.no_response_cache
+    main.CONTEXT_CACHE_ENABLED = not args.no_context_cache
+    # Every simulated conversation comes from one address; only the in-flight cap applies
+    from admission import AdmissionController
+
+    main.admission = AdmissionController(
+        max_in_flight=main.ADMISSION_MAX_IN_FLIGHT,
+        max_queue=main.ADMISSION_MAX_QUEUE,
+        queue_timeout=main.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    )
+    return main, fake, sink
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0..100)."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return round(values[int(rank) - 1], 4)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    values = [v for v in values if v is not None]
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def _parse_sse(text: str) -> Dict[str, Any]:
+    """Final `done` (or `error`) payload of an SSE body."""
+    last = {}
+    for block in text.strip().split("\n\n"):
+        event, _, data = block.partition("\n")
+        if event in ("event: done", "event: error"):
+            last = json.loads(data[len("data: "):])
+            if event == "event: error":
+                last.setdefault("status_code", 500)
+    return last
+
+
+# ---------- drivers: each returns one record per request ----------
+def run_sync(main, conversations, args) -> List[Dict[str, Any]]:
+    from flask import Flask, request
+
+    flask_app = Flask("bench")
+    flask_app.add_url_rule("/", "app", lambda: main.app(request), methods=["POST"])
+    client_local = threading.local()
+
+    def client():
+        if not hasattr(client_local, "c"):
+            client_local.c = flask_app.test_client()
+        return client_local.c
+
+    def converse(turns: List[str]) -> List[Dict[str, Any]]:
+        history, records = [], []
+        for text in turns:
+            body = {"message": text, "history": list(history), "stream": args.stream}
+            started = time.perf_counter()
+            first = None
+            resp = client().post("/", json=body, buffered=not args.stream)
+            if args.stream:
+                parts = []
+                for piece in resp.response:
+                    if first is None:
+                        first = time.perf_counter() - started
+                    parts.append(piece.decode() if isinstance(piece, bytes) else piece)
+                payload = _parse_sse("".join(parts))
+            else:
+                payload = resp.get_json() or {}
+            records.append(_record(payload, resp.status_code, started, first))
+            history += [{"role": "user", "text": text}, {"role": "assistant", "text": payload.get("response", "")}]
+        return records
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return [r for rs in pool.map(converse, conversations) for r in rs]
+
+
+def run_async(main, conversations, args) -> List[Dict[str, Any]]:
+    import httpx
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+
+    asgi = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+
+    async def converse(client, sem, turns):
+        history, records = [], []
+        async with sem:
+            for text in turns:
+                body = {"message": text, "history": list(history), "stream": args.stream}
+                started = time.perf_counter()
+                async with client.stream("POST", "/", json=body) as resp:
+                    parts = [piece async for piece in resp.aiter_text()]
+                raw = "".join(parts)
+                payload = _parse_sse(raw) if args.stream else json.loads(raw or "{}")
+                # httpx's ASGI transport buffers the body, so TTFT comes from the server here
+                records.append(_record(payload, resp.status_code, started, None))
+                history += [{"role": "user", "text": text}, {"role": "assistant", "text": payload.get("response", "")}]
+        return records
+
+    async def run():
+        sem = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=asgi)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = await asyncio.gather(*(converse(client, sem, t) for t in conversations))
+        return [r for rs in results for r in rs]
+
+    return asyncio.run(run())
+
+
+def _record(payload: Dict[str, Any], status: int, started: float, client_ttft: Optional[float]) -> Dict[str, Any]:
+    return {
+        "status": payload.get("status_code", status) if status == 200 else status,
+        "latency": time.perf_counter() - started,
+        "server_latency": payload.get("total_latency"),
+        "ttft": client_ttft if client_ttft is not None else payload.get("ttft"),
+        "cached": bool(payload.get("cached")),
+    }
+
+
+def stage_breakdown(entries) -> Dict[str, Dict[str, Optional[float]]]:
+    """Per-stage timings from the reply logs."""
+    stages: Dict[str, List[float]] = {"search": [], "first_token": [], "generation_after_first_token": []}
+    routes: Dict[str, int] = {}
+    for info, _ in entries:
+        if info.get("event") != "assistant_reply" or info.get("response_cache"):
+            continue
+        retrieval = info.get("retrieval") or {}
+        if "latency" in retrieval:
+            stages["search"].append(retrieval["latency"])
+        if "route" in retrieval:
+            routes[retrieval["route"]] = routes.get(retrieval["route"], 0) + 1
+        for name, ms in (info.get("stages_ms") or {}).items():
+            stages.setdefault(name, []).append(ms / 1000)
+        ttft, total = info.get("ttft"), info.get("total_latency")
+        if ttft is not None:
+            stages["first_token"].append(ttft)
+            if total is not None:
+                stages["generation_after_first_token"].append(total - ttft)
+    out = {name: summarize(values) for name, values in stages.items()}
+    out["grounding_routes"] = routes
+    return out
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print("\nvs baseline:")
+    for section in ("latency", "ttft"):
+        for q in ("p50", "p95", "p99"):
+            new, old = report[section][q], baseline.get(section, {}).get(q)
+            if new is not None and old:
+                print(f"  {section:8s} {q}: {old * 1000:8.1f} -> {new * 1000:8.1f} ms ({(new - old) / old:+.1%})")
+    new, old = report["throughput_rps"], baseline.get("throughput_rps")
+    if old:
+        print(f"  throughput: {old:.2f} -> {new:.2f} req/s ({(new - old) / old:+.1%})")
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", default=["history.json"], help="conversation JSON files")
+    parser.add_argument("--target", choices=["sync", "async"], default="sync", help="main.app or main.app_async")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations in flight")
+    parser.add_argument("--conversations", type=int, default=50, help="conversations to replay (cycled)")
+    parser.add_argument("--stream", action="store_true", help="request SSE (sync: first chunk timed client-side)")
+    parser.add_argument("--ttft", type=float, default=0.5, help="fake model time to first chunk (s)")
+    parser.add_argument("--inter-chunk", type=float, default=0.03, help="fake model delay between chunks (s)")
+    parser.add_argument("--chunks", type=int, default=8, help="chunks per fake reply")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of model calls failing with 503")
+    parser.add_argument("--search-latency", type=float, default=0.15, help="fake search latency (s)")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--no-context-cache", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="write the report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    pool = load_conversations(args.files)
+    conversations = [pool[i % len(pool)] for i in range(args.conversations)]
+    main, fake, sink = install_fakes(args)
+
+    started = time.perf_counter()
+    records = (run_async if args.target == "async" else run_sync)(main, conversations, args)
+    wall = time.perf_counter() - started
+    main.logger.flush()
+
+    ok = [r for r in records if r["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for r in records:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_path", "baseline")},
+        "requests": len(records),
+        "statuses": statuses,
+        "response_cache_hits": sum(r["cached"] for r in records),
+        "model_calls": fake.calls,
+        "injected_failures": fake.failures,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(records) / wall, 3) if wall else None,
+        "latency": summarize([r["latency"] for r in ok]),
+        "server_latency": summarize([r["server_latency"] for r in ok]),
+        "ttft": summarize([r["ttft"] for r in ok]),
+        "stages": stage_breakdown(sink.entries),
+    }
+
+    print(f"{report['requests']} requests over {len(conversations)} conversations "
+          f"({args.target}, concurrency {args.concurrency}) in {wall:.2f}s "
+          f"= {report['throughput_rps']:.2f} req/s; statuses {statuses}")
+    for name in ("latency", "ttft"):
+        s = report[name]
+        if s["count"]:
+            print(f"  {name:8s} p50 {s['p50'] * 1000:7.1f} ms  p95 {s['p95'] * 1000:7.1f} ms  p99 {s['p99'] * 1000:7.1f} ms")
+    for name, s in report["stages"].items():
+        if name != "grounding_routes" and s["count"]:
+            print(f"  stage {name:30s} p50 {s['p50'] * 1000:7.1f} ms  p95 {s['p95'] * 1000:7.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: single-pass markdown_to_text vs the previous
+markdown → HTML → selectolax/BeautifulSoup round trip.
+
+The legacy path needs the packages it used to pull in:
+    pip install markdown "selectolax<1" beautifulsoup4
+
+Usage:
+    python bench_md_text.py [--number 2000]
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+from md_text import markdown_to_text
+
+
+def legacy_html_to_text(markdown_text: str) -> str:
+    """Markdown → HTML → plain text with selectolax, fallback to BeautifulSoup."""
+    from markdown import markdown as md_to_html
+    from selectolax.parser import HTMLParser
+
+    html_doc = md_to_html(markdown_text or "")
+    try:
+        tree = HTMLParser(html_doc)
+        if tree.body:
+            text = tree.body.text(separator="\n").strip()
+        else:
+            text = tree.root.text(separator="\n").strip()
+        if text:
+            return (
+                text.replace("\\u2019", "'")
+                .replace("\\u2014", "—")
+                .replace("\xa0", " ")
+                .strip()
+            )
+    except Exception:
+        pass
+    from bs4 import BeautifulSoup
+
+    plain = BeautifulSoup(html_doc, "html.parser").get_text(separator="\n").strip()
+    return (
+        plain.replace("\\u2019", "'")
+        .replace("\\u2014", "—")
+        .replace("\xa0", " ")
+        .strip()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="markdown → text benchmark")
+    parser.add_argument("--number", type=int, default=2000, help="conversions per case")
+    args = parser.parse_args()
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "md_text_golden.json")) as f:
+        cases = json.load(f)
+    typical = next(c["markdown"] for c in cases if c["name"] == "typical_reply")
+    corpus = [c["markdown"] for c in cases]
+
+    # Warm up imports so they are not counted
+    legacy_html_to_text("warm **up**")
+    markdown_to_text("warm **up**")
+
+    print(f"{'input':<16}{'legacy µs':>12}{'single-pass µs':>17}{'speedup':>10}")
+    for label, inputs in (("typical_reply", [typical]), ("golden corpus", corpus)):
+        legacy = timeit.timeit(lambda: [legacy_html_to_text(t) for t in inputs], number=args.number)
+        fast = timeit.timeit(lambda: [markdown_to_text(t) for t in inputs], number=args.number)
+        per = args.number * len(inputs)
+        print(f"{label:<16}{legacy / per * 1e6:>12.1f}{fast / per * 1e6:>17.1f}{legacy / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request/response body handling on the wire.
+
+For conversations of increasing length it compares, per request:
+- body size plain vs gzip (levels 1/5/9), and the transfer time that size
+  costs on a slow mobile link (--kbps)
+- encode + decode time with the standard json module vs orjson (when installed)
+- the server-side decode path (`wire.decode_body` + parse) for plain and gzip
+
+Usage:
+    python bench_wire.py [--turns 2 10 40 100] [--number 2000] [--kbps 400]
+"""
+
+import argparse
+import gzip
+import json
+import timeit
+
+from wire import JSON_CODECS, decode_body, parse_json_object
+
+SAMPLE_TURNS = [
+    ("user", "Hi! What programs do you offer in New Jersey? I'm interested in cosmetology and barbering."),
+    (
+        "assistant",
+        "We offer Skin Care, Cosmetology, Manicure and Barbering at our Wayne, NJ campus. "
+        "The next Cosmetology class runs Monday-Thursday 9am-3:30pm, from October 6th 2025 "
+        "to June 23rd 2026. Would you like to hear about schedules or tuition?",
+    ),
+    ("user", "¿Cuánto cuesta el programa de barbería? Y hay horario de noche?"),
+    (
+        "assistant",
+        "¡Claro! El programa de Barbería tiene horario nocturno de lunes a jueves. "
+        "¿Te gustaría que un asesor te contacte con los detalles de matrícula?",
+    ),
+]
+
+
+def request_body(turns: int) -> dict:
+    history = [
+        {"role": role, "text": text} for role, text in (SAMPLE_TURNS * (turns // len(SAMPLE_TURNS) + 1))[:turns]
+    ]
+    return {"message": "What are the start dates?", "user_id": "bench", "thread_id": "t", "history": history}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wire encoding benchmark")
+    parser.add_argument("--turns", type=int, nargs="+", default=[2, 10, 40, 100], help="history lengths")
+    parser.add_argument("--number", type=int, default=2000, help="iterations per timing")
+    parser.add_argument("--kbps", type=float, default=400, help="link speed for transfer estimates")
+    args = parser.parse_args()
+
+    print(f"codecs: {', '.join(JSON_CODECS)}; link {args.kbps:g} kbit/s\n")
+    for turns in args.turns:
+        body = request_body(turns)
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        print(f"history={turns} turns, plain {len(raw):,} B ({len(raw) * 8 / args.kbps:.1f} ms on the link)")
+
+        for level in (1, 5, 9):
+            packed = gzip.compress(raw, compresslevel=level)
+            seconds = timeit.timeit(lambda: gzip.compress(raw, compresslevel=level), number=args.number)
+            print(
+                f"  gzip-{level}: {len(packed):,} B ({len(packed) / len(raw):.0%}, "
+                f"{len(packed) * 8 / args.kbps:.1f} ms on the link), "
+                f"compress {seconds / args.number * 1e6:.1f} µs"
+            )
+
+        for name, (dumps, loads) in JSON_CODECS.items():
+            enc = timeit.timeit(lambda: dumps(body), number=args.number)
+            dec = timeit.timeit(lambda: loads(raw), number=args.number)
+            print(
+                f"  {name:>6}: encode {enc / args.number * 1e6:.1f} µs, "
+                f"decode {dec / args.number * 1e6:.1f} µs"
+            )
+
+        packed = gzip.compress(raw, compresslevel=6)
+        for name, (_, loads) in JSON_CODECS.items():
+            plain = timeit.timeit(
+                lambda: parse_json_object(decode_body(raw, None, 1 << 22), loads), number=args.number
+            )
+            gz = timeit.timeit(
+                lambda: parse_json_object(decode_body(packed, "gzip", 1 << 22), loads), number=args.number
+            )
+            print(
+                f"  server decode ({name}): plain {plain / args.number * 1e6:.1f} µs, "
+                f"gzip {gz / args.number * 1e6:.1f} µs"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
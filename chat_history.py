@@ -0,0 +1,173 @@
+# chat_history.py
+"""
+Append-only, per-thread chat history for the smoke-test client.
+
+Each thread is `<dir>/<thread_id>.jsonl`, one turn per line, plus
+`<thread_id>.idx`: the byte offset of every line as a little-endian uint64.
+Saving a turn appends one line and one index entry, so it costs the same at
+turn 10 and at turn 10,000. `tail(n)` uses the index to seek straight to the
+last `n` turns. On open, a torn last line (crash mid-write) is cut off, and
+index entries that lag behind the log are rebuilt from the log.
+`compact(keep_last)` writes the new log through a temp file and `os.replace`,
+so a crash leaves either the old log or the new one, never a mix.
+"""
+import json
+import os
+import re
+import struct
+import time
+from typing import Dict, Iterator, List, Optional
+
+_OFFSET = struct.Struct("<Q")
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _complete_end(f, size: int, block: int = 4096) -> int:
+    """Length of `f` up to and including its last newline."""
+    end = size
+    while end > 0:
+        start = max(0, end - block)
+        f.seek(start)
+        cut = f.read(end - start).rfind(b"\n")
+        if cut >= 0:
+            return start + cut + 1
+        end = start
+    return 0
+
+
+def _fsync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class ThreadLog:
+    def __init__(self, directory: str, thread_id: str, fsync: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        name = _UNSAFE.sub("_", str(thread_id)) or "_"
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.fsync = fsync
+        self._offsets = self._recover()
+        self._log = open(self.path, "ab")
+        self._index = open(self.index_path, "ab")
+
+    # ---------- recovery ----------
+    def _recover(self) -> List[int]:
+        """Offsets of every complete line, repairing the log and index in place."""
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+        with open(self.path, "rb+") as log:
+            size = log.seek(0, os.SEEK_END)
+            end = _complete_end(log, size)
+            if end != size:
+                log.truncate(end)
+
+            indexed = self._read_index(log, end)
+            offsets = list(indexed)
+            # Index any lines written after the last indexed one
+            pos = offsets[-1] if offsets else 0
+            log.seek(pos)
+            for i, line in enumerate(log):
+                if i or not offsets:
+                    offsets.append(pos)
+                pos += len(line)
+
+        if offsets != indexed or not os.path.exists(self.index_path):
+            with open(self.index_path, "wb") as index:
+                index.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        return offsets
+
+    def _read_index(self, log, log_size: int) -> List[int]:
+        try:
+            with open(self.index_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        raw = raw[: len(raw) - len(raw) % _OFFSET.size]
+        offsets = [o for (o,) in _OFFSET.iter_unpack(raw)]
+        # Keep the prefix that is strictly increasing and inside the log
+        for i, o in enumerate(offsets):
+            if o >= log_size or (i and o <= offsets[i - 1]):
+                offsets = offsets[:i]
+                break
+        # The last entry must start a line, or the index is not for this log
+        if offsets and offsets[-1]:
+            log.seek(offsets[-1] - 1)
+            if log.read(1) != b"\n":
+                return []
+        return offsets
+
+    # ---------- reads / writes ----------
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def append(self, role: str, text: str, **extra) -> None:
+        line = json.dumps({"role": role, "text": text, "ts": round(time.time(), 3), **extra}, ensure_ascii=False)
+        offset = self._log.seek(0, os.SEEK_END)
+        self._log.write(line.encode("utf-8") + b"\n")
+        self._log.flush()
+        if self.fsync:
+            _fsync(self._log)
+        # Index after the log: a crash in between is repaired on the next open
+        self._index.write(_OFFSET.pack(offset))
+        self._index.flush()
+        self._offsets.append(offset)
+
+    def _read_from(self, offset: int) -> Iterator[Dict]:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                yield json.loads(line)
+
+    def tail(self, n: Optional[int] = None) -> List[Dict]:
+        """The last `n` turns (all when None), oldest first, as {"role", "text"}."""
+        if not self._offsets or n == 0:
+            return []
+        start = 0 if n is None or n >= len(self._offsets) else len(self._offsets) - n
+        return [{"role": t["role"], "text": t["text"]} for t in self._read_from(self._offsets[start])]
+
+    def compact(self, keep_last: Optional[int] = None) -> int:
+        """Rewrite the thread (optionally only its last `keep_last` turns) atomically. Returns turns kept."""
+        start = 0 if keep_last is None or keep_last >= len(self._offsets) else len(self._offsets) - keep_last
+        tmp_log, tmp_index = self.path + ".tmp", self.index_path + ".tmp"
+        offsets = []
+        with open(tmp_log, "wb") as out:
+            if self._offsets and keep_last != 0:
+                for turn in self._read_from(self._offsets[start]):
+                    offsets.append(out.tell())
+                    out.write(json.dumps(turn, ensure_ascii=False).encode("utf-8") + b"\n")
+            _fsync(out)
+        with open(tmp_index, "wb") as out:
+            out.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            _fsync(out)
+
+        self.close()
+        # Drop the index first: until the new one is in place, opening the
+        # thread rebuilds it from whichever log is there
+        os.remove(self.index_path)
+        os.replace(tmp_log, self.path)
+        os.replace(tmp_index, self.index_path)
+        self._offsets = offsets
+        self._log = open(self.path, "ab")
+        self._index = open(self.index_path, "ab")
+        return len(offsets)
+
+    def close(self) -> None:
+        for f in (self._log, self._index):
+            if not f.closed:
+                f.close()
+
+
+def migrate_json(json_path: str, log: ThreadLog) -> int:
+    """
+    Copy a legacy `history.json` list into an empty thread log; the JSON file
+    is left as it is (a log that already has turns is never imported into
+    again). Returns the number of turns imported.
+    """
+    if len(log) or not os.path.exists(json_path):
+        return 0
+    with open(json_path) as f:
+        turns = json.load(f)
+    for turn in turns:
+        log.append(turn.get("role", "user"), turn.get("text", ""))
+    return len(turns)
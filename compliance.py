@@ -0,0 +1,225 @@
+# compliance.py
+"""
+Mechanical checks for the prompt's Final Validation Checklist.
+
+`score_reply` checks one assistant reply:
+- word_limit: under 75 words
+- max_two_dates: at most two upcoming start dates (the end of a
+  "from X to Y" range is not counted as a start)
+- no_past_dates: no date before the conversation date
+- no_school_contact: no phone number or email address the user did not give
+- campus_programs: programs tied to the campus that actually offers them
+- language: reply in the language detected for the user
+
+Everything is precompiled at import, so a worker process pays the setup once.
+"""
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sophia_prompt import detect_language
+
+MAX_WORDS = 75
+MAX_FUTURE_DATES = 2
+
+RULES = (
+    "word_limit",
+    "max_two_dates",
+    "no_past_dates",
+    "no_school_contact",
+    "campus_programs",
+    "language",
+)
+
+_WORD = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*", re.UNICODE)
+
+# ---------- dates ----------
+_MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9, "october": 10,
+    "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12,
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10,
+    "noviembre": 11, "diciembre": 12,
+}
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_DATE = re.compile(
+    # September 16th, 2025 / Sept. 16 2025 / Sep 16
+    rf"\b(?P<m1>{_MONTH_NAMES})\.?\s+(?P<d1>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(?P<y1>\d{{4}}))?\b"
+    # 16 de septiembre de 2025 / 16 September 2025
+    rf"|\b(?P<d2>\d{{1,2}})\s+(?:de\s+)?(?P<m2>{_MONTH_NAMES})(?:,?\s+(?:de\s+)?(?P<y2>\d{{4}}))?\b"
+    # 2025-09-16
+    r"|\b(?P<y3>\d{4})-(?P<m3>\d{1,2})-(?P<d3>\d{1,2})\b"
+    # 9/16/2025
+    r"|\b(?P<m4>\d{1,2})/(?P<d4>\d{1,2})/(?P<y4>\d{2,4})\b",
+    re.IGNORECASE,
+)
+# A date right after one of these ends a range ("from X to Y")
+_RANGE_END = re.compile(r"(?:\bto|\buntil|\bthrough|\bthru|\bhasta|\bal|[-–—])\s*$", re.IGNORECASE)
+
+# ---------- contact info ----------
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE = re.compile(r"(?<!\d)(?:\+?1[\s.-]?)?(?:\(\d{3}\)|\d{3})[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)")
+_DIGITS = re.compile(r"\D+")
+
+# ---------- campuses ----------
+_NY_PROGRAM = re.compile(
+    r"\b(esthetics?|aesthetics?|nails?|nail tech\w*|waxing|make[ -]?up|cidesco"
+    r"|estética|uñas|maquillaje|depilación)\b",
+    re.IGNORECASE,
+)
+_NJ_PROGRAM = re.compile(
+    r"\b(barber(?:ing)?|barbería|skin ?care|manicure|manicura|teach(?:er|ing) training"
+    r"|instructor|cosmetology|cosmetología|hair(?:styling)?)\b",
+    re.IGNORECASE,
+)
+_CAMPUS = re.compile(
+    r"\b(?P<ny>new york|nueva york|nyc|ny|manhattan|broadway)\b|\b(?P<nj>new jersey|nueva jersey|nj|wayne)\b",
+    re.IGNORECASE,
+)
+_SENTENCE = re.compile(r"[^.!?;\n]+")
+
+# ---------- language ----------
+_ES_WORDS = frozenset(
+    "el la los las de del que y en un una es por para con su sus al como más pero "
+    "este esta muy también nuestro nuestra nuestros programa programas curso cursos "
+    "clases hola gracias usted tiene tenemos puede quieres desea fecha fechas inicio".split()
+)
+_EN_WORDS = frozenset(
+    "the and of to in a is for with your our are you we on at this that it be as "
+    "program programs course courses classes hello thanks have can would like start "
+    "date dates from".split()
+)
+
+
+def word_count(text: str) -> int:
+    return len(_WORD.findall(text or ""))
+
+
+def _match_date(m: re.Match, as_of: date) -> Optional[date]:
+    g = m.groupdict()
+    try:
+        if g["m1"] or g["m2"]:
+            month = _MONTHS[(g["m1"] or g["m2"]).lower()]
+            day = int(g["d1"] or g["d2"])
+            year = g["y1"] or g["y2"]
+            if year:
+                return date(int(year), month, day)
+            # No year: the next occurrence on or after the conversation date
+            guess = date(as_of.year, month, day)
+            return guess if guess >= as_of else date(as_of.year + 1, month, day)
+        if g["y3"]:
+            return date(int(g["y3"]), int(g["m3"]), int(g["d3"]))
+        year = int(g["y4"])
+        return date(year + 2000 if year < 100 else year, int(g["m4"]), int(g["d4"]))
+    except ValueError:
+        return None
+
+
+def find_dates(text: str, as_of: date) -> List[Tuple[date, bool]]:
+    """(date, is_range_end) for every date mentioned in `text`."""
+    found = []
+    for m in _DATE.finditer(text or ""):
+        parsed = _match_date(m, as_of)
+        if parsed is not None:
+            found.append((parsed, bool(_RANGE_END.search(text[max(0, m.start() - 12):m.start()]))))
+    return found
+
+
+def _contact_strings(texts: List[str]) -> set:
+    found = set()
+    for text in texts:
+        found.update(e.lower() for e in _EMAIL.findall(text or ""))
+        found.update(_DIGITS.sub("", p)[-10:] for p in _PHONE.findall(text or ""))
+    return found
+
+
+def school_contact_info(reply: str, user_texts: List[str]) -> List[str]:
+    """Emails and phone numbers in the reply that the user did not give themselves."""
+    given = _contact_strings(user_texts)
+    leaked = [e for e in _EMAIL.findall(reply or "") if e.lower() not in given]
+    leaked += [p for p in _PHONE.findall(reply or "") if _DIGITS.sub("", p)[-10:] not in given]
+    return leaked
+
+
+def campus_mismatches(reply: str) -> List[str]:
+    """
+    Programs placed at the wrong campus. Within a sentence (or clause) each
+    program is tied to the nearest campus named around it: "Barbering in New
+    Jersey", "In Wayne we offer Barbering".
+    """
+    wrong = []
+    for sentence in _SENTENCE.findall(reply or ""):
+        campuses = [(m.start(), m.end(), "NY" if m.group("ny") else "NJ") for m in _CAMPUS.finditer(sentence)]
+        if not campuses:
+            continue
+        for pattern, home in ((_NY_PROGRAM, "NY"), (_NJ_PROGRAM, "NJ")):
+            for m in pattern.finditer(sentence):
+                # Distance to each marker; ties go to the one that follows
+                _, _, campus = min(
+                    (start - m.end() if start >= m.end() else m.start() - end + 0.5, start, c)
+                    for start, end, c in campuses
+                )
+                if campus != home:
+                    wrong.append(f"{m.group(0)} @ {campus}")
+    return wrong
+
+
+def reply_language(reply: str) -> Optional[str]:
+    """"es" / "en" by function-word counts; None when there is too little text to tell."""
+    words = [w.lower() for w in _WORD.findall(reply or "")]
+    es = sum(w in _ES_WORDS for w in words)
+    en = sum(w in _EN_WORDS for w in words)
+    if es + en < 3:
+        return None
+    return "es" if es > en else "en"
+
+
+def score_reply(
+    reply: str,
+    user_message: str = "",
+    history: List[Dict[str, Any]] = None,
+    as_of: date = None,
+) -> Dict[str, Any]:
+    """
+    Check one reply against the validation checklist. Returns
+    {"passed": {rule: bool}, "violations": {rule: detail}, "words": n}.
+    """
+    history = history or []
+    as_of = as_of or date.today()
+    violations: Dict[str, Any] = {}
+
+    words = word_count(reply)
+    if words >= MAX_WORDS:
+        violations["word_limit"] = words
+
+    dates = find_dates(reply, as_of)
+    starts = sorted({d for d, is_end in dates if not is_end and d > as_of})
+    if len(starts) > MAX_FUTURE_DATES:
+        violations["max_two_dates"] = [d.isoformat() for d in starts]
+    past = sorted({d for d, _ in dates if d <= as_of})
+    if past:
+        violations["no_past_dates"] = [d.isoformat() for d in past]
+
+    user_texts = [user_message] + [
+        item.get("text") or "" for item in history if (item.get("role") or "").lower() == "user"
+    ]
+    leaked = school_contact_info(reply, user_texts)
+    if leaked:
+        violations["no_school_contact"] = leaked
+
+    wrong = campus_mismatches(reply)
+    if wrong:
+        violations["campus_programs"] = wrong
+
+    expected = detect_language(history, user_message)
+    actual = reply_language(reply)
+    if actual is not None and actual != expected:
+        violations["language"] = {"expected": expected, "actual": actual}
+
+    return {
+        "passed": {rule: rule not in violations for rule in RULES},
+        "violations": violations,
+        "words": words,
+    }
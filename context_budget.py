@@ -0,0 +1,181 @@
+# context_budget.py
+"""
+Bounded conversation context: recent turns verbatim, older ones summarized.
+
+`ContextBudgeter.window(history)` splits a conversation at a block boundary:
+turns after the split are sent as-is, turns before it are folded into a
+rolling summary. The split only moves in steps of `fold_step` turns, so for
+most requests the summary is the same as on the previous turn and comes
+straight from the cache; when the window does move, only the newly folded
+block is summarized on top of the cached summary before it. Summaries are
+keyed by a hash chain over the folded turns, so any store with get/set
+(e.g. response_cache.InMemoryResponseCache) can hold them.
+
+The default summarizer is extractive (the opening words of each folded turn),
+costing no model call; any `summarize(previous_summary, turns) -> str` can be
+plugged in.
+
+`output_token_cap(stage)` gives a max_output_tokens per conversation stage.
+Replies are capped at 75 words (~100 tokens), but on 2.5 models thinking
+tokens count toward the same limit and the default thinking budget is far
+above these caps, so `thinking_token_budget(cap, model)` gives the budget to
+send with a cap: what is left once the reply has room, within the model's
+allowed range. Models that only think when asked (flash-lite) get none.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Summarize = Callable[[str, List[Dict[str, Any]]], str]
+
+# max_output_tokens per lead_state stage; unknown stages get the default
+STAGE_OUTPUT_TOKENS = {
+    "initial": 512,
+    "interest": 768,
+    "pricing": 768,
+    "enrollment_collection": 512,
+    "enrollment_ready": 512,
+    "post_enrollment": 384,
+    "completion": 256,
+}
+
+# Output tokens kept for the reply itself when a cap also bounds thinking
+REPLY_TOKENS = 192
+
+# Allowed thinking budgets of the models that think by default, by model name
+# prefix (first match wins); None: the model does not think unless asked to
+THINKING_BUDGET_RANGES = (
+    ("gemini-2.5-flash-lite", None),
+    ("gemini-2.5-flash", (0, 24576)),
+    ("gemini-2.5-pro", (128, 32768)),
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), plus per-turn overhead."""
+    return len(text or "") // 4 + 4
+
+
+def output_token_cap(stage: Optional[str], default: int) -> int:
+    """max_output_tokens for `stage`, never above `default`."""
+    return min(default, STAGE_OUTPUT_TOKENS.get(stage or "", default))
+
+
+def thinking_token_budget(max_output_tokens: int, model: str) -> Optional[int]:
+    """
+    Thinking budget for `model` that leaves REPLY_TOKENS of `max_output_tokens`
+    for the reply, clamped to the model's range (0: no thinking). None for
+    models that do not think by default, or are not known here: send none.
+    """
+    name = (model or "").rsplit("/", 1)[-1]
+    for prefix, limits in THINKING_BUDGET_RANGES:
+        if name.startswith(prefix):
+            if limits is None:
+                return None
+            low, high = limits
+            return min(high, max(low, max_output_tokens - REPLY_TOKENS))
+    return None
+
+
+def _clip(text: str, max_words: int) -> str:
+    words = (text or "").split()
+    return " ".join(words[:max_words]) + (" …" if len(words) > max_words else "")
+
+
+def extractive_summary(previous: str, turns: List[Dict[str, Any]]) -> str:
+    """`previous` plus one short line per turn: the user's words, the assistant's first sentence."""
+    lines = [previous] if previous else []
+    for item in turns:
+        role = (item.get("role") or "").strip().lower()
+        text = (item.get("text") or "").strip()
+        if not text:
+            continue
+        if role == "user":
+            lines.append(f"- User: {_clip(text, 30)}")
+        elif role == "assistant":
+            lines.append(f"- Sophia: {_clip(_SENTENCE_END.split(text, 1)[0], 25)}")
+    return "\n".join(lines)
+
+
+class ContextBudgeter:
+    def __init__(
+        self,
+        cache=None,
+        keep_recent: int = 12,
+        fold_step: int = 6,
+        max_history_tokens: int = 3000,
+        max_summary_tokens: int = 400,
+        summarize: Summarize = extractive_summary,
+    ):
+        self.cache = cache
+        self.keep_recent = keep_recent
+        # Even, so splits land on user turns in an alternating conversation
+        self.fold_step = max(2, fold_step + fold_step % 2)
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.summarize = summarize
+        self.stats = {"windows": 0, "summary_hits": 0, "summaries_computed": 0}
+
+    def split_point(self, history: List[Dict[str, Any]]) -> int:
+        """Index of the first verbatim turn: a multiple of fold_step."""
+        n = len(history)
+        if n <= self.keep_recent:
+            return 0
+        step = self.fold_step
+        split = (n - self.keep_recent + step - 1) // step * step
+        # Fold further while the verbatim turns are over budget, keeping at least one block
+        while n - split > step and sum(
+            estimate_tokens(item.get("text")) for item in history[split:]
+        ) > self.max_history_tokens:
+            split += step
+        return split
+
+    def window(self, history: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """(summary of the folded turns or None, turns to send verbatim)."""
+        history = [item for item in history or [] if isinstance(item, dict)]
+        split = self.split_point(history)
+        self.stats["windows"] += 1
+        if not split:
+            return None, history
+        return self._summary(history[:split]), history[split:]
+
+    def _summary(self, older: List[Dict[str, Any]]) -> str:
+        step = self.fold_step
+        keys, key = [], ""
+        for start in range(0, len(older), step):
+            block = [(item.get("role"), item.get("text")) for item in older[start:start + step]]
+            key = hashlib.sha1((key + json.dumps(block, ensure_ascii=False)).encode("utf-8")).hexdigest()
+            keys.append("summary:" + key)
+
+        # Roll forward from the longest prefix that is already summarized
+        summary, done = "", 0
+        if self.cache is not None:
+            for i in range(len(keys) - 1, -1, -1):
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    summary, done = cached, i + 1
+                    break
+        if done == len(keys):
+            self.stats["summary_hits"] += 1
+            return summary
+        for i in range(done, len(keys)):
+            summary = self._trim(self.summarize(summary, older[i * step:(i + 1) * step]))
+            self.stats["summaries_computed"] += 1
+            if self.cache is not None:
+                self.cache.set(keys[i], summary)
+        return summary
+
+    def _trim(self, summary: str) -> str:
+        """Drop the oldest lines until the summary fits its budget."""
+        lines = summary.split("\n")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.max_summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+
+def format_summary(summary: str, folded_turns: int) -> str:
+    """Text part for the current user turn."""
+    return f"Earlier in this conversation ({folded_turns} turns, summarized):\n{summary}"
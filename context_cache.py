@@ -0,0 +1,145 @@
+# context_cache.py
+"""
+Explicit Gemini context caching for the system prompt + tool config.
+
+Entries are keyed by a hash of (model, system instruction, tools) and the
+calendar day, refreshed shortly before their TTL runs out, and skipped for a
+while after a failed create so a misconfigured cache never slows requests.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from google.genai.types import CreateCachedContentConfig, UpdateCachedContentConfig
+
+
+@dataclass
+class _Entry:
+    name: str
+    expires_at: float
+
+
+class ContextCacheManager:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        ttl_seconds: int = 3600,
+        refresh_margin_seconds: int = 300,
+        retry_after_seconds: int = 300,
+        clock=time.time,
+    ):
+        # Resolved per call so the (lazily created) client is not built at import
+        self._client_factory = client_factory
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._in_flight: set = set()
+        self.stats = {"hits": 0, "misses": 0, "creates": 0, "refreshes": 0, "failures": 0}
+
+    def cache_key(self, model: str, system_instruction: str, tools: List[Any]) -> str:
+        day = datetime.fromtimestamp(self._clock()).strftime("%Y-%m-%d")
+        h = hashlib.sha256()
+        h.update(model.encode("utf-8"))
+        h.update(b"\0")
+        h.update((system_instruction or "").encode("utf-8"))
+        for tool in tools or []:
+            h.update(b"\0")
+            h.update(tool.model_dump_json(exclude_none=True).encode("utf-8"))
+        return f"{day}:{h.hexdigest()}"
+
+    def get(self, model: str, system_instruction: str, tools: List[Any]) -> Optional[str]:
+        """
+        Name of a live cached-content entry for this prompt, creating or
+        refreshing it if needed. Returns None when caching is unavailable,
+        in which case the caller sends the prompt inline.
+        """
+        key = self.cache_key(model, system_instruction, tools)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at - now > self.refresh_margin_seconds:
+                self.stats["hits"] += 1
+                return entry.name
+            if self._failed_until.get(key, 0) > now or key in self._in_flight:
+                # Another request is already creating/refreshing this entry
+                if entry and entry.expires_at > now:
+                    self.stats["hits"] += 1
+                    return entry.name
+                self.stats["misses"] += 1
+                return None
+            self._in_flight.add(key)
+            self.stats["misses"] += 1
+
+        try:
+            if entry and entry.expires_at > now:
+                refreshed = self._refresh(entry)
+                if refreshed:
+                    return refreshed.name
+            created = self._create(key, model, system_instruction, tools)
+            return created.name if created else None
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    def invalidate(self, name: str) -> None:
+        """Forget an entry the API no longer knows about (e.g. deleted or expired early)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[key]
+
+    def _expires_at(self, cached: Any, now: float) -> float:
+        expire_time = getattr(cached, "expire_time", None)
+        if isinstance(expire_time, datetime):
+            return expire_time.timestamp()
+        return now + self.ttl_seconds
+
+    def _refresh(self, entry: _Entry) -> Optional[_Entry]:
+        try:
+            cached = self._client_factory().caches.update(
+                name=entry.name,
+                config=UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+        except Exception:
+            return None
+        with self._lock:
+            entry.expires_at = self._expires_at(cached, self._clock())
+            self.stats["refreshes"] += 1
+        return entry
+
+    def _create(
+        self, key: str, model: str, system_instruction: str, tools: List[Any]
+    ) -> Optional[_Entry]:
+        now = self._clock()
+        try:
+            cached = self._client_factory().caches.create(
+                model=model,
+                config=CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    tools=tools or None,
+                    ttl=f"{self.ttl_seconds}s",
+                    display_name=f"sophia-{key[:24]}",
+                ),
+            )
+        except Exception:
+            with self._lock:
+                self._failed_until[key] = now + self.retry_after_seconds
+                self.stats["failures"] += 1
+            return None
+
+        entry = _Entry(name=cached.name, expires_at=self._expires_at(cached, now))
+        with self._lock:
+            # Drop entries that have expired (including previous days)
+            for k in [k for k, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[k]
+            self._entries[key] = entry
+            self._failed_until.pop(key, None)
+            self.stats["creates"] += 1
+        return entry
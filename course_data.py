@@ -0,0 +1,259 @@
+# course_data.py
+"""
+Course schedule and pricing data for both campuses.
+
+Schedules are indexed per (campus, program, language, format) as sorted start
+dates, so "next N starts after a date" is a binary search and past dates never
+reach the model. Rendered prompt fragments are cached per calendar day.
+"""
+import bisect
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+CAMPUS_NY = "NY"
+CAMPUS_NJ = "NJ"
+
+CAMPUS_NAMES = {CAMPUS_NY: "New York", CAMPUS_NJ: "New Jersey"}
+
+# Upcoming starts shown per (program, language, format)
+STARTS_PER_FORMAT = 2
+
+
+@dataclass(frozen=True)
+class CourseStart:
+    campus: str
+    program: str
+    language: str
+    format: str
+    start: date
+    end: date
+
+
+@dataclass(frozen=True)
+class ProgramPrice:
+    campus: str
+    program: str
+    hours: int
+    total: int
+    # (label, amount) in display order; amounts are text because some are ranges
+    fees: Tuple[Tuple[str, str], ...]
+
+
+ScheduleKey = Tuple[str, str, str, str]  # (campus, program, language, format)
+
+
+# -----------------------------
+# Schedule data
+# -----------------------------
+# (campus, program, language, format, start, end)
+_SCHEDULE_ROWS = [
+    # New York
+    ("NY", "Esthetics", "English", "Monday and Tuesday", "2025-09-08", "2026-06-23"),
+    ("NY", "Esthetics", "English", "Part Time Evening", "2025-09-16", "2026-07-07"),
+    ("NY", "Esthetics", "English", "Wednesday Thursday Friday", "2025-09-17", "2026-07-10"),
+    ("NY", "Esthetics", "English", "Full Time", "2025-09-22", "2026-01-30"),
+    ("NY", "Esthetics", "English", "Part Time Weekend", "2025-10-11", "2026-07-19"),
+    ("NY", "Esthetics", "English", "Full Time", "2025-10-22", "2026-03-04"),
+    ("NY", "Esthetics", "English", "Monday and Tuesday", "2025-11-17", "2026-09-01"),
+    ("NY", "Esthetics", "English", "Part Time Evening", "2025-12-01", "2026-09-21"),
+    ("NY", "Esthetics", "English", "Full Time", "2025-12-01", "2026-04-10"),
+    ("NY", "Esthetics", "English", "Wednesday Thursday Friday", "2025-12-03", "2026-09-23"),
+    ("NY", "Esthetics", "Spanish", "Part Time", "2025-11-03", "2026-05-04"),
+    ("NY", "Nails", "English", "Part Time Evening", "2025-09-23", "2026-01-28"),
+    ("NY", "Nails", "English", "Monday and Tuesday", "2025-09-29", "2026-02-02"),
+    ("NY", "Nails", "English", "Part Time Weekend", "2025-10-11", "2026-02-08"),
+    ("NY", "Nails", "English", "Monday and Tuesday", "2025-12-01", "2026-04-07"),
+    ("NY", "Nails", "English", "Part Time Evening", "2025-12-01", "2026-04-08"),
+    ("NY", "Waxing", "English", "Sunday", "2025-10-05", "2025-11-10"),
+    ("NY", "CIDESCO", "English", "AE CIDESCO", "2025-11-10", "2025-12-16"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-09-01", "2025-09-12"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-09-16", "2025-09-29"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-09-30", "2025-10-13"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-10-16", "2025-10-29"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-10-30", "2025-11-12"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-11-17", "2025-12-02"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-12-03", "2025-12-16"),
+    ("NY", "Makeup", "English", "Full Time Day", "2025-12-18", "2026-01-06"),
+    ("NY", "Makeup", "English", "Monday Tuesday", "2025-09-02", "2025-10-06"),
+    ("NY", "Makeup", "English", "Monday Tuesday", "2025-10-07", "2025-11-10"),
+    ("NY", "Makeup", "English", "Monday Tuesday", "2025-11-18", "2025-12-22"),
+    ("NY", "Makeup", "English", "Monday Tuesday", "2025-12-23", "2026-01-26"),
+    ("NY", "Makeup", "English", "Wednesday Thursday Friday", "2025-10-15", "2025-11-13"),
+    ("NY", "Makeup", "English", "Wednesday Thursday Friday", "2025-11-26", "2026-01-02"),
+    ("NY", "Makeup", "English", "Part Time Evening", "2025-09-15", "2025-10-20"),
+    ("NY", "Makeup", "English", "Part Time Evening", "2025-12-01", "2026-01-06"),
+    ("NY", "Makeup", "English", "Part Time Weekend", "2025-09-27", "2025-10-26"),
+    ("NY", "Makeup", "English", "Part Time Weekend", "2025-11-01", "2025-11-30"),
+    ("NY", "Makeup", "English", "Part Time Weekend", "2025-12-13", "2026-01-11"),
+    ("NY", "Makeup", "Spanish", "Part Time", "2025-09-16", "2025-10-03"),
+    ("NY", "Makeup", "Spanish", "Part Time", "2025-10-06", "2025-10-23"),
+    ("NY", "Makeup", "Spanish", "Part Time", "2025-12-15", "2026-01-07"),
+    # New Jersey
+    ("NJ", "Skin Care", "English", "Full Time Day", "2025-10-06", "2026-02-13"),
+    ("NJ", "Skin Care", "English", "Full Time Day", "2025-11-03", "2026-03-16"),
+    ("NJ", "Skin Care", "English", "Full Time Day", "2025-12-08", "2026-04-16"),
+    ("NJ", "Skin Care", "English", "Part Time Day", "2025-10-06", "2026-04-23"),
+    ("NJ", "Skin Care", "English", "Part Time Day", "2025-11-03", "2026-05-21"),
+    ("NJ", "Skin Care", "English", "Part Time Day", "2025-12-08", "2026-06-25"),
+    ("NJ", "Skin Care", "English", "Part Time Evening", "2025-10-06", "2026-07-13"),
+    ("NJ", "Skin Care", "English", "Part Time Evening", "2025-11-03", "2026-08-10"),
+    ("NJ", "Skin Care", "English", "Part Time Evening", "2025-12-08", "2026-09-10"),
+    ("NJ", "Skin Care", "Spanish", "Part Time Evening", "2025-10-06", "2026-07-13"),
+    ("NJ", "Skin Care", "Spanish", "Part Time Evening", "2025-11-03", "2026-08-10"),
+    ("NJ", "Skin Care", "Spanish", "Part Time Evening", "2025-12-08", "2026-09-10"),
+    ("NJ", "Manicure", "English", "Full Time Mon-Thu", "2025-10-06", "2025-12-18"),
+    ("NJ", "Barbering", "English", "Full Time Day", "2025-10-06", "2026-04-16"),
+    ("NJ", "Barbering", "English", "Full Time Day", "2025-11-03", "2026-05-14"),
+    ("NJ", "Barbering", "English", "Full Time Day", "2025-12-08", "2026-06-17"),
+    ("NJ", "Cosmetology", "English", "Full Time Day", "2025-11-03", "2026-07-17"),
+    ("NJ", "Cosmetology", "English", "Part Time Evening", "2025-11-03", "2027-03-17"),
+    ("NJ", "Cosmetology", "Spanish", "Part Time Evening", "2025-11-03", "2027-03-17"),
+    ("NJ", "Teaching Training", "English", "Full Time Day", "2025-10-06", "2026-02-13"),
+    ("NJ", "Teaching Training", "English", "Full Time Day", "2025-11-03", "2026-03-16"),
+    ("NJ", "Teaching Training", "English", "Full Time Day", "2025-12-08", "2026-04-16"),
+    ("NJ", "Teaching Training", "English", "Part Time Day", "2025-10-06", "2026-05-04"),
+    ("NJ", "Teaching Training", "English", "Part Time Day", "2025-11-03", "2026-07-02"),
+    ("NJ", "Teaching Training", "English", "Part Time Day", "2025-12-08", "2026-07-07"),
+    ("NJ", "Teaching Training", "English", "Part Time Evening", "2025-09-08", "2026-09-09"),
+    ("NJ", "Teaching Training", "English", "Part Time Evening", "2025-10-06", "2026-10-07"),
+    ("NJ", "Teaching Training", "English", "Part Time Evening", "2025-11-03", "2026-11-04"),
+    ("NJ", "Teaching Training", "English", "Part Time Evening", "2025-12-08", "2026-12-09"),
+]
+
+SCHEDULE: List[CourseStart] = [
+    CourseStart(
+        campus=campus,
+        program=program,
+        language=language,
+        format=fmt,
+        start=date.fromisoformat(start),
+        end=date.fromisoformat(end),
+    )
+    for campus, program, language, fmt, start, end in _SCHEDULE_ROWS
+]
+
+
+def _build_index(
+    schedule: List[CourseStart],
+) -> Dict[ScheduleKey, Tuple[List[date], List[CourseStart]]]:
+    """Group sessions per key, sorted by start date, with a parallel key list for bisect."""
+    grouped: Dict[ScheduleKey, List[CourseStart]] = {}
+    for session in schedule:
+        key = (session.campus, session.program, session.language, session.format)
+        grouped.setdefault(key, []).append(session)
+    index = {}
+    for key, sessions in grouped.items():
+        sessions.sort(key=lambda s: s.start)
+        index[key] = ([s.start for s in sessions], sessions)
+    return index
+
+
+# Insertion order follows _SCHEDULE_ROWS, which is also the display order
+SCHEDULE_INDEX = _build_index(SCHEDULE)
+
+
+def next_starts(key: ScheduleKey, after: date, n: int = STARTS_PER_FORMAT) -> List[CourseStart]:
+    """The next `n` sessions for `key` starting strictly after `after`."""
+    entry = SCHEDULE_INDEX.get(key)
+    if not entry:
+        return []
+    starts, sessions = entry
+    i = bisect.bisect_right(starts, after)
+    return sessions[i : i + n]
+
+
+def _fmt_date(d: date) -> str:
+    return f"{d.month}/{d.day}/{d.year}"
+
+
+@lru_cache(maxsize=8)
+def render_schedule(campus: str, on: date) -> str:
+    """Prompt fragment with upcoming starts for one campus, as of `on` (cached per day)."""
+    lines = [f"### {CAMPUS_NAMES[campus]} Schedule Data (upcoming starts after {on.isoformat()})\n\n"]
+    by_program: Dict[Tuple[str, str], List[CourseStart]] = {}
+    for key in SCHEDULE_INDEX:
+        if key[0] == campus:
+            upcoming = next_starts(key, on)
+            if upcoming:
+                by_program.setdefault((key[1], key[2]), []).extend(upcoming)
+    for (program, language), sessions in by_program.items():
+        lines.append(f"\n**{program} {language}:**\n")
+        for session in sorted(sessions, key=lambda s: s.start):
+            lines.append(
+                f"- {session.format}: {_fmt_date(session.start)} to {_fmt_date(session.end)}\n"
+            )
+    if not by_program:
+        lines.append(
+            "No upcoming start dates are published yet. "
+            "The enrollment advisor will share the next available dates.\n"
+        )
+    lines.append("\n\n")
+    return "".join(lines)
+
+
+# -----------------------------
+# Pricing data
+# -----------------------------
+PRICING: List[ProgramPrice] = [
+    # New York (2025)
+    ProgramPrice(CAMPUS_NY, "Esthetics (Hybrid)", 600, 10990, (
+        ("Registration", "$100"), ("Technology", "$150"),
+        ("Educational Material", "$350"), ("Kits/Supplies", "$500"),
+        ("Tuition", "$9,890"),
+    )),
+    ProgramPrice(CAMPUS_NY, "Nails Specialty (Hybrid)", 250, 3125, (
+        ("Registration", "$100"), ("Technology", "$75"),
+        ("Educational Material", "$200"), ("Kits/Supplies", "$350"),
+        ("Tuition", "$2,400"),
+    )),
+    ProgramPrice(CAMPUS_NY, "CIDESCO Beauty Therapy RPL", 75, 2775, (
+        ("Registration", "$100"), ("Technology", "$75"), ("Kits", "$100"),
+        ("Tuition", "$2,500-$2,700"),
+    )),
+    ProgramPrice(CAMPUS_NY, "Waxing (In-Person)", 75, 1600, (
+        ("Registration", "$100"), ("Educational Material", "$200"),
+        ("Tuition", "$1,300"),
+    )),
+    ProgramPrice(CAMPUS_NY, "Nails + Waxing Bundle", 325, 4625, (
+        ("Registration", "$100"), ("Technology", "$75"),
+        ("Educational Material", "$400"), ("Kits/Supplies", "$350"),
+        ("Tuition", "$3,700"),
+    )),
+    ProgramPrice(CAMPUS_NY, "Basic & Advanced Makeup (In-Person)", 70, 1600, (
+        ("Registration", "$100"), ("Educational Material", "$200"),
+        ("Kits/Supplies", "$150"), ("Tuition", "$1,200"),
+    )),
+    # New Jersey (2025)
+    ProgramPrice(CAMPUS_NJ, "Cosmetology & Hairstyling", 1200, 17500, (
+        ("Registration", "$100"), ("Books/Kit", "$975"), ("Tuition", "$16,425"),
+    )),
+    ProgramPrice(CAMPUS_NJ, "Skin Care", 600, 13000, (
+        ("Registration", "$100"), ("Books/Kit", "$685"), ("Tuition", "$12,215"),
+    )),
+    ProgramPrice(CAMPUS_NJ, "Barbering", 900, 14900, (
+        ("Registration", "$100"), ("Books/Kit", "$850"), ("Tuition", "$13,950"),
+    )),
+    ProgramPrice(CAMPUS_NJ, "Manicure", 300, 4700, (
+        ("Registration", "$100"), ("Books/Kit", "$500"), ("Tuition", "$4,100"),
+    )),
+    ProgramPrice(CAMPUS_NJ, "Teacher Training", 600, 6995, (
+        ("Registration", "$100"), ("Books/Kit", "$875"), ("Tuition", "$6,020"),
+    )),
+]
+
+
+@lru_cache(maxsize=None)
+def render_pricing(campus: str) -> str:
+    """Prompt fragment with the pricing table for one campus."""
+    lines = [f"### {CAMPUS_NAMES[campus]} Pricing (2025)\n\n"]
+    for item in PRICING:
+        if item.campus != campus:
+            continue
+        lines.append(f"\n**{item.program}** - {item.hours} hours - ${item.total:,}\n")
+        for label, amount in item.fees:
+            lines.append(f"- {label}: {amount}\n")
+        lines.append("\n")
+    lines.append("\n")
+    return "".join(lines)
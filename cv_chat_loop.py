@@ -1,48 +1,373 @@
+"""
+Interactive smoke-test client for the deployed function.
+
+Requests go over one pooled keep-alive HTTP session, the identity token is
+minted once and refreshed shortly before it expires, and streamed replies are
+printed as chunks arrive. Each turn reports client-side TTFT and total time.
+
+Usage:
+    python cv_chat_loop.py                         interactive chat
+    python cv_chat_loop.py --no-stream             one JSON reply per turn
+    python cv_chat_loop.py --sessions 8 --script turns.txt
+        drive 8 threads at once, each sending the script's lines in order
+    python cv_chat_loop.py --compact 100       keep only the thread's last 100 turns
+
+History is kept per thread in history/<thread_id>.jsonl (see chat_history.py);
+an existing history.json is copied into it on first run and left in place.
+"""
+import argparse
+import asyncio
+import base64
+import gzip
 import json
+import os
 import subprocess
+import threading
+import time
+
+import httpx
+
+from chat_history import ThreadLog, migrate_json
 
 CLOUD_FUNCTION_URL = "https://us-central1-christinevalmy.cloudfunctions.net/cv-gemini-2-5-bucket"
+# Legacy single-file history, imported into HISTORY_DIR on first run
 HISTORY_FILE = "history.json"
+HISTORY_DIR = "history"
+# Turns loaded (and sent as context) when a session resumes
+HISTORY_TAIL_TURNS = 200
 USER_ID = "12"
 THREAD_ID = "12"
 
-def load_history():
+# Refresh the identity token this long before its `exp`
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+# Lifetime assumed when the token's `exp` cannot be read
+TOKEN_DEFAULT_LIFETIME_SECONDS = 3300
+# Request bodies at least this large are sent gzip-compressed (None: never)
+COMPRESS_MIN_BYTES = 1024
+# Retries of a request turned away with 429, waiting Retry-After (else backoff) between them
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_MAX_WAIT_SECONDS = 30.0
+REQUEST_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=120)
+
+
+def _gcloud_identity_token():
+    return subprocess.getoutput("gcloud auth print-identity-token").strip()
+
+
+def token_expiry(token):
+    """`exp` claim of a JWT (unverified), or None."""
     try:
-        with open(HISTORY_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class IdentityToken:
+    """
+    Caches an identity token until shortly before it expires. `CV_ID_TOKEN`
+    in the environment overrides the fetcher (e.g. in CI).
+    """
+
+    def __init__(self, fetch=_gcloud_identity_token, clock=time.time,
+                 refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS):
+        self._fetch = fetch
+        self._clock = clock
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._token is None or self._clock() >= self._expires_at - self.refresh_margin:
+                token = os.environ.get("CV_ID_TOKEN") or self._fetch()
+                now = self._clock()
+                self._token = token
+                self._expires_at = token_expiry(token) or now + TOKEN_DEFAULT_LIFETIME_SECONDS
+            return self._token
+
+    def invalidate(self):
+        """Forget the token, e.g. after a 401."""
+        with self._lock:
+            self._token = None
+
+
+tokens = IdentityToken()
+_session = None
+_logs = {}
+
 
-def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+def session():
+    """Process-wide keep-alive HTTP session."""
+    global _session
+    if _session is None:
+        _session = httpx.Client(timeout=REQUEST_TIMEOUT, limits=POOL_LIMITS)
+    return _session
 
-def send_message(message, history):
-    payload = {
+
+def thread_log(thread_id=THREAD_ID):
+    """The thread's append-only log, opened once; a legacy history.json is imported on first use."""
+    log = _logs.get(thread_id)
+    if log is None:
+        log = _logs[thread_id] = ThreadLog(HISTORY_DIR, thread_id)
+        if thread_id == THREAD_ID and migrate_json(HISTORY_FILE, log):
+            print(f"Imported {HISTORY_FILE} → {log.path}")
+    return log
+
+
+def load_history(thread_id=THREAD_ID, last=HISTORY_TAIL_TURNS):
+    """The last `last` turns of the thread (all when None)."""
+    return thread_log(thread_id).tail(last)
+
+
+def save_turn(role, text, thread_id=THREAD_ID):
+    """Append one turn; constant time however long the thread is."""
+    thread_log(thread_id).append(role, text)
+
+
+def build_payload(message, history, thread_id=THREAD_ID, stream=True, user_id=USER_ID):
+    return {
         "message": message,
-        "user_id": USER_ID,
-        "thread_id": THREAD_ID,
-        "history": history
+        "user_id": user_id,
+        "thread_id": thread_id,
+        "history": history,
+        "stream": stream,
     }
 
-    curl_command = [
-        "curl", "-s", "-X", "POST", CLOUD_FUNCTION_URL,
-        "-H", f"Authorization: Bearer {subprocess.getoutput('gcloud auth print-identity-token')}",
-        "-H", "Content-Type: application/json",
-        "-d", json.dumps(payload)
-    ]
 
-    result = subprocess.run(curl_command, capture_output=True, text=True)
+def _headers(token, stream):
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    return headers
+
+
+def retry_after(resp, retry):
+    """Seconds to wait before retrying a 429: its Retry-After, else exponential backoff."""
+    value = resp.headers.get("retry-after", "")
     try:
-        response_json = json.loads(result.stdout)
-        return response_json.get("response", "[No response]")
-    except json.JSONDecodeError:
-        print("⚠️ Error: Couldn't decode JSON")
-        print("Raw response:", result.stdout)
-        return "[Error from API]"
+        wait = float(value)
+    except ValueError:
+        wait = 2.0 ** retry
+    return min(max(wait, 0.0), RATE_LIMIT_MAX_WAIT_SECONDS)
+
+
+def encode_body(body, headers):
+    """JSON request bytes, gzip-compressed (with its header set) once past COMPRESS_MIN_BYTES."""
+    raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if COMPRESS_MIN_BYTES is not None and len(raw) >= COMPRESS_MIN_BYTES:
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(raw, compresslevel=6)
+    return raw
+
+
+class SSEParser:
+    """Incremental Server-Sent Events parser: feed lines, get frames back."""
+
+    def __init__(self):
+        self._event, self._data = "message", []
+
+    def feed(self, line):
+        """(event, payload) when `line` completes a frame, else None."""
+        if line:
+            if line.startswith("event:"):
+                self._event = line[6:].strip()
+            elif line.startswith("data:"):
+                self._data.append(line[5:].lstrip())
+            return None
+        return self.flush()
+
+    def flush(self):
+        if not self._data:
+            return None
+        frame = (self._event, json.loads("\n".join(self._data)))
+        self._event, self._data = "message", []
+        return frame
 
-def chat_loop():
-    history = load_history()
+
+def iter_sse(lines):
+    """(event, payload) for each Server-Sent Events frame in `lines`."""
+    parser = SSEParser()
+    for line in lines:
+        frame = parser.feed(line)
+        if frame:
+            yield frame
+    frame = parser.flush()
+    if frame:
+        yield frame
+
+
+class Reply:
+    """Outcome of one turn as seen by the client."""
+
+    def __init__(self):
+        self.text = ""
+        self.error = None
+        self.status = None
+        self.ttft = None
+        self.total = None
+        self.server = {}
+
+    def timing_line(self):
+        parts = []
+        if self.ttft is not None:
+            parts.append(f"ttft {self.ttft:.2f}s")
+        parts.append(f"total {self.total:.2f}s")
+        if self.server.get("total_latency") is not None:
+            parts.append(f"server {self.server['total_latency']:.2f}s")
+        if self.server.get("model"):
+            parts.append(self.server["model"])
+        return ", ".join(parts)
+
+
+def _apply(reply, event, payload, on_chunk, started):
+    """Fold one SSE frame into `reply`."""
+    if event == "chunk":
+        if reply.ttft is None:
+            reply.ttft = time.perf_counter() - started
+        if on_chunk:
+            on_chunk(payload.get("text", ""))
+    elif event == "done":
+        reply.server = payload
+        reply.text = payload.get("response", "")
+    elif event == "error":
+        reply.server = payload
+        reply.error = payload.get("error", "[Error from API]")
+
+
+def _apply_json(reply, resp, started):
+    reply.ttft = time.perf_counter() - started
+    try:
+        payload = resp.json()
+    except ValueError:
+        reply.error = f"Couldn't decode JSON: {resp.text[:500]}"
+        return
+    reply.server = payload
+    reply.text = payload.get("response", "")
+    reply.error = payload.get("error")
+
+
+def send_message(message, history, thread_id=THREAD_ID, stream=True, on_chunk=None, client=None,
+                 user_id=USER_ID):
+    """
+    Send one turn over the keep-alive session. With `stream`, `on_chunk` gets
+    each text chunk as it arrives; the returned Reply carries the final,
+    normalized text. A 401 refreshes the token and retries once; a 429 is
+    retried after its Retry-After, up to RATE_LIMIT_RETRIES times.
+    """
+    client = client or session()
+    body = build_payload(message, history, thread_id, stream, user_id)
+    started = time.perf_counter()
+    reply = Reply()
+    refreshed, retries = False, 0
+    while True:
+        headers = _headers(tokens.get(), stream)
+        content = encode_body(body, headers)
+        with client.stream("POST", CLOUD_FUNCTION_URL, content=content, headers=headers) as resp:
+            if resp.status_code == 401 and not refreshed:
+                tokens.invalidate()
+                refreshed = True
+                continue
+            if resp.status_code == 429 and retries < RATE_LIMIT_RETRIES:
+                wait = retry_after(resp, retries)
+                retries += 1
+                resp.close()
+                time.sleep(wait)
+                continue
+            reply.status = resp.status_code
+            if resp.headers.get("content-type", "").startswith("text/event-stream"):
+                for event, payload in iter_sse(resp.iter_lines()):
+                    _apply(reply, event, payload, on_chunk, started)
+            else:
+                resp.read()
+                _apply_json(reply, resp, started)
+        break
+    reply.total = time.perf_counter() - started
+    return reply
+
+
+async def asend_message(client, message, history, thread_id, stream=True, on_chunk=None, user_id=USER_ID):
+    """`send_message` on an httpx.AsyncClient."""
+    body = build_payload(message, history, thread_id, stream, user_id)
+    started = time.perf_counter()
+    reply = Reply()
+    refreshed, retries = False, 0
+    while True:
+        headers = _headers(await asyncio.to_thread(tokens.get), stream)
+        content = encode_body(body, headers)
+        async with client.stream("POST", CLOUD_FUNCTION_URL, content=content, headers=headers) as resp:
+            if resp.status_code == 401 and not refreshed:
+                tokens.invalidate()
+                refreshed = True
+                continue
+            if resp.status_code == 429 and retries < RATE_LIMIT_RETRIES:
+                wait = retry_after(resp, retries)
+                retries += 1
+                await resp.aclose()
+                await asyncio.sleep(wait)
+                continue
+            reply.status = resp.status_code
+            if resp.headers.get("content-type", "").startswith("text/event-stream"):
+                parser = SSEParser()
+                async for line in resp.aiter_lines():
+                    frame = parser.feed(line)
+                    if frame:
+                        _apply(reply, *frame, on_chunk, started)
+                frame = parser.flush()
+                if frame:
+                    _apply(reply, *frame, on_chunk, started)
+            else:
+                await resp.aread()
+                _apply_json(reply, resp, started)
+        break
+    reply.total = time.perf_counter() - started
+    return reply
+
+
+async def run_session(client, index, script, stream=True):
+    """
+    One scripted thread: send each line in order, carrying the history along.
+    Each session is its own user, so sessions do not share a rate-limit bucket.
+    """
+    thread_id = f"{THREAD_ID}-s{index}"
+    history, results = [], []
+    for message in script:
+        # The server gets the turns before this one; `message` is the new turn
+        reply = await asend_message(client, message, history, thread_id, stream, user_id=thread_id)
+        history.append({"role": "user", "text": message})
+        history.append({"role": "assistant", "text": reply.text or "[Error from API]"})
+        results.append(reply)
+        status = reply.error or f"{len(reply.text.split())} words"
+        print(f"[{thread_id}] {message[:40]!r} → {status} ({reply.timing_line()})", flush=True)
+    return results
+
+
+async def run_sessions(script, sessions, stream=True):
+    """Drive `sessions` threads concurrently over one pooled async client."""
+    limits = httpx.Limits(max_connections=sessions, max_keepalive_connections=sessions)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        per_session = await asyncio.gather(
+            *(run_session(client, i, script, stream) for i in range(sessions))
+        )
+    replies = [r for results in per_session for r in results]
+    ttfts = sorted(r.ttft for r in replies if r.ttft is not None)
+    totals = sorted(r.total for r in replies)
+    if totals:
+        print(
+            f"{len(replies)} turns, {sum(1 for r in replies if r.error)} errors; "
+            f"ttft p50 {ttfts[len(ttfts) // 2] if ttfts else float('nan'):.2f}s, "
+            f"total p50 {totals[len(totals) // 2]:.2f}s, "
+            f"p95 {totals[min(len(totals) - 1, int(len(totals) * 0.95))]:.2f}s"
+        )
+    return replies
+
+
+def chat_loop(stream=True, last=HISTORY_TAIL_TURNS):
+    history = load_history(last=last)
+    tokens.get()  # mint the token before the first prompt, not inside its timing
 
     print("Chat started (type 'exit' to quit)\n")
     while True:
@@ -50,19 +375,58 @@ def chat_loop():
         if user_message.lower() in ("exit", "quit"):
             break
 
-        # Append user message to history
-        history.append({"role": "user", "text": user_message})
+        save_turn("user", user_message)
 
-        assistant_reply = send_message(user_message, history)
-        print("Bot:", assistant_reply)
+        print("Bot: ", end="", flush=True)
+        shown = []
 
-        # Append assistant reply to history
-        history.append({"role": "assistant", "text": assistant_reply})
+        def show(text):
+            shown.append(text)
+            print(text, end="", flush=True)
 
-        save_history(history)
+        reply = send_message(user_message, history, stream=stream, on_chunk=show)
+        if reply.error:
+            print(f"⚠️ Error: {reply.error}", end="")
+        elif not shown:
+            print(reply.text, end="")
+        print(f"\n   ({reply.timing_line()})")
+        assistant_reply = reply.text or "[Error from API]"
+
+        # Append the exchange to history once the reply is in (the request
+        # carries the earlier turns, and the new message separately)
+        history.append({"role": "user", "text": user_message})
+        history.append({"role": "assistant", "text": assistant_reply})
+        save_turn("assistant", assistant_reply)
 
     print("✅ Chat ended.")
 
-if __name__ == "__main__":
-    chat_loop()
 
+def main():
+    parser = argparse.ArgumentParser(description="Chat with the deployed function.")
+    parser.add_argument("--no-stream", action="store_true", help="ask for one JSON reply per turn")
+    parser.add_argument("--no-compress", action="store_true", help="send request bodies uncompressed")
+    parser.add_argument("--sessions", type=int, help="run N scripted threads concurrently")
+    parser.add_argument("--script", help="file with one user message per line (for --sessions)")
+    parser.add_argument("--last", type=int, default=HISTORY_TAIL_TURNS, help="turns of history to resume with")
+    parser.add_argument("--compact", type=int, metavar="N", help="keep only the last N turns of the thread, then exit")
+    args = parser.parse_args()
+
+    global COMPRESS_MIN_BYTES
+    if args.no_compress:
+        COMPRESS_MIN_BYTES = None
+    if args.compact is not None:
+        kept = thread_log().compact(keep_last=args.compact)
+        print(f"Compacted thread {THREAD_ID} to {kept} turns")
+    elif args.sessions:
+        if not args.script:
+            parser.error("--sessions needs --script")
+        with open(args.script) as f:
+            script = [line.strip() for line in f if line.strip()]
+        tokens.get()
+        asyncio.run(run_sessions(script, args.sessions, stream=not args.no_stream))
+    else:
+        chat_loop(stream=not args.no_stream, last=args.last)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+# generation.py
+"""
+Deadline-aware generation: classified retries, optional hedging, cancellation.
+
+Each attempt reads the upstream `generate_content_stream` on a worker thread
+(`stream`) or an asyncio task on `client.aio` (`astream`) and pushes chunks
+onto a queue; the caller's generator consumes the queue, so it can enforce the
+request deadline, start a hedged duplicate when the first chunk is late, and
+abandon attempts when the client disconnects.
+
+Rules:
+- Transient failures (5xx, 408, 429, connection errors) are retried with
+  jittered backoff while the deadline leaves room; other 4xx are not.
+- When a `fallback_config` is given (the inline prompt, used when the primary
+  config references a context cache entry), an attempt that fails because the
+  cached content is missing or unusable (404/400) is retried once with it;
+  other failures follow the rules above.
+- A request lost to the HTTP timeout set on each attempt fails with
+  DeadlineExceeded, like one that runs out of deadline between chunks.
+- Once text has been forwarded to the caller a failure is final: the reply
+  cannot be restarted mid-stream.
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import httpx
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class GenerationError(Exception):
+    pass
+
+
+class DeadlineExceeded(GenerationError):
+    pass
+
+
+class GenerationCancelled(GenerationError):
+    pass
+
+
+def is_retryable(exc: BaseException) -> bool:
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def is_cache_miss(exc: BaseException) -> bool:
+    """404/400 about the cached content the request referenced (expired, deleted, unusable)."""
+    return getattr(exc, "code", None) in (400, 404) and "cache" in str(exc).lower()
+
+
+def _raise_final(exc: BaseException) -> None:
+    """Raise the error that ends a request; the per-attempt HTTP timeout counts as DeadlineExceeded."""
+    if isinstance(exc, (httpx.TimeoutException, TimeoutError)):
+        raise DeadlineExceeded(f"Model call timed out ({type(exc).__name__}).") from exc
+    raise exc
+
+
+class Deadline:
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+
+class LatencyWindow:
+    """
+    Recent time-to-first-chunk samples, for the hedging delay. With `max_age`
+    (seconds) older samples are dropped, so a window nobody adds to empties.
+    """
+
+    def __init__(self, size: int = 200, max_age: float = None, clock=time.monotonic):
+        # (time added, seconds)
+        self._samples = deque(maxlen=size)
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append((self._clock(), seconds))
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if self.max_age is not None:
+                cutoff = self._clock() - self.max_age
+                while self._samples and self._samples[0][0] < cutoff:
+                    self._samples.popleft()
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(seconds for _, seconds in self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Attempt:
+    """One upstream streaming call, read on a daemon thread."""
+
+    def __init__(self, index: int, start: Callable[[], Any], out: "queue.Queue"):
+        self.index = index
+        self.started_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self._start = start
+        self._out = out
+        self._thread = threading.Thread(
+            target=self._run, name=f"generation-attempt-{index}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        stream = None
+        usage = None
+        try:
+            stream = self._start()
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    return
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                text = getattr(chunk, "text", None)
+                if text:
+                    self._out.put((self.index, "chunk", text))
+            self._out.put((self.index, "done", usage))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self._out.put((self.index, "error", e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+
+class _AsyncAttempt:
+    """One upstream streaming call on the async client, read by a task."""
+
+    def __init__(self, index: int, start: Callable[[], Any], out: "asyncio.Queue"):
+        self.index = index
+        self.started_at = time.monotonic()
+        self._start = start
+        self._out = out
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        usage = None
+        try:
+            stream = await self._start()
+            async for chunk in stream:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                text = getattr(chunk, "text", None)
+                if text:
+                    self._out.put_nowait((self.index, "chunk", text))
+            self._out.put_nowait((self.index, "done", usage))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._out.put_nowait((self.index, "error", e))
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+
+class GenerationExecutor:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        deadline_seconds: float = 25.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.25,
+        backoff_max: float = 2.0,
+        min_attempt_seconds: float = 1.0,
+        hedge_enabled: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 1.0,
+        poll_interval: float = 0.1,
+    ):
+        self._client_factory = client_factory
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_attempt_seconds = min_attempt_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.poll_interval = poll_interval
+        self.ttft = LatencyWindow()
+        self._lock = threading.Lock()
+        self.counters = {
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "fallbacks": 0,
+            "deadline_exceeded": 0,
+            "cancelled": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        p = self.ttft.quantile(self.hedge_quantile)
+        return None if p is None else max(self.hedge_min_delay, p)
+
+    def _should_hedge(self, started: List[Any], active: dict, deadline: Deadline) -> bool:
+        delay = self.hedge_delay()
+        if delay is None or len(started) >= self.max_attempts:
+            return False
+        first = started[0]
+        return (
+            first.index in active
+            and time.monotonic() - first.started_at >= delay
+            and deadline.remaining() > self.min_attempt_seconds
+        )
+
+    def _after_failure(
+        self, exc: BaseException, attempts: int, state: dict, deadline: Deadline, on_fallback
+    ) -> float:
+        """
+        Decide what follows a failed attempt: re-raises `exc` when the request
+        is lost, otherwise switches to the fallback config after a cache miss
+        (returns 0) or returns the backoff to wait before retrying.
+        """
+        # A missing cache entry always gets its one inline retry
+        if not state["fallback_used"] and is_cache_miss(exc):
+            state["fallback_used"] = True
+            state["config"] = state["fallback_config"]
+            self._count("fallbacks")
+            if on_fallback:
+                on_fallback(exc)
+            return 0.0
+        if attempts >= self.max_attempts or not is_retryable(exc):
+            _raise_final(exc)
+        backoff = min(
+            self.backoff_max, self.backoff_base * (2 ** (attempts - 1))
+        ) * random.uniform(0.5, 1.0)
+        if deadline.remaining() - backoff < self.min_attempt_seconds:
+            _raise_final(exc)
+        self._count("retries")
+        return backoff
+
+    def _with_timeout(self, config: Any, deadline: Deadline) -> Any:
+        """Bound the HTTP call itself by the remaining budget (milliseconds)."""
+        timeout_ms = max(1, int(deadline.remaining() * 1000))
+        http_options = getattr(config, "http_options", None)
+        if http_options is not None:
+            http_options = http_options.model_copy(update={"timeout": timeout_ms})
+        else:
+            from google.genai.types import HttpOptions
+
+            http_options = HttpOptions(timeout=timeout_ms)
+        return config.model_copy(update={"http_options": http_options})
+
+    def stream(
+        self,
+        model: str,
+        contents: List[Any],
+        config: Any,
+        fallback_config: Any = None,
+        on_fallback: Callable[[BaseException], None] = None,
+        cancel_event: threading.Event = None,
+        deadline_seconds: float = None,
+        on_usage: Callable[[Any], None] = None,
+    ) -> Iterator[str]:
+        """
+        Yield reply text chunks; raises DeadlineExceeded / GenerationCancelled /
+        the upstream error. `on_usage` receives the winning attempt's
+        `usage_metadata` when the reply completes.
+        """
+        budget = deadline_seconds or self.deadline_seconds
+        deadline = Deadline(budget)
+        out: "queue.Queue" = queue.Queue()
+        started: List[_Attempt] = []
+        active = {}
+        state = {
+            "config": config,
+            "fallback_config": fallback_config,
+            "fallback_used": fallback_config is None,
+        }
+
+        def start_attempt() -> None:
+            index = len(started)
+            cfg = self._with_timeout(state["config"], deadline)
+            started.append(
+                _Attempt(
+                    index,
+                    lambda: self._client_factory().models.generate_content_stream(
+                        model=model, contents=contents, config=cfg
+                    ),
+                    out,
+                )
+            )
+            active[index] = started[-1]
+            self._count("attempts")
+
+        winner = None
+        hedged = False
+        start_attempt()
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._count("cancelled")
+                    raise GenerationCancelled("client went away")
+                if deadline.expired():
+                    self._count("deadline_exceeded")
+                    raise DeadlineExceeded(f"no reply within {budget}s")
+
+                timeout = min(self.poll_interval, deadline.remaining())
+                if winner is None and not hedged and self._should_hedge(started, active, deadline):
+                    hedged = True
+                    self._count("hedges")
+                    start_attempt()
+                try:
+                    index, kind, payload = out.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if winner is not None and index != winner:
+                    continue  # late output from an abandoned attempt
+
+                if kind == "chunk":
+                    if winner is None:
+                        winner = index
+                        attempt = active[index]
+                        self.ttft.add(time.monotonic() - attempt.started_at)
+                        if hedged and index != 0:
+                            self._count("hedge_wins")
+                        for other in list(active.values()):
+                            if other.index != index:
+                                other.cancel()
+                    yield payload
+                elif kind == "done":
+                    if winner is None or index == winner:
+                        if on_usage and payload is not None:
+                            on_usage(payload)
+                        return
+                else:  # error
+                    active.pop(index, None)
+                    if winner == index:
+                        _raise_final(payload)
+                    if active:
+                        continue  # a hedged twin is still running
+                    backoff = self._after_failure(
+                        payload, len(started), state, deadline, on_fallback
+                    )
+                    if backoff:
+                        if cancel_event is not None and cancel_event.wait(backoff):
+                            continue  # reported at the top of the loop
+                        if cancel_event is None:
+                            time.sleep(backoff)
+                    start_attempt()
+        finally:
+            # Covers normal return, errors, and the consumer closing the
+            # generator (e.g. the HTTP client disconnected mid-stream).
+            for attempt in started:
+                attempt.cancel()
+
+    async def astream(
+        self,
+        model: str,
+        contents: List[Any],
+        config: Any,
+        fallback_config: Any = None,
+        on_fallback: Callable[[BaseException], None] = None,
+        deadline_seconds: float = None,
+        on_usage: Callable[[Any], None] = None,
+    ) -> AsyncIterator[str]:
+        """
+        `stream` on the async client (`client.aio`): same deadline, retry,
+        fallback and hedging rules, without holding a thread per request.
+        Cancelling the consuming task or closing the generator cancels every
+        outstanding attempt.
+        """
+        budget = deadline_seconds or self.deadline_seconds
+        deadline = Deadline(budget)
+        out: "asyncio.Queue" = asyncio.Queue()
+        started: List[_AsyncAttempt] = []
+        active = {}
+        state = {
+            "config": config,
+            "fallback_config": fallback_config,
+            "fallback_used": fallback_config is None,
+        }
+
+        def start_attempt() -> None:
+            index = len(started)
+            cfg = self._with_timeout(state["config"], deadline)
+            started.append(
+                _AsyncAttempt(
+                    index,
+                    lambda: self._client_factory().aio.models.generate_content_stream(
+                        model=model, contents=contents, config=cfg
+                    ),
+                    out,
+                )
+            )
+            active[index] = started[-1]
+            self._count("attempts")
+
+        winner = None
+        hedged = False
+        start_attempt()
+        try:
+            while True:
+                if deadline.expired():
+                    self._count("deadline_exceeded")
+                    raise DeadlineExceeded(f"no reply within {budget}s")
+
+                timeout = min(self.poll_interval, deadline.remaining())
+                if winner is None and not hedged and self._should_hedge(started, active, deadline):
+                    hedged = True
+                    self._count("hedges")
+                    start_attempt()
+                try:
+                    index, kind, payload = await asyncio.wait_for(out.get(), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                if winner is not None and index != winner:
+                    continue
+
+                if kind == "chunk":
+                    if winner is None:
+                        winner = index
+                        self.ttft.add(time.monotonic() - active[index].started_at)
+                        if hedged and index != 0:
+                            self._count("hedge_wins")
+                        for other in list(active.values()):
+                            if other.index != index:
+                                other.cancel()
+                    yield payload
+                elif kind == "done":
+                    if winner is None or index == winner:
+                        if on_usage and payload is not None:
+                            on_usage(payload)
+                        return
+                else:  # error
+                    active.pop(index, None)
+                    if winner == index:
+                        _raise_final(payload)
+                    if active:
+                        continue
+                    backoff = self._after_failure(
+                        payload, len(started), state, deadline, on_fallback
+                    )
+                    if backoff:
+                        await asyncio.sleep(backoff)
+                    start_attempt()
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            raise
+        finally:
+            for attempt in started:
+                attempt.cancel()
+
+    def generate_text(self, model: str, contents: List[Any], config: Any, **kwargs) -> str:
+        return "".join(self.stream(model, contents, config, **kwargs))
@@ -0,0 +1,302 @@
+# lead_state.py
+"""
+Incremental conversation stage and lead-field tracking.
+
+The prompt's "Stage Detection Logic" and "ENROLLMENT COLLECTION PROCESS" make
+the model re-read the whole transcript each turn to work out the stage and
+which of name / email / phone / campus are still missing. `LeadTracker`
+does that deterministically instead: every turn is consumed once, contact
+fields are pulled out with precompiled patterns, and the state is cached per
+thread so the next request only consumes the turns added since. The model
+gets a few lines from `LeadState.summary()` instead of having to infer them.
+
+Stages follow the prompt's order and only move forward:
+initial → interest → pricing → enrollment_collection → enrollment_ready
+→ post_enrollment → completion.
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from course_data import CAMPUS_NJ, CAMPUS_NY
+from sophia_prompt import detect_campuses, route_grounding
+
+STAGES = (
+    "initial",
+    "interest",
+    "pricing",
+    "enrollment_collection",
+    "enrollment_ready",
+    "post_enrollment",
+    "completion",
+)
+_RANK = {stage: i for i, stage in enumerate(STAGES)}
+FIELDS = ("name", "email", "phone", "campus")
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE = re.compile(r"(?<!\d)(?:\+?1[\s.-]?)?(?:\(\d{3}\)|\d{3})[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)")
+_NAME_WORD = r"[^\W\d_][^\W\d_'’.-]*(?:['’.-][^\W\d_]+)*"
+_NAME = re.compile(
+    rf"\b(?:(?P<explicit>my name is|my name's|name is|me llamo|mi nombre es)|this is|i am|i'm|soy)\s+"
+    rf"(?P<name>{_NAME_WORD}(?:\s+{_NAME_WORD}){{0,3}})",
+    re.IGNORECASE,
+)
+# Names are at most this many words; longer phrases are sentences
+_NAME_MAX_WORDS = 3
+# Words after "I'm" / "soy" that are not a name ("I'm interested in...")
+_NOT_NAME = frozenset(
+    "interested looking ready here from in a an the not just so very also still trying "
+    "thinking wondering calling asking new currently working going planning hoping "
+    "glad happy good fine ok okay sure available curious excited great awesome perfect "
+    "de la el una un muy interesada interesado buscando lista listo nueva nuevo".split()
+)
+# Function words that never appear in a name of three words or fewer
+_FUNCTION_WORDS = frozenset(
+    "a an the to of about for in on at with into more some any this that these those it "
+    "learn know see get be have do what how which who when where why but so if than".split()
+)
+# Words that end a name ("Ana Lopez and my email is ...")
+_NAME_STOP = frozenset(
+    "and my email phone number is y mi correo teléfono telefono es from at or".split()
+)
+# Words that rule out a bare fragment being a name ("I want info")
+_NOT_BARE_NAME = frozenset(
+    "i i'm im i’m am is are it it's yes no my me you we to for want need like what how "
+    "when where why can do does please thanks hi hello".split()
+)
+_FRAGMENT = re.compile(r"[!.?,;:\n]+")
+_BARE_NAME = re.compile(rf"{_NAME_WORD}(?:\s+{_NAME_WORD}){{0,3}}")
+_CAMPUS_EXPLICIT = re.compile(
+    r"\b(?P<ny>new york|nueva york|nyc|ny|manhattan)\b|\b(?P<nj>new jersey|nueva jersey|nj|wayne)\b",
+    re.IGNORECASE,
+)
+_ENROLL_READY = re.compile(
+    r"\b(enroll|enrolling|enrollment|sign me up|sign up|apply|application|register"
+    r"|ready to start|i'?m ready|tour|visit|call me|contact me|inscrib\w*|inscripción"
+    r"|matricular\w*)\b",
+    re.IGNORECASE,
+)
+_PRICING = re.compile(
+    r"\b(price|prices|pricing|cost|costs|tuition|fee|fees|payment|afford|how much"
+    r"|costo|precio|precios|cuánto|cuanto|cuesta|matrícula)\b|\$",
+    re.IGNORECASE,
+)
+_ASKS_FOR = {
+    "name": re.compile(r"\b(name|nombre)\b", re.IGNORECASE),
+    "email": re.compile(r"\b(email|e-mail|correo)\b", re.IGNORECASE),
+    "phone": re.compile(r"\b(phone|number|teléfono|telefono|número)\b", re.IGNORECASE),
+}
+
+
+@dataclass
+class LeadState:
+    stage: str = "initial"
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    campus: Optional[str] = None
+    # Campus implied by the programs discussed, used when none is stated
+    campus_hint: Optional[str] = None
+    # Fields the assistant asked for in its last turn
+    asked_for: Tuple[str, ...] = ()
+    turns: int = 0
+
+    @property
+    def missing(self) -> Tuple[str, ...]:
+        return tuple(f for f in FIELDS if not getattr(self, f))
+
+    @property
+    def has_contact(self) -> bool:
+        return bool(self.name and self.email and self.phone)
+
+    def summary(self) -> str:
+        """A few lines for the model: stage, what is known, what is still missing."""
+        lines = [f"Conversation state (tracked): stage={self.stage}"]
+        known = [f"{f}={getattr(self, f)}" for f in FIELDS if getattr(self, f)]
+        if known:
+            lines.append("Collected (do not ask again): " + ", ".join(known))
+        if self.stage in ("enrollment_collection", "enrollment_ready") and self.missing:
+            lines.append("Still missing: " + ", ".join(self.missing))
+        if not self.campus and self.campus_hint:
+            lines.append(f"Programs discussed are at the {self.campus_hint} campus")
+        return "\n".join(lines)
+
+    def as_log(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "missing": list(self.missing), "turns": self.turns}
+
+
+def _advance_stage(current: str, candidate: str) -> str:
+    return candidate if _RANK[candidate] > _RANK[current] else current
+
+
+def _name_words(words: List[str]) -> bool:
+    """Whether `words` can be a name rather than the start of a sentence."""
+    return (
+        0 < len(words) <= _NAME_MAX_WORDS
+        and words[0].lower() not in _NOT_NAME
+        and not any(w.lower() in _FUNCTION_WORDS for w in words)
+    )
+
+
+def _extract_name(text: str, asked_for_name: bool) -> Optional[str]:
+    m = _NAME.search(text)
+    # "I'm / I am / this is / soy ..." only introduces a name when one was asked for
+    if m and (m.group("explicit") or asked_for_name):
+        words = []
+        for word in m.group("name").split():
+            if word.lower() in _NAME_STOP:
+                break
+            words.append(word)
+        if _name_words(words):
+            return " ".join(w.capitalize() if w.islower() else w for w in words)
+    if asked_for_name:
+        # A bare name answering "what's your name?", possibly next to other
+        # answers ("Sure! Ana Lopez, ana@example.com")
+        rest = _PHONE.sub(" ", _EMAIL.sub(" ", text))
+        for fragment in reversed(_FRAGMENT.split(rest)):
+            words = fragment.split()
+            if (
+                _name_words(words)
+                and _BARE_NAME.fullmatch(" ".join(words))
+                and not any(w.lower() in _NOT_BARE_NAME for w in words)
+                and route_grounding([], fragment)[1] not in ("greeting", "acknowledgement", "topic")
+            ):
+                return " ".join(w.capitalize() if w.islower() else w for w in words)
+    return None
+
+
+def _campus(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """(stated campus, campus implied by programs) for one message."""
+    stated = [CAMPUS_NY if m.group("ny") else CAMPUS_NJ for m in _CAMPUS_EXPLICIT.finditer(text)]
+    implied = detect_campuses([], text)
+    return (
+        stated[-1] if len(set(stated)) == 1 else None,
+        implied[0] if len(implied) == 1 else None,
+    )
+
+
+def consume(state: LeadState, role: str, text: str) -> LeadState:
+    """The state after one more turn; `state` is not modified."""
+    state = replace(state, turns=state.turns + 1)
+    text = text or ""
+    if (role or "").strip().lower() != "user":
+        state.asked_for = tuple(f for f, pattern in _ASKS_FOR.items() if pattern.search(text))
+        # The assistant has confirmed the complete lead
+        if state.stage == "enrollment_ready":
+            state.stage = "post_enrollment"
+        return state
+
+    asked = state.asked_for
+    state.asked_for = ()
+    had_contact = state.has_contact
+
+    email = _EMAIL.search(text)
+    if email:
+        state.email = email.group(0)
+    phone = _PHONE.search(text)
+    if phone:
+        state.phone = phone.group(0).strip()
+    name = _extract_name(text, "name" in asked)
+    if name:
+        state.name = name
+    stated, implied = _campus(text)
+    if stated:
+        state.campus = stated
+    if implied:
+        state.campus_hint = implied
+
+    # Stage Detection Logic, in the prompt's order
+    if state.has_contact:
+        if had_contact and route_grounding([], text)[1] == "acknowledgement":
+            state.stage = _advance_stage(state.stage, "completion")
+        else:
+            state.stage = _advance_stage(state.stage, "enrollment_ready")
+    elif email or phone or name or _ENROLL_READY.search(text):
+        state.stage = _advance_stage(state.stage, "enrollment_collection")
+    elif _PRICING.search(text):
+        state.stage = _advance_stage(state.stage, "pricing")
+    elif implied or route_grounding([], text)[1] == "topic":
+        state.stage = _advance_stage(state.stage, "interest")
+    return state
+
+
+# Consumed turns remembered per thread to find where a request resumes
+_TAIL_TURNS = 4
+
+
+def _turn_print(item: Dict[str, Any]) -> tuple:
+    return (item.get("role") or "", hash(item.get("text") or ""))
+
+
+def _tail_print(turns: List[Dict[str, Any]], end: int, size: int) -> tuple:
+    return tuple(_turn_print(item) for item in turns[max(0, end - size):end])
+
+
+def _resume_at(turns: List[Dict[str, Any]], consumed: int, head: tuple, tail: tuple) -> Optional[int]:
+    """
+    Index to resume consuming `turns` at, given the first turn and the last
+    consumed turns of the previous request: `consumed` when the history only
+    grew; earlier when older turns were dropped from the front (a server-side
+    thread or client tail capped at N turns); None when it was edited, cut
+    short or restarted.
+    """
+    size = len(tail)
+    if consumed <= len(turns) and _tail_print(turns, consumed, size) == tail:
+        if _turn_print(turns[0]) == head:
+            return consumed
+    for end in range(min(consumed, len(turns)) - 1, size - 1, -1):
+        if _tail_print(turns, end, size) == tail:
+            return end
+    return None
+
+
+class LeadTracker:
+    """
+    Per-thread LRU of LeadState. `observe` consumes only the turns added since
+    the thread was last seen: the cached state is reused from where the last
+    consumed turns now sit, whether the history only grew or also lost turns
+    from the front to a sliding window; otherwise (edited, truncated,
+    restarted, another client) it is replayed from the start.
+    """
+
+    def __init__(self, max_threads: int = 10000):
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        # key → (state, turns consumed, first turn, last consumed turns)
+        self._threads: "OrderedDict[str, Tuple[LeadState, int, tuple, tuple]]" = OrderedDict()
+        self.stats = {"hits": 0, "replays": 0, "turns_consumed": 0}
+
+    def observe(self, key: Optional[str], history: List[Dict[str, Any]], user_message: str) -> LeadState:
+        """State after `history` plus the new user message."""
+        turns = [item for item in history or [] if isinstance(item, dict)]
+        turns.append({"role": "user", "text": user_message})
+
+        state, start = LeadState(), 0
+        if key is not None:
+            with self._lock:
+                cached = self._threads.get(key)
+                if cached is not None:
+                    self._threads.move_to_end(key)
+            if cached is not None:
+                cached_state, consumed, head, tail = cached
+                resume = _resume_at(turns, consumed, head, tail)
+                if resume is not None:
+                    state, start = cached_state, resume
+                with self._lock:
+                    self.stats["hits" if resume is not None else "replays"] += 1
+
+        for item in turns[start:]:
+            state = consume(state, item.get("role"), item.get("text"))
+
+        with self._lock:
+            self.stats["turns_consumed"] += len(turns) - start
+            if key is not None:
+                self._threads[key] = (
+                    state, len(turns), _turn_print(turns[0]), _tail_print(turns, len(turns), _TAIL_TURNS)
+                )
+                self._threads.move_to_end(key)
+                while len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+        return state
@@ -0,0 +1,195 @@
+# log_pipeline.py
+"""
+Structured logging off the request hot path.
+
+`BackgroundLogger.log_struct` has the same call shape as a Cloud Logging
+logger but only enqueues the entry. A worker thread drains the bounded queue
+and writes batches to a sink when the batch is full, when the flush interval
+passes, or at shutdown. When the queue is full entries are dropped and
+counted instead of blocking the request.
+"""
+import atexit
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LogEntry = Tuple[Dict[str, Any], str]  # (payload, severity)
+
+_STOP = object()
+
+# Payload fields that can carry user/model text and are truncated
+TRUNCATED_FIELDS = ("message", "error")
+
+
+class CloudLoggingSink:
+    """
+    Writes each batch with a single Cloud Logging API call. The logger comes
+    from `logger_factory` on the first write, i.e. on the worker thread, so
+    importing and authenticating the logging client stays off the request path.
+    """
+
+    def __init__(self, logger_factory: Callable[[], Any]):
+        self._logger_factory = logger_factory
+        self._logger = None
+
+    def write_batch(self, entries: List[LogEntry]) -> None:
+        if self._logger is None:
+            self._logger = self._logger_factory()
+        batch = self._logger.batch()
+        for info, severity in entries:
+            batch.log_struct(info, severity=severity)
+        batch.commit()
+
+
+class ListSink:
+    """Collects batches in memory (local runs and tests)."""
+
+    def __init__(self):
+        self.batches: List[List[LogEntry]] = []
+
+    @property
+    def entries(self) -> List[LogEntry]:
+        return [entry for batch in self.batches for entry in batch]
+
+    def write_batch(self, entries: List[LogEntry]) -> None:
+        self.batches.append(list(entries))
+
+
+class BackgroundLogger:
+    def __init__(
+        self,
+        sink: Any,
+        max_queue: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_message_chars: Optional[int] = None,
+        sample_rate: float = 1.0,
+    ):
+        self._sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_message_chars = max_message_chars
+        self.sample_rate = sample_rate
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self.counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sampled_out": 0,
+            "written": 0,
+            "batches": 0,
+            "sink_errors": 0,
+        }
+
+    # ---------- producer side (request threads) ----------
+    def log_struct(self, info: Dict[str, Any], severity: str = "INFO") -> None:
+        """Enqueue one entry; never blocks. Only INFO entries are sampled."""
+        if severity == "INFO" and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._count("sampled_out")
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((self._truncate(info), severity))
+            self._count("enqueued")
+        except queue.Full:
+            self._count("dropped")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything enqueued so far has been written (or `timeout`)."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write pending entries and stop the worker."""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, queued=self._queue.qsize())
+
+    # ---------- internals ----------
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _truncate(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        limit = self.max_message_chars
+        if not limit:
+            return info
+        out = dict(info)
+        for field in TRUNCATED_FIELDS:
+            value = out.get(field)
+            if isinstance(value, str) and len(value) > limit:
+                out[field] = f"{value[:limit]}…[truncated {len(value) - limit} chars]"
+        return out
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-pipeline", daemon=True
+                )
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.close)
+                    self._atexit_registered = True
+
+    def _write(self, batch: List[LogEntry]) -> None:
+        if not batch:
+            return
+        try:
+            self._sink.write_batch(batch)
+            self._count("written", len(batch))
+            self._count("batches")
+        except Exception:
+            self._count("sink_errors")
+        batch.clear()
+
+    def _run(self) -> None:
+        batch: List[LogEntry] = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                deadline = None
+                item.set()
+                continue
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if len(batch) >= self.batch_size or (
+                batch and deadline is not None and time.monotonic() >= deadline
+            ):
+                self._write(batch)
+                deadline = None
@@ -1,29 +1,52 @@
 # main.py
 import os
+import sys
 import json
 import time
+import asyncio
+import threading
 import functions_framework
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Dict, Any, Optional, Tuple
 
-from flask import jsonify, request
-from google import genai
-from google.cloud import logging as cloud_logging
+from flask import Response, request, stream_with_context
 
 from google.genai.types import (
     Tool,
     Retrieval,
     VertexAISearch,
     GenerateContentConfig,
+    ThinkingConfig,
     Content,
     Part,
 )
 
-from markdown import markdown as md_to_html
-from selectolax.parser import HTMLParser
-from bs4 import BeautifulSoup
-
 # Import the dynamic system prompt function (without RAG context)
-from sophia_prompt import get_system_prompt_for_request
+from sophia_prompt import get_system_prompt_for_request, route_grounding
+from md_text import markdown_to_text
+from context_cache import ContextCacheManager
+from response_cache import InMemoryResponseCache, build_cache_key, is_cacheable
+from retrieval import Retriever, VertexSearchBackend, format_snippets
+from telemetry import Spans, usage_counts
+from generation import DeadlineExceeded, GenerationCancelled, GenerationExecutor, LatencyWindow
+from model_router import ModelRouter, parse_tiers
+from log_pipeline import BackgroundLogger, CloudLoggingSink
+from thread_store import InMemoryThreadStore, SQLiteThreadStore, thread_key
+from lead_state import LeadState, LeadTracker
+from context_budget import ContextBudgeter, format_summary, output_token_cap, thinking_token_budget
+from admission import AdmissionController, AdmissionRejected, InMemoryRateLimitBackend, Slot, admission_key
+from single_flight import Flight, SingleFlight, flight_key
+from wire import (
+    InvalidBody,
+    PayloadTooLarge,
+    UnsupportedEncoding,
+    check_length,
+    decode_body,
+    encode_body,
+    get_codec,
+    parse_json_object,
+)
 
 # -----------------------------
 # Config
@@ -31,51 +54,193 @@ from sophia_prompt import get_system_prompt_for_request
 PROJECT_ID = os.getenv("GCP_PROJECT", "christinevalmy")
 LOCATION = os.getenv("FUNCTION_REGION", "us-central1")
 MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.5-flash")
+# Per-turn model routing: simple turns go to the lite tier, the rest (and any
+# failed lite call) to the standard tier, MODEL_NAME unless MODEL_TIERS says otherwise
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+LITE_MODEL_NAME = os.getenv("LITE_MODEL_NAME", "gemini-2.5-flash-lite")
+MODEL_TIERS = os.getenv("MODEL_TIERS", "")
+MODEL_ROUTING_MAX_HISTORY = int(os.getenv("MODEL_ROUTING_MAX_HISTORY", "12"))
+MODEL_ROUTING_MAX_MESSAGE_CHARS = int(os.getenv("MODEL_ROUTING_MAX_MESSAGE_CHARS", "200"))
+# Stop routing to the lite tier while its p95 time-to-first-chunk is above this
+MODEL_ROUTING_MAX_LITE_P95 = float(os.getenv("MODEL_ROUTING_MAX_LITE_P95", "0")) or None
+# ...measured over the samples of this many recent seconds
+MODEL_ROUTING_LITE_WINDOW_SECONDS = float(os.getenv("MODEL_ROUTING_LITE_WINDOW_SECONDS", "300"))
 MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", "1000"))
+# Lower max_output_tokens per tracked conversation stage (never above MAX_OUTPUT_TOKENS)
+ADAPTIVE_OUTPUT_TOKENS = os.getenv("ADAPTIVE_OUTPUT_TOKENS", "true").lower() in ("1", "true", "yes")
+# Send the most recent turns verbatim and fold older ones into a cached summary
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "12"))
+HISTORY_FOLD_STEP = int(os.getenv("HISTORY_FOLD_STEP", "6"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "3000"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "400"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 TOP_P = float(os.getenv("TOP_P", "0.8"))
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# Conversations with at most this many history items are eligible for caching
+RESPONSE_CACHE_MAX_HISTORY = int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", "2"))
+# "memory" or "sqlite"; used when a request carries a thread_id but no history
+THREAD_STORE_BACKEND = os.getenv("THREAD_STORE_BACKEND", "memory").lower()
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH", "/tmp/threads.sqlite3")
+THREAD_STORE_MAX_THREADS = int(os.getenv("THREAD_STORE_MAX_THREADS", "10000"))
+THREAD_STORE_MAX_TURNS = int(os.getenv("THREAD_STORE_MAX_TURNS", "200"))
+# Explicit Vertex AI Search stage; when off (or when it fails) the model grounds
+# itself through the Vertex AI Search tool instead
+SEARCH_RETRIEVAL_ENABLED = os.getenv("SEARCH_RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "3.0"))
+SEARCH_MAX_SNIPPETS = int(os.getenv("SEARCH_MAX_SNIPPETS", "3"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "900"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))
+# Skip grounding for greetings, acknowledgements and contact-collection turns
+GROUNDING_ROUTER_ENABLED = os.getenv("GROUNDING_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Track stage and collected lead fields per thread and hand the model a summary
+LEAD_STATE_ENABLED = os.getenv("LEAD_STATE_ENABLED", "true").lower() in ("1", "true", "yes")
+LEAD_STATE_MAX_THREADS = int(os.getenv("LEAD_STATE_MAX_THREADS", "10000"))
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "25"))
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+# Hedging sends a duplicate request when the first chunk is later than the
+# observed p95; it trades extra model calls for tail latency, so it is opt-in.
+GENERATION_HEDGE_ENABLED = os.getenv("GENERATION_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+GENERATION_HEDGE_MIN_DELAY = float(os.getenv("GENERATION_HEDGE_MIN_DELAY", "1.0"))
+# Request bodies: compressed (on the wire) and decoded size limits, checked before parsing
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(1 << 20)))
+MAX_DECODED_REQUEST_BYTES = int(os.getenv("MAX_DECODED_REQUEST_BYTES", str(4 << 20)))
+# JSON responses at least this large are gzipped for clients that accept it (-1: never)
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+# "auto" (orjson when installed), "orjson" or "json"
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+# Admission control: per-caller and global token buckets (requests/second and
+# burst; rate 0 disables a bucket) and a per-instance cap on in-flight
+# generations (0: no cap) with a bounded wait queue. Over any limit → 429 + Retry-After
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "0.5"))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "10"))
+ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "0"))
+ADMISSION_GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "100"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Proxies in front of the function that append to X-Forwarded-For (Google's front end: 1).
+# Anonymous callers are keyed on the entry this far from the right; 0 uses the peer address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+# Identical concurrent requests (same message, history, prompt and date) share one generation
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "0")) or None
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
 
 VERTEX_SEARCH_ENGINE = os.getenv(
     "VERTEX_SEARCH_ENGINE",
     "projects/christinevalmy/locations/global/collections/default_collection/engines/cv-aug27_1756347217695",
 )
 
-# Instantiate clients (Vertex routing enabled by vertexai=True)
-client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-logging_client = cloud_logging.Client()
-logger = logging_client.logger("assistant_conversations")
+json_dumps, json_loads = get_codec(JSON_CODEC)
 
+# Clients are created on first use rather than at import, to keep cold starts short
+_client = None
+_client_lock = threading.Lock()
 
-# -----------------------------
-# Helpers
-# -----------------------------
-def html_to_text(markdown_text: str) -> str:
-    """Markdown → HTML → plain text with selectolax, fallback to BeautifulSoup."""
-    html_doc = md_to_html(markdown_text or "")
-    try:
-        tree = HTMLParser(html_doc)
-        if tree.body:
-            text = tree.body.text(separator="\n").strip()
-        else:
-            text = tree.root.text(separator="\n").strip()
-        if text:
-            return (
-                text.replace("\\u2019", "'")
-                .replace("\\u2014", "—")
-                .replace("\xa0", " ")
-                .strip()
-            )
-    except Exception:
-        pass
-    plain = BeautifulSoup(html_doc, "html.parser").get_text(separator="\n").strip()
-    return (
-        plain.replace("\\u2019", "'")
-        .replace("\\u2014", "—")
-        .replace("\xa0", " ")
-        .strip()
+
+def get_client():
+    """google-genai client (Vertex routing enabled by vertexai=True), created once."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+
+                _client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    return _client
+
+
+def _conversation_logger():
+    """Cloud Logging logger; built by the log worker thread on its first batch."""
+    from google.cloud import logging as cloud_logging
+
+    return cloud_logging.Client().logger("assistant_conversations")
+
+
+# Log entries are batched and written by a background worker, off the request path
+logger = BackgroundLogger(
+    CloudLoggingSink(_conversation_logger),
+    max_queue=LOG_QUEUE_SIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    max_message_chars=LOG_MAX_MESSAGE_CHARS,
+    sample_rate=LOG_SAMPLE_RATE,
+)
+model_router = ModelRouter(
+    {"lite": LITE_MODEL_NAME, "standard": MODEL_NAME, **parse_tiers(MODEL_TIERS)},
+    enabled=MODEL_ROUTING_ENABLED,
+    max_history=MODEL_ROUTING_MAX_HISTORY,
+    max_message_chars=MODEL_ROUTING_MAX_MESSAGE_CHARS,
+    max_lite_p95_seconds=MODEL_ROUTING_MAX_LITE_P95,
+    lite_window_seconds=MODEL_ROUTING_LITE_WINDOW_SECONDS,
+)
+executor = GenerationExecutor(
+    get_client,
+    deadline_seconds=GENERATION_DEADLINE_SECONDS,
+    max_attempts=GENERATION_MAX_ATTEMPTS,
+    hedge_enabled=GENERATION_HEDGE_ENABLED,
+    hedge_min_delay=GENERATION_HEDGE_MIN_DELAY,
+)
+context_cache = ContextCacheManager(get_client, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS)
+response_cache = InMemoryResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS
+)
+retriever = Retriever(
+    VertexSearchBackend(VERTEX_SEARCH_ENGINE, timeout=SEARCH_TIMEOUT_SECONDS),
+    cache=InMemoryResponseCache(
+        max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl_seconds=SEARCH_CACHE_TTL_SECONDS
+    ),
+    max_snippets=SEARCH_MAX_SNIPPETS,
+)
+# Search runs here while the request thread assembles the system prompt
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+# Recent search-stage latencies; their median is the latency a skipped search saves
+search_latency = LatencyWindow()
+lead_tracker = LeadTracker(max_threads=LEAD_STATE_MAX_THREADS)
+context_budgeter = ContextBudgeter(
+    cache=InMemoryResponseCache(max_entries=4096, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS),
+    keep_recent=HISTORY_KEEP_TURNS,
+    fold_step=HISTORY_FOLD_STEP,
+    max_history_tokens=HISTORY_MAX_TOKENS,
+    max_summary_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+)
+admission = (
+    AdmissionController(
+        InMemoryRateLimitBackend(),
+        user_rate=ADMISSION_USER_RATE,
+        user_burst=ADMISSION_USER_BURST,
+        global_rate=ADMISSION_GLOBAL_RATE,
+        global_burst=ADMISSION_GLOBAL_BURST,
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    )
+    if ADMISSION_ENABLED
+    else AdmissionController()
+)
+single_flight = SingleFlight()
+if THREAD_STORE_BACKEND == "sqlite":
+    thread_store = SQLiteThreadStore(THREAD_STORE_PATH, max_turns=THREAD_STORE_MAX_TURNS)
+else:
+    thread_store = InMemoryThreadStore(
+        max_threads=THREAD_STORE_MAX_THREADS, max_turns=THREAD_STORE_MAX_TURNS
     )
 
 
+# -----------------------------
+# Helpers
+# -----------------------------
 def normalize_history_to_genai(history: List[Dict[str, Any]]) -> List[Content]:
     """
     Convert incoming history:
@@ -103,125 +268,954 @@ def normalize_history_to_genai(history: List[Dict[str, Any]]) -> List[Content]:
     return contents
 
 
+def build_generation_config(
+    system_prompt: str,
+    tools: List[Tool],
+    cached_content: str = None,
+    max_output_tokens: int = None,
+    thinking_budget: int = None,
+) -> GenerateContentConfig:
+    """
+    Generation config; with `cached_content` the prompt and tools come from the
+    cache. `thinking_budget` bounds thinking tokens, which count toward
+    `max_output_tokens` (None: the model's default).
+    """
+    max_output_tokens = max_output_tokens or MAX_OUTPUT_TOKENS
+    thinking_config = None if thinking_budget is None else ThinkingConfig(thinking_budget=thinking_budget)
+    if cached_content:
+        return GenerateContentConfig(
+            cached_content=cached_content,
+            temperature=TEMPERATURE,
+            top_p=TOP_P,
+            max_output_tokens=max_output_tokens,
+            thinking_config=thinking_config,
+        )
+    return GenerateContentConfig(
+        system_instruction=system_prompt,
+        tools=tools or None,
+        temperature=TEMPERATURE,
+        top_p=TOP_P,
+        max_output_tokens=max_output_tokens,
+        thinking_config=thinking_config,
+    )
+
+
+def smart_retrieve_from_search(query: str, conversation_stage: str):
+    """Vertex AI Search for `query`: (snippets, sources), cached per normalized query."""
+    return retriever.retrieve(query, conversation_stage)
+
+
+def wants_stream(req, data: Dict[str, Any]) -> bool:
+    """Streaming is opt-in via `"stream": true` or `Accept: text/event-stream`."""
+    flag = data.get("stream")
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    if flag:
+        return True
+    return "text/event-stream" in (req.headers.get("Accept") or "")
+
+
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _on_fallback(config: GenerateContentConfig) -> Callable[[BaseException], None]:
+    """Forget the context cache entry behind `config` once it has failed."""
+
+    def on_fallback(exc: BaseException) -> None:
+        if config.cached_content:
+            context_cache.invalidate(config.cached_content)
+
+    return on_fallback
+
+
+def iter_reply_chunks(
+    contents: List[Content],
+    config: GenerateContentConfig,
+    fallback_config: GenerateContentConfig = None,
+    on_usage: Callable[[Any], None] = None,
+    model: str = None,
+    deadline_seconds: float = None,
+):
+    """
+    Yield reply text chunks as the model produces them, within the request
+    deadline (retries, hedging and cancellation live in GenerationExecutor).
+    `fallback_config` is the inline-prompt config used if the context cache
+    entry referenced by `config` has gone missing. `on_usage` receives the
+    reply's `usage_metadata`. `model` defaults to MODEL_NAME.
+    """
+    return executor.stream(
+        model or MODEL_NAME,
+        contents,
+        config,
+        fallback_config=fallback_config if fallback_config is not config else None,
+        on_fallback=_on_fallback(config),
+        on_usage=on_usage,
+        deadline_seconds=deadline_seconds,
+    )
+
+
+def aiter_reply_chunks(
+    contents: List[Content],
+    config: GenerateContentConfig,
+    fallback_config: GenerateContentConfig = None,
+    on_usage: Callable[[Any], None] = None,
+    model: str = None,
+    deadline_seconds: float = None,
+):
+    """`iter_reply_chunks` on the async client, for the ASGI entrypoint."""
+    return executor.astream(
+        model or MODEL_NAME,
+        contents,
+        config,
+        fallback_config=fallback_config if fallback_config is not config else None,
+        on_fallback=_on_fallback(config),
+        on_usage=on_usage,
+        deadline_seconds=deadline_seconds,
+    )
+
+
 # -----------------------------
-# HTTP Entrypoint
+# Request handling shared by the sync and async entrypoints
 # -----------------------------
-@functions_framework.http
-def app(request):
-    start_time = time.time()
-    
-    try:
-        data = request.get_json(silent=True) or {}
-        # Accept "message" or "query"
-        user_message = (data.get("message") or data.get("query") or "").strip()
-        user_id = data.get("user_id", "unknown")
-        thread_id = data.get("thread_id", "unknown")
-        history_in = data.get("history", [])
+class BadRequest(Exception):
+    pass
+
+
+@dataclass
+class ChatTurn:
+    """One user message on its way through the pipeline."""
+
+    user_id: str
+    thread_id: str
+    message: str
+    start_time: float
+    history: List[Dict[str, Any]]
+    store_key: Optional[str] = None
+    cache_key: Optional[str] = None
+    # Set when the reply was served from the response cache
+    cached_reply: Optional[str] = None
+    contents: List[Content] = field(default_factory=list)
+    config: Optional[GenerateContentConfig] = None
+    fallback_config: Optional[GenerateContentConfig] = None
+    # Explicit search stage outcome, for the reply log
+    retrieval: Dict[str, Any] = field(default_factory=dict)
+    # Tracked conversation stage and lead fields (lead_state.LeadTracker)
+    lead: Optional[LeadState] = None
+    # History turns received / sent verbatim, and the output token cap
+    context: Dict[str, Any] = field(default_factory=dict)
+    # Shared generation: key, flight, and whether this turn runs it or follows it
+    flight_key: Optional[str] = None
+    flight: Optional[Flight] = None
+    flight_leader: bool = True
+    # Admission slot held while this turn generates (released by `close`)
+    slot: Optional[Slot] = None
+    # A led generation that outlives this turn's client, for its followers:
+    # the drain thread (sync) or the task feeding the flight (async)
+    flight_handoff: bool = False
+    flight_pump: Optional[asyncio.Future] = None
+    # Routed model, why it was chosen, and the model it replaced after a failure
+    model: str = MODEL_NAME
+    model_route: Optional[str] = None
+    model_fallback_from: Optional[str] = None
+    # Reply as it streams in, stage timings and token usage
+    text: str = ""
+    ttft: Optional[float] = None
+    usage: Optional[Dict[str, int]] = None
+    spans: Spans = field(default_factory=Spans)
+    # Client asked for the timing breakdown in the response body
+    include_timings: bool = False
+    generation_started: Optional[float] = None
+
+    def join_flight(self) -> bool:
+        """Join an identical generation already in flight; True when following one."""
+        if self.flight_key is None:
+            return False
+        self.flight, self.flight_leader = single_flight.join(self.flight_key)
+        return not self.flight_leader
+
+    def end_flight(self, error: BaseException = None) -> None:
+        """Hand the outcome of a led flight to its followers."""
+        if self.flight is not None and self.flight_leader and not self.flight.done:
+            if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+                error = GenerationCancelled("The request sharing this reply was cancelled.")
+            single_flight.finish(self.flight_key, self.flight, self.model, error)
+
+    def _leads_open_flight(self) -> bool:
+        return self.flight is not None and self.flight_leader and not self.flight.done
+
+    def close(self) -> None:
+        """
+        Release what this turn holds once its response is done with, whether
+        or not its body was ever read: the generation slot, and a flight it
+        leads but never finished (which runs on for any followers).
+        """
+        if self._leads_open_flight() and not self.flight_handoff and self.generation_started is None:
+            self.generation_started = time.perf_counter()
+            self._hand_off(self._generate())
+        if not self.flight_handoff:
+            self.end_flight(GenerationCancelled("The request sharing this reply was closed."))
+        self._leave_unread_flight()
+        if self.slot is not None:
+            self.slot.release()
+
+    async def aclose(self) -> None:
+        """`close` for the ASGI entrypoint; a led flight runs on as a task."""
+        if self._leads_open_flight():
+            if single_flight.abandon(self.flight_key, self.flight):
+                if self.flight_pump is not None:
+                    self.flight_pump.cancel()
+            elif self.flight_pump is None:
+                self.generation_started = time.perf_counter()
+                self._start_pump()
+        self._leave_unread_flight()
+        if self.slot is not None:
+            self.slot.release()
+
+    def _leave_unread_flight(self) -> None:
+        # A follower closed before reading stops counting (reading does this itself)
+        if self.flight is not None and not self.flight_leader and self.generation_started is None:
+            self.generation_started = time.perf_counter()
+            self.flight.leave()
+
+    def _hand_off(self, generation) -> bool:
+        """
+        Run the rest of a led generation in a thread for its followers once
+        this turn's client has gone; False when nobody follows it.
+        """
+        if not self._leads_open_flight() or single_flight.abandon(self.flight_key, self.flight):
+            return False
+        slot, self.slot = self.slot, None
+        self.flight_handoff = True
+        threading.Thread(target=self._drain, args=(generation, slot), daemon=True).start()
+        return True
+
+    def _drain(self, generation, slot: Optional[Slot]) -> None:
+        error = None
+        try:
+            for text in generation:
+                self.flight.publish(text)
+        except Exception as e:
+            error = e
+        finally:
+            self.end_flight(error)
+            if slot is not None:
+                slot.release()
+
+    def _start_pump(self) -> None:
+        slot, self.slot = self.slot, None
+        self.flight_pump = asyncio.ensure_future(self._apump(slot))
+
+    async def _apump(self, slot: Optional[Slot]) -> None:
+        """Feed the flight from the model; the leader reads it like any follower."""
+        error = None
+        try:
+            async for text in self._agenerate():
+                self.flight.publish(text)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self.end_flight(error)
+            if slot is not None:
+                slot.release()
+
+    def chunks(self):
+        """
+        Model output for this turn (or the shared flight it follows); records
+        TTFT and the model stages. A lite model that fails before producing
+        text is replaced by the standard one.
+        """
+        self.generation_started = time.perf_counter()
+        if not self.flight_leader:
+            yield from self.flight.follow(GENERATION_DEADLINE_SECONDS)
+            self.model = self.flight.model or self.model
+            return
+        generation = self._generate()
+        error = None
+        handed_off = False
+        try:
+            for text in generation:
+                if self.flight is not None:
+                    self.flight.publish(text)
+                yield text
+        except BaseException as e:
+            error = e
+            # Closed mid-reply: followers still get the rest
+            handed_off = isinstance(e, GeneratorExit) and self._hand_off(generation)
+            if not handed_off:
+                raise
+        finally:
+            if not handed_off:
+                self.end_flight(error)
+
+    async def achunks(self):
+        self.generation_started = time.perf_counter()
+        if self.flight is None:
+            async for text in self._agenerate():
+                yield text
+            return
+        if self.flight_leader:
+            # The model call runs in its own task, so cancelling this request
+            # does not cancel it for the followers (see `aclose`)
+            self._start_pump()
+        async for text in self.flight.afollow(GENERATION_DEADLINE_SECONDS, follower=not self.flight_leader):
+            yield text
+        self.model = self.flight.model or self.model
+
+    def _generate(self):
+        try:
+            yield from iter_reply_chunks(
+                self.contents, self.config, self.fallback_config, self.set_usage, self.model
+            )
+        except Exception as e:
+            if not self._use_fallback_model(e):
+                raise
+            yield from iter_reply_chunks(
+                self.contents, self.fallback_config, None, self.set_usage, self.model,
+                deadline_seconds=self._remaining_budget(),
+            )
+
+    async def _agenerate(self):
+        try:
+            async for text in aiter_reply_chunks(
+                self.contents, self.config, self.fallback_config, self.set_usage, self.model
+            ):
+                yield text
+        except Exception as e:
+            if not self._use_fallback_model(e):
+                raise
+            async for text in aiter_reply_chunks(
+                self.contents, self.fallback_config, None, self.set_usage, self.model,
+                deadline_seconds=self._remaining_budget(),
+            ):
+                yield text
+
+    def _remaining_budget(self) -> float:
+        return max(0.001, GENERATION_DEADLINE_SECONDS - (time.perf_counter() - self.generation_started))
+
+    def _use_fallback_model(self, exc: Exception) -> bool:
+        """Switch to the standard model after a failed lite call, if that can still help."""
+        strong = model_router.fallback_model
+        if (
+            self.text
+            or (self.flight is not None and self.flight.chunks)
+            or self.model == strong
+            or isinstance(exc, (DeadlineExceeded, GenerationCancelled))
+        ):
+            return False
+        self.model_fallback_from, self.model = self.model, strong
+        if "thinking_budget" in self.context:
+            # The stage cap's thinking budget, for the model taking over
+            budget = thinking_token_budget(self.context["max_output_tokens"], strong)
+            self.context["thinking_budget"] = budget
+            self.fallback_config = self.fallback_config.model_copy(
+                update={"thinking_config": None if budget is None else ThinkingConfig(thinking_budget=budget)}
+            )
+        return True
 
-        if not user_message:
-            return jsonify({"error": "Missing 'message' or 'query' in request."}), 400
+    def add_chunk(self, text: str) -> None:
+        if self.ttft is None:
+            self.ttft = round(time.time() - self.start_time, 3)
+            first_chunk = time.perf_counter() - self.generation_started
+            self.spans.add("model_first_chunk", first_chunk)
+            if self.flight_leader:
+                model_router.observe(self.model, first_chunk)
+        self.text += text
 
-        # Log user message
+    def set_usage(self, usage_metadata: Any) -> None:
+        self.usage = usage_counts(usage_metadata)
+
+    def timings(self) -> Dict[str, Any]:
+        return {"stages_ms": self.spans.as_dict(), "tokens": self.usage}
+
+    def headers(self) -> Dict[str, str]:
+        total_ms = (time.time() - self.start_time) * 1000
+        return {"Server-Timing": ", ".join(filter(None, [self.spans.server_timing(), f"total;dur={total_ms:.1f}"]))}
+
+    def remember(self, final_text: str) -> None:
+        """Cache the reply and append this exchange to the server-side thread."""
+        # A reply from the fallback model is not what the key's model would say
+        if self.cache_key and not self.model_fallback_from:
+            response_cache.set(self.cache_key, final_text)
+        if self.store_key:
+            thread_store.append(self.store_key, "user", self.message)
+            thread_store.append(self.store_key, "assistant", final_text)
+
+
+def start_turn(data: Dict[str, Any], start_time: float) -> ChatTurn:
+    """
+    Validate the request body and prepare the generation call: thread history,
+    response cache lookup, system prompt and (cached) generation config.
+    Blocking (thread store, context cache), so async callers run it in a thread.
+    """
+    # Accept "message" or "query"
+    user_message = (data.get("message") or data.get("query") or "").strip()
+    if not user_message:
+        raise BadRequest("Missing 'message' or 'query' in request.")
+
+    turn = ChatTurn(
+        user_id=data.get("user_id", "unknown"),
+        thread_id=data.get("thread_id", "unknown"),
+        message=user_message,
+        start_time=start_time,
+        history=data.get("history", []),
+        include_timings=bool(data.get("timings")),
+    )
+    spans = turn.spans
+
+    # Server-side thread: clients that omit "history" send only the new message
+    thread_contents = None
+    if "history" not in data and turn.thread_id != "unknown":
+        turn.store_key = thread_key(turn.user_id, turn.thread_id)
+        with spans.span("thread_load"):
+            turn.history, thread_contents = thread_store.load(turn.store_key)
+
+    # Log user message
+    with spans.span("log"):
         logger.log_struct(
             {
                 "event": "user_message",
-                "user_id": user_id,
-                "thread_id": thread_id,
+                "user_id": turn.user_id,
+                "thread_id": turn.thread_id,
                 "message": user_message,
             },
             severity="INFO",
         )
 
-        # Build chat history for google-genai
-        contents: List[Content] = normalize_history_to_genai(history_in)
-        # Current user turn
-        contents.append(Content(role="user", parts=[Part(text=user_message)]))
+    # Decide whether this turn needs search grounding at all
+    needs_grounding, route_reason = (
+        route_grounding(turn.history, user_message) if GROUNDING_ROUTER_ENABLED else (True, "disabled")
+    )
+    turn.retrieval = {"grounding": needs_grounding, "route": route_reason}
+    turn.model, turn.model_route = model_router.choose(
+        turn.history, user_message, needs_grounding, route_reason
+    )
 
-        # Tool: Vertex AI Search
-        search_tool = Tool(
-            retrieval=Retrieval(
-                vertex_ai_search=VertexAISearch(engine=VERTEX_SEARCH_ENGINE)
+    # Stage and lead fields, consuming only the turns added since this thread's last request
+    if LEAD_STATE_ENABLED:
+        with spans.span("lead_state"):
+            turn.lead = lead_tracker.observe(
+                thread_key(turn.user_id, turn.thread_id) if turn.thread_id != "unknown" else None,
+                turn.history,
+                user_message,
             )
-        )
+
+    # Serve repeated openers / FAQ first turns from the response cache, keyed
+    # on the routed model (only replies from that model are cached)
+    if RESPONSE_CACHE_ENABLED and is_cacheable(turn.history, RESPONSE_CACHE_MAX_HISTORY):
+        with spans.span("response_cache"):
+            turn.cache_key = build_cache_key(user_message, turn.history, turn.model)
+            cached_text = response_cache.get(turn.cache_key)
+        if cached_text is not None:
+            if turn.store_key:
+                thread_store.append(turn.store_key, "user", user_message)
+                thread_store.append(turn.store_key, "assistant", cached_text)
+            turn.cached_reply = cached_text
+            return turn
+
+    # Start the search stage; it overlaps with prompt assembly below
+    search_started = time.perf_counter()
+    search = None
+    if needs_grounding and SEARCH_RETRIEVAL_ENABLED:
+        stage = turn.lead.stage if turn.lead else ("active" if turn.history else "initial")
+        search = search_pool.submit(smart_retrieve_from_search, user_message, stage)
+
+    # Build chat history for google-genai (already built for stored threads);
+    # long conversations send their recent turns and a summary of the rest
+    summary = None
+    with spans.span("prompt"):
+        recent = turn.history
+        if CONTEXT_BUDGET_ENABLED:
+            summary, recent = context_budgeter.window(turn.history)
+            turn.context = {"history_turns": len(turn.history), "sent_turns": len(recent)}
+        if thread_contents is not None and summary is None:
+            turn.contents = thread_contents
+        else:
+            turn.contents = normalize_history_to_genai(recent)
 
         # Generate dynamic system prompt (without RAG context)
         dynamic_system_prompt = get_system_prompt_for_request(
-            history=history_in, 
+            history=turn.history,
             user_query=user_message
         )
 
-        # Generation config with dynamic system prompt
-        config = GenerateContentConfig(
-            system_instruction=dynamic_system_prompt,
-            tools=[search_tool],
-            temperature=TEMPERATURE,
-            top_p=TOP_P,
-            max_output_tokens=MAX_OUTPUT_TOKENS,
+    # Retrieved snippets go into the current turn (the system prompt stays
+    # cacheable); without them (search failed or found nothing) the model
+    # searches through the tool
+    tools: List[Tool] = []
+    user_parts = [Part(text=user_message)]
+    snippets = None
+    if search is not None:
+        # Only the part of the search not hidden behind prompt assembly
+        waited = time.perf_counter()
+        try:
+            snippets, sources = search.result(timeout=SEARCH_TIMEOUT_SECONDS)
+            turn.retrieval.update(snippets=len(snippets), sources=sources)
+        except Exception as e:
+            search.cancel()
+            turn.retrieval["error"] = str(e) or type(e).__name__
+        spans.add("search_wait", time.perf_counter() - waited)
+        search_seconds = time.perf_counter() - search_started
+        search_latency.add(search_seconds)
+        turn.retrieval["latency"] = round(search_seconds, 3)
+    elif not needs_grounding:
+        saved = search_latency.quantile(0.5, min_samples=1)
+        turn.retrieval["latency_saved"] = round(saved, 3) if saved is not None else None
+    if turn.lead and (turn.history or turn.lead.stage != "initial"):
+        user_parts.insert(0, Part(text=turn.lead.summary()))
+    if summary:
+        user_parts.insert(0, Part(text=format_summary(summary, len(turn.history) - len(recent))))
+    if snippets:
+        user_parts.insert(0, Part(text=format_snippets(snippets, sources)))
+    elif needs_grounding:
+        # Tool: Vertex AI Search
+        tools.append(
+            Tool(retrieval=Retrieval(vertex_ai_search=VertexAISearch(engine=VERTEX_SEARCH_ENGINE)))
         )
+    # Current user turn
+    turn.contents.append(Content(role="user", parts=user_parts))
 
-        # Generate (streaming)
-        full_text = ""
-        try:
-            resp_stream = client.models.generate_content_stream(
-                model=MODEL_NAME,
-                contents=contents,
-                config=config,
-            )
-            for chunk in resp_stream:
-                if getattr(chunk, "text", None):
-                    full_text += chunk.text
-        except Exception:
-            # Fallback to non-streaming
-            resp = client.models.generate_content(
-                model=MODEL_NAME, contents=contents, config=config
-            )
-            full_text = (getattr(resp, "text", "") or "").strip()
+    # Generation config: reference the cached prompt + tools when available
+    with spans.span("context_cache"):
+        cached_name = (
+            context_cache.get(turn.model, dynamic_system_prompt, tools)
+            if CONTEXT_CACHE_ENABLED
+            else None
+        )
+    # A stage cap also bounds thinking, or thinking alone could use up the cap
+    max_output_tokens, thinking_budget = MAX_OUTPUT_TOKENS, None
+    if ADAPTIVE_OUTPUT_TOKENS and turn.lead:
+        max_output_tokens = output_token_cap(turn.lead.stage, MAX_OUTPUT_TOKENS)
+        thinking_budget = thinking_token_budget(max_output_tokens, turn.model)
+        turn.context["thinking_budget"] = thinking_budget
+    turn.context["max_output_tokens"] = max_output_tokens
+    turn.config = build_generation_config(
+        dynamic_system_prompt, tools, cached_name, max_output_tokens, thinking_budget
+    )
+    # Inline config, used if the cached entry turns out to be missing
+    turn.fallback_config = (
+        build_generation_config(
+            dynamic_system_prompt, tools, max_output_tokens=max_output_tokens, thinking_budget=thinking_budget
+        )
+        if cached_name
+        else turn.config
+    )
+    if SINGLE_FLIGHT_ENABLED:
+        turn.flight_key = flight_key(user_message, turn.history, dynamic_system_prompt, turn.model)
+    return turn
 
-        # Normalize markdown → plain text
-        final_text = html_to_text(full_text)
-        
-        total_latency = round(time.time() - start_time, 3)
 
-        # Log assistant reply
-        logger.log_struct(
-            {
-                "event": "assistant_reply",
-                "user_id": user_id,
-                "thread_id": thread_id,
-                "message": final_text,
-                "role": "assistant",
-                "model": MODEL_NAME,
-                "total_latency": total_latency,
-            },
-            severity="INFO",
-        )
+def cached_reply_payload(turn: ChatTurn) -> Dict[str, Any]:
+    """Log and build the response for a reply served from the response cache."""
+    total_latency = round(time.time() - turn.start_time, 3)
+    logger.log_struct(
+        {
+            "event": "assistant_reply",
+            "user_id": turn.user_id,
+            "thread_id": turn.thread_id,
+            "message": turn.cached_reply,
+            "role": "assistant",
+            "model": turn.model,
+            "total_latency": total_latency,
+            "ttft": total_latency,
+            "response_cache": True,
+        },
+        severity="INFO",
+    )
+    payload = {
+        "response": turn.cached_reply,
+        "status_code": 200,
+        "model": turn.model,
+        "total_latency": total_latency,
+        "ttft": total_latency,
+        "cached": True,
+    }
+    if turn.include_timings:
+        payload["timings"] = turn.timings()
+    return payload
+
+
+def finish_turn(turn: ChatTurn, stream: bool = False) -> Dict[str, Any]:
+    """Normalize the model output, remember it, log it, and build the response."""
+    spans = turn.spans
+    if turn.generation_started is not None:
+        spans.add("model", time.perf_counter() - turn.generation_started)
+
+    # Normalize markdown → plain text
+    with spans.span("markdown"):
+        final_text = markdown_to_text(turn.text)
+    if final_text:
+        with spans.span("store"):
+            turn.remember(final_text)
+
+    total_latency = round(time.time() - turn.start_time, 3)
+
+    # Log assistant reply
+    entry = {
+        "event": "assistant_reply",
+        "user_id": turn.user_id,
+        "thread_id": turn.thread_id,
+        "message": final_text,
+        "role": "assistant",
+        "model": turn.model,
+        "total_latency": total_latency,
+        "ttft": turn.ttft,
+        "model_route": turn.model_route,
+        "context_cache": bool(turn.config.cached_content),
+        "stages_ms": spans.as_dict(),
+    }
+    if turn.model_fallback_from:
+        entry["model_fallback_from"] = turn.model_fallback_from
+    if turn.usage:
+        entry["tokens"] = turn.usage
+    if turn.retrieval:
+        entry["retrieval"] = turn.retrieval
+    if turn.lead:
+        entry["lead"] = turn.lead.as_log()
+    if turn.context:
+        entry["context"] = turn.context
+    if turn.flight is not None and not turn.flight_leader:
+        entry["single_flight"] = {"follower": True}
+    elif turn.flight is not None and turn.flight.followers:
+        entry["single_flight"] = {"waiters": turn.flight.followers}
+    if stream:
+        entry["stream"] = True
+    with spans.span("log"):
+        logger.log_struct(entry, severity="INFO")
 
-        return jsonify({
-            "response": final_text, 
-            "status_code": 200,
-            "model": MODEL_NAME,
-            "total_latency": total_latency
-        })
+    payload = {
+        "response": final_text,
+        "status_code": 200,
+        "model": turn.model,
+        "total_latency": total_latency,
+        "ttft": turn.ttft,
+    }
+    if turn.include_timings:
+        payload["timings"] = turn.timings()
+    return payload
 
+
+def fail_turn(data: Dict[str, Any], e: Exception, start_time: float, stream: bool = False):
+    """Log a failed request; returns (error payload, HTTP status)."""
+    total_latency = round(time.time() - start_time, 3)
+    entry = {
+        "event": "assistant_error",
+        "user_id": data.get("user_id", "unknown"),
+        "thread_id": data.get("thread_id", "unknown"),
+        "error": str(e),
+        "error_type": type(e).__name__,
+        "total_latency": total_latency,
+    }
+    if stream:
+        entry["stream"] = True
+    logger.log_struct(entry, severity="ERROR")
+    status = 504 if isinstance(e, DeadlineExceeded) else 500
+    return {"error": str(e), "total_latency": total_latency}, status
+
+
+def reject_turn(data: Dict[str, Any], e: AdmissionRejected, start_time: float):
+    """Log a request turned away by admission control; returns (payload, 429, headers)."""
+    logger.log_struct(
+        {
+            "event": "admission_rejected",
+            "user_id": data.get("user_id", "unknown"),
+            "thread_id": data.get("thread_id", "unknown"),
+            "reason": e.reason,
+            "retry_after": round(e.retry_after, 3),
+            "admission": admission.stats(),
+        },
+        severity="WARNING",
+    )
+    payload = {"error": str(e), "status_code": 429, "total_latency": round(time.time() - start_time, 3)}
+    return payload, 429, {"Retry-After": e.retry_after_header()}
+
+
+def client_address(req) -> Optional[str]:
+    """
+    Caller address: the X-Forwarded-For entry appended by our own front end
+    (TRUSTED_PROXY_HOPS from the right; entries left of it are whatever the
+    client sent), else the peer address.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in (req.headers.get("X-Forwarded-For") or "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    client = getattr(req, "client", None)
+    return getattr(req, "remote_addr", None) or (client.host if client else None)
+
+
+def _admitted(turn: ChatTurn, slot: Slot) -> Slot:
+    """Record time spent queued for a generation slot."""
+    if slot.waited:
+        turn.spans.add("admission_wait", slot.waited)
+    return slot
+
+
+def generation_slot(turn: ChatTurn) -> None:
+    """
+    Follow an identical generation already in flight (no slot needed), or
+    take a generation slot into `turn.slot`, waiting in the admission queue
+    if necessary. `turn.close()` gives it back.
+    """
+    if turn.join_flight():
+        return
+    try:
+        turn.slot = _admitted(turn, admission.acquire())
+    except AdmissionRejected as e:
+        turn.end_flight(e)
+        raise
+
+
+async def ageneration_slot(turn: ChatTurn) -> None:
+    """`generation_slot` for the ASGI entrypoint."""
+    if turn.join_flight():
+        return
+    try:
+        turn.slot = _admitted(turn, await admission.aacquire())
+    except (AdmissionRejected, asyncio.CancelledError) as e:
+        turn.end_flight(e)
+        raise
+
+
+def cached_reply_events(payload: Dict[str, Any]) -> List[str]:
+    return [sse_event("chunk", {"text": payload["response"]}), sse_event("done", payload)]
+
+
+def stream_reply(turn: ChatTurn, data: Dict[str, Any]):
+    """SSE generator: `chunk` events as text arrives, then one `done` event."""
+    try:
+        for text in turn.chunks():
+            turn.add_chunk(text)
+            yield sse_event("chunk", {"text": text})
+        # The final, authoritative reply is the normalized plain text
+        yield sse_event("done", finish_turn(turn, stream=True))
     except Exception as e:
-        total_latency = round(time.time() - start_time, 3)
-        
-        # best-effort logging even if parsing failed
+        payload, status = fail_turn(data, e, turn.start_time, stream=True)
+        yield sse_event("error", dict(payload, status_code=status))
+
+
+async def astream_reply(turn: ChatTurn, data: Dict[str, Any]):
+    """`stream_reply` for the ASGI entrypoint."""
+    try:
+        async for text in turn.achunks():
+            turn.add_chunk(text)
+            yield sse_event("chunk", {"text": text})
+        payload = await asyncio.to_thread(finish_turn, turn, True)
+        yield sse_event("done", payload)
+    except Exception as e:
+        payload, status = fail_turn(data, e, turn.start_time, stream=True)
+        yield sse_event("error", dict(payload, status_code=status))
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# The ASGI stack (starlette, functions_framework.aio) is imported only by the
+# ASGI entrypoint, so the Flask target's cold start never pays for it
+_closing_streaming_response = None
+
+
+def closing_streaming_response(content, on_close: Callable[[], Awaitable[None]], **kwargs):
+    """
+    StreamingResponse that awaits `on_close` however sending ends: in full, or
+    cut off by a disconnect before or during the body (Starlette skips
+    `background` when the client has gone). The class is built on first use.
+    """
+    global _closing_streaming_response
+    if _closing_streaming_response is None:
+        from starlette.responses import StreamingResponse
+
+        class ClosingStreamingResponse(StreamingResponse):
+            def __init__(self, content, on_close, **kwargs):
+                super().__init__(content, **kwargs)
+                self.on_close = on_close
+
+            async def __call__(self, scope, receive, send) -> None:
+                try:
+                    await super().__call__(scope, receive, send)
+                finally:
+                    await self.on_close()
+
+        _closing_streaming_response = ClosingStreamingResponse
+    return _closing_streaming_response(content, on_close, **kwargs)
+
+
+def asgi_http(func):
+    """
+    `functions_framework.aio.http`, applied only when `func` is the target being
+    served (FUNCTION_TARGET, or the `--asgi` CLI, which loads the aio module
+    before this one); otherwise `func` is returned as it is.
+    """
+    if os.getenv("FUNCTION_TARGET") == func.__name__ or "functions_framework.aio" in sys.modules:
+        import functions_framework.aio
+
+        return functions_framework.aio.http(func)
+    return func
+
+
+def _decode_request(raw: bytes, content_encoding: Optional[str]) -> Dict[str, Any]:
+    if len(raw) > MAX_REQUEST_BYTES:
+        raise PayloadTooLarge(f"Request body is over the {MAX_REQUEST_BYTES} byte limit.")
+    return parse_json_object(decode_body(raw, content_encoding, MAX_DECODED_REQUEST_BYTES), json_loads)
+
+
+def read_json_body(req) -> Dict[str, Any]:
+    """Request JSON object (gzip bodies decoded), with size limits applied before parsing."""
+    check_length(req.content_length, MAX_REQUEST_BYTES)
+    return _decode_request(req.stream.read(MAX_REQUEST_BYTES + 1), req.headers.get("Content-Encoding"))
+
+
+async def aread_json_body(request) -> Dict[str, Any]:
+    """`read_json_body` for the ASGI entrypoint; stops reading once over the limit."""
+    length = request.headers.get("content-length")
+    check_length(int(length) if length and length.isdigit() else None, MAX_REQUEST_BYTES)
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_REQUEST_BYTES:
+            raise PayloadTooLarge(f"Request body is over the {MAX_REQUEST_BYTES} byte limit.")
+        chunks.append(chunk)
+    return _decode_request(b"".join(chunks), request.headers.get("content-encoding"))
+
+
+def body_error(e: Exception) -> Tuple[Dict[str, Any], int]:
+    """(payload, status) for a request body that could not be read."""
+    status = 413 if isinstance(e, PayloadTooLarge) else 415 if isinstance(e, UnsupportedEncoding) else 400
+    return {"error": str(e), "status_code": status}, status
+
+
+def encode_json(payload: Dict[str, Any], accept_encoding: Optional[str]) -> Tuple[bytes, Dict[str, str]]:
+    """JSON body (compressed when the client accepts it) and its encoding headers."""
+    return encode_body(json_dumps(payload), accept_encoding, RESPONSE_GZIP_MIN_BYTES, RESPONSE_GZIP_LEVEL)
+
+
+def json_response(req, payload: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None) -> Response:
+    body, encoding_headers = encode_json(payload, req.headers.get("Accept-Encoding"))
+    return Response(
+        body, status=status, mimetype="application/json", headers={**(headers or {}), **encoding_headers}
+    )
+
+
+def ajson_response(request, payload: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None):
+    from starlette.responses import Response as StarletteResponse
+
+    body, encoding_headers = encode_json(payload, request.headers.get("accept-encoding"))
+    return StarletteResponse(
+        body, status_code=status, media_type="application/json", headers={**(headers or {}), **encoding_headers}
+    )
+
+
+# -----------------------------
+# HTTP Entrypoints
+# -----------------------------
+@functions_framework.http
+def app(request):
+    """Sync (Flask) entrypoint: one worker thread per in-flight request."""
+    start_time = time.time()
+    try:
+        data = read_json_body(request)
+    except (PayloadTooLarge, UnsupportedEncoding, InvalidBody) as e:
+        payload, status = body_error(e)
+        return json_response(request, payload, status)
+    try:
+        admission.check(admission_key(data.get("user_id"), client_address(request)))
+        turn = start_turn(data, start_time)
+        stream = wants_stream(request, data)
+
+        if turn.cached_reply is not None:
+            payload = cached_reply_payload(turn)
+            if stream:
+                return Response(
+                    cached_reply_events(payload), mimetype="text/event-stream", headers=SSE_HEADERS
+                )
+            return json_response(request, payload, 200, turn.headers())
+
+        # Share an identical in-flight generation, or wait (bounded) for a slot
+        generation_slot(turn)
+
+        # Streaming mode: forward chunks to the client as they arrive; the
+        # slot goes back when the response is closed, even if never read
+        if stream:
+            response = Response(
+                stream_with_context(stream_reply(turn, data)),
+                mimetype="text/event-stream",
+                headers=SSE_HEADERS,
+            )
+            response.call_on_close(turn.close)
+            return response
+
+        # Generate (streaming upstream, collected into one JSON reply)
         try:
-            body = request.get_json(silent=True) or {}
-            uid = body.get("user_id", "unknown")
-            tid = body.get("thread_id", "unknown")
-        except Exception:
-            uid, tid = "unknown", "unknown"
+            for text in turn.chunks():
+                turn.add_chunk(text)
+        finally:
+            turn.close()
+        return json_response(request, finish_turn(turn), 200, turn.headers())
 
-        logger.log_struct(
-            {
-                "event": "assistant_error",
-                "user_id": uid,
-                "thread_id": tid,
-                "error": str(e),
-                "total_latency": total_latency,
-            },
-            severity="ERROR",
-        )
-        return jsonify({"error": str(e), "total_latency": total_latency}), 500
+    except BadRequest as e:
+        return json_response(request, {"error": str(e)}, 400)
+    except AdmissionRejected as e:
+        return json_response(request, *reject_turn(data, e, start_time))
+    except Exception as e:
+        payload, status = fail_turn(data, e, start_time)
+        return json_response(request, payload, status)
+
+
+@asgi_http
+async def app_async(request):
+    """
+    ASGI entrypoint with the same request/response contract as `app`, for
+    `functions-framework --target app_async --asgi`. The model call runs on the
+    google-genai async client, so one instance serves many concurrent
+    conversations without a thread per request; the short blocking steps
+    (thread store, context cache lookup, reply bookkeeping) run in a thread.
+    """
+    start_time = time.time()
+    try:
+        data = await aread_json_body(request)
+    except (PayloadTooLarge, UnsupportedEncoding, InvalidBody) as e:
+        payload, status = body_error(e)
+        return ajson_response(request, payload, status)
+    try:
+        admission.check(admission_key(data.get("user_id"), client_address(request)))
+        turn = await asyncio.to_thread(start_turn, data, start_time)
+        stream = wants_stream(request, data)
+
+        if turn.cached_reply is not None:
+            payload = cached_reply_payload(turn)
+            if stream:
+                from starlette.responses import StreamingResponse
+
+                return StreamingResponse(
+                    iter(cached_reply_events(payload)),
+                    media_type="text/event-stream",
+                    headers=SSE_HEADERS,
+                )
+            return ajson_response(request, payload, headers=turn.headers())
+
+        await ageneration_slot(turn)
+
+        if stream:
+            return closing_streaming_response(
+                astream_reply(turn, data), turn.aclose, media_type="text/event-stream", headers=SSE_HEADERS
+            )
+
+        try:
+            async for text in turn.achunks():
+                turn.add_chunk(text)
+        finally:
+            await turn.aclose()
+        payload = await asyncio.to_thread(finish_turn, turn)
+        return ajson_response(request, payload, headers=turn.headers())
+
+    except BadRequest as e:
+        return ajson_response(request, {"error": str(e)}, 400)
+    except AdmissionRejected as e:
+        return ajson_response(request, *reject_turn(data, e, start_time))
+    except Exception as e:
+        payload, status = fail_turn(data, e, start_time)
+        return ajson_response(request, payload, status)
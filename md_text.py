@@ -0,0 +1,216 @@
+# md_text.py
+"""
+Markdown → plain text in one linear pass, for the subset Gemini emits:
+emphasis, inline code and fenced code, links/images/autolinks, headings,
+bullet and numbered lists, blockquotes, horizontal rules, hard breaks and
+inline HTML tags (`<br>` becomes a line break, other tags are dropped).
+Lookahead for a closing `)`, `>` or backtick run never rescans text already
+searched, and each emphasis closer finds its opener without walking the
+stack of unrelated ones.
+
+Output semantics match the old markdown → HTML → parser path (formatting
+markers removed, text and line structure kept, list markers dropped) without
+that path's artifacts: emphasized words are no longer split onto their own
+lines and runs of blank lines collapse to a single blank line.
+"""
+import html
+import re
+from collections import deque
+from typing import Dict, List
+
+_FENCE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}(?:\s+|$)")
+_HEADING_TAIL = re.compile(r"\s+#+\s*$")
+_HR = re.compile(r"^\s{0,3}([-*_])(?:\s*\1){2,}\s*$")
+_QUOTE = re.compile(r"^\s{0,3}(?:>\s?)+")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d{1,9}[.)])\s+")
+_TAG = re.compile(r"</?([A-Za-z][A-Za-z0-9-]*)(?:\s[^<>]*)?/?>")
+_TICKS = re.compile(r"`+")
+
+_ESCAPABLE = set("\\`*_{}[]()#+-.!>|~<&\"'")
+
+# Literal escape sequences the model sometimes emits as text
+_LITERAL_FIXES = (("\\u2019", "'"), ("\\u2014", "—"), ("\xa0", " "))
+
+
+def markdown_to_text(markdown_text: str) -> str:
+    lines: List[str] = []
+    blank_pending = False
+    fence = None
+
+    for raw in (markdown_text or "").split("\n"):
+        if fence is not None:
+            if raw.strip().startswith(fence):
+                fence = None
+            else:
+                lines.append(raw.rstrip())
+            continue
+
+        m = _FENCE.match(raw)
+        if m:
+            fence = m.group(1)
+            if lines:
+                blank_pending = True
+            continue
+
+        if not raw.strip() or _HR.match(raw):
+            if lines:
+                blank_pending = True
+            continue
+
+        line = raw
+        m = _QUOTE.match(line)
+        if m:
+            line = line[m.end():]
+        m = _HEADING.match(line)
+        if m:
+            line = _HEADING_TAIL.sub("", line[m.end():])
+            if lines:
+                blank_pending = True
+        else:
+            m = _LIST_ITEM.match(line)
+            if m:
+                line = line[m.end():]
+
+        text = _inline_to_text(line.strip())
+        if not text:
+            continue
+        if blank_pending:
+            lines.append("")
+            blank_pending = False
+        lines.append(text)
+
+    out = "\n".join(lines)
+    if "&" in out:
+        out = html.unescape(out)
+    for old, new in _LITERAL_FIXES:
+        if old in out:
+            out = out.replace(old, new)
+    return out.strip()
+
+
+class _NextAfter:
+    """Next position of `char` at or after a point, for points that only move forward."""
+
+    def __init__(self, s: str, char: str):
+        self.s = s
+        self.char = char
+        self.at = None
+
+    def find(self, start: int) -> int:
+        if self.at is None or (self.at != -1 and self.at < start):
+            self.at = self.s.find(self.char, start)
+        return self.at
+
+
+def _inline_to_text(s: str) -> str:
+    """Strip inline markup from one line; unmatched markers are kept literally."""
+    parts: List[str] = []
+    delims: List[tuple] = []  # (char, run length, index in parts)
+    openers: Dict[tuple, List[tuple]] = {}  # (char, run length) → (index in delims, index in parts)
+    brackets: List[int] = []  # index in parts of an open "[" / "!["
+    paren, angle = _NextAfter(s, ")"), _NextAfter(s, ">")
+    # Backtick runs by length, for the closer of a code span
+    tick_runs: Dict[int, deque] = {}
+    if "`" in s:
+        for m in _TICKS.finditer(s):
+            tick_runs.setdefault(len(m.group()), deque()).append(m.start())
+    n = len(s)
+    i = 0
+    while i < n:
+        c = s[i]
+
+        if c == "\\" and i + 1 < n and s[i + 1] in _ESCAPABLE:
+            parts.append(s[i + 1])
+            i += 2
+            continue
+
+        if c == "`":
+            j = i
+            while j < n and s[j] == "`":
+                j += 1
+            runs = tick_runs.get(j - i)
+            while runs and runs[0] < j:
+                runs.popleft()
+            if not runs:
+                parts.append(s[i:j])
+                i = j
+            else:
+                end = runs.popleft()
+                parts.append(s[j:end].strip())
+                i = end + j - i
+            continue
+
+        if c == "*" or c == "_":
+            j = i
+            while j < n and s[j] == c:
+                j += 1
+            run = j - i
+            prev = s[i - 1] if i > 0 else " "
+            nxt = s[j] if j < n else " "
+            can_open = not nxt.isspace()
+            can_close = not prev.isspace()
+            if c == "_":
+                # snake_case, emails etc. never take part in emphasis
+                can_open = can_open and not prev.isalnum()
+                can_close = can_close and not nxt.isalnum()
+            matched = False
+            if can_close:
+                stack = openers.get((c, run))
+                while stack:
+                    k, index = stack.pop()
+                    # Skip openers already dropped with an enclosing match
+                    if k < len(delims) and delims[k][2] == index:
+                        parts[index] = ""
+                        del delims[k:]
+                        matched = True
+                        break
+            if not matched:
+                parts.append(s[i:j])
+                if can_open:
+                    delims.append((c, run, len(parts) - 1))
+                    openers.setdefault((c, run), []).append((len(delims) - 1, len(parts) - 1))
+            i = j
+            continue
+
+        if c == "!" and i + 1 < n and s[i + 1] == "[":
+            brackets.append(len(parts))
+            parts.append("![")
+            i += 2
+            continue
+
+        if c == "[":
+            brackets.append(len(parts))
+            parts.append("[")
+            i += 1
+            continue
+
+        if c == "]" and brackets and i + 1 < n and s[i + 1] == "(":
+            end = paren.find(i + 2)
+            if end != -1:
+                parts[brackets.pop()] = ""
+                i = end + 1
+                continue
+
+        if c == "<":
+            if s.startswith(("<http://", "<https://", "<mailto:"), i):
+                end = angle.find(i + 1)
+                target = s[i + 1:end] if end != -1 else ""
+                if target and " " not in target:
+                    parts.append(target[7:] if target.startswith("mailto:") else target)
+                    i = end + 1
+                    continue
+            m = _TAG.match(s, i)
+            if m:
+                if m.group(1).lower() == "br":
+                    parts.append("\n")
+                i = m.end()
+                continue
+
+        parts.append(c)
+        i += 1
+
+    text = "".join(parts)
+    if "\n" in text:
+        return "\n".join(piece.strip() for piece in text.split("\n")).strip()
+    return text.strip()
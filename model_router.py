@@ -0,0 +1,92 @@
+# model_router.py
+"""
+Per-turn model selection between a lite tier and the standard tier.
+
+Cheap, deterministic signals decide: the grounding route of the turn
+(greetings, acknowledgements and contact-collection turns need no search and
+little reasoning), whether the turn needs grounding at all, conversation and
+message length, and the lite model's recent time-to-first-chunk (samples
+expire after `lite_window_seconds`, so a lite tier marked slow gets turns
+again once its slow samples have aged out). Anything
+the lite tier is not clearly suited for goes to the standard tier, which is
+also the fallback when a lite call fails.
+"""
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+from generation import LatencyWindow
+
+LITE = "lite"
+STANDARD = "standard"
+
+# Grounding routes (sophia_prompt.route_grounding) the lite tier may answer
+LITE_ROUTES = ("greeting", "acknowledgement", "contact_info")
+
+
+def parse_tiers(spec: str) -> Dict[str, str]:
+    """"lite=gemini-2.5-flash-lite,standard=gemini-2.5-flash" → {"lite": ..., "standard": ...}."""
+    tiers = {}
+    for item in (spec or "").split(","):
+        name, sep, model = item.partition("=")
+        if sep and name.strip() and model.strip():
+            tiers[name.strip()] = model.strip()
+    return tiers
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        tiers: Dict[str, str],
+        enabled: bool = True,
+        lite_routes: Sequence[str] = LITE_ROUTES,
+        max_history: int = 12,
+        max_message_chars: int = 200,
+        max_lite_p95_seconds: float = None,
+        lite_window_seconds: float = 300.0,
+        clock=time.monotonic,
+    ):
+        if STANDARD not in tiers:
+            raise ValueError(f"model tiers need a '{STANDARD}' entry: {tiers}")
+        self.tiers = dict(tiers)
+        self.enabled = enabled and LITE in self.tiers
+        self.lite_routes = tuple(lite_routes)
+        self.max_history = max_history
+        self.max_message_chars = max_message_chars
+        self.max_lite_p95_seconds = max_lite_p95_seconds
+        self._ttft: Dict[str, LatencyWindow] = {
+            model: LatencyWindow(max_age=lite_window_seconds, clock=clock) for model in self.tiers.values()
+        }
+
+    @property
+    def fallback_model(self) -> str:
+        return self.tiers[STANDARD]
+
+    def choose(
+        self,
+        history: List[Dict[str, Any]],
+        user_query: str,
+        needs_grounding: bool,
+        route_reason: str,
+    ) -> Tuple[str, str]:
+        """(model, reason) for this turn."""
+        standard = self.tiers[STANDARD]
+        if not self.enabled:
+            return standard, "routing_disabled"
+        if needs_grounding or route_reason not in self.lite_routes:
+            return standard, "needs_grounding" if needs_grounding else route_reason
+        if len(history or []) > self.max_history:
+            return standard, "long_history"
+        if len(user_query or "") > self.max_message_chars:
+            return standard, "long_message"
+        lite = self.tiers[LITE]
+        if self.max_lite_p95_seconds is not None:
+            p95 = self._ttft[lite].quantile(0.95)
+            if p95 is not None and p95 > self.max_lite_p95_seconds:
+                return standard, "lite_slow"
+        return lite, route_reason
+
+    def observe(self, model: str, ttft_seconds: float) -> None:
+        """Record a time-to-first-chunk sample for `model`."""
+        window = self._ttft.get(model)
+        if window is not None:
+            window.add(ttft_seconds)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Report import-time cost of the function entrypoint, per module.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and
+summarizes the output, so cold-start import time can be tracked as a number.
+
+Usage:
+    python profile_imports.py                 # top 25 modules for `import main`
+    python profile_imports.py --module sophia_prompt --top 10
+    python profile_imports.py --json imports.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+
+def profile(module: str) -> Dict[str, object]:
+    """Import `module` in a clean interpreter and return per-module timings (ms)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    modules: List[Dict[str, object]] = []
+    packages: Dict[str, float] = defaultdict(float)
+    target_ms = 0.0
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] |   cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = _split(line)
+        # Names are indented by two spaces per nesting level after one separator space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules.append(
+            {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000, "depth": depth}
+        )
+        packages[name.split(".")[0]] += self_us / 1000
+        if name == module:
+            target_ms = cumulative_us / 1000
+
+    return {
+        "module": module,
+        "import_ms": round(target_ms, 1),
+        "process_wall_ms": round(wall_ms, 1),
+        "by_top_level_package_ms": {
+            k: round(v, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])
+        },
+        "modules": modules,
+    }
+
+
+def _split(line: str):
+    body = line[len("import time:"):]
+    self_part, cumulative_part, name = body.split("|", 2)
+    return int(self_part), int(cumulative_part), name.rstrip()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="rows to print")
+    parser.add_argument("--json", dest="json_path", help="also write the full report here")
+    args = parser.parse_args()
+
+    report = profile(args.module)
+    print(f"import {report['module']}: {report['import_ms']:.1f} ms "
+          f"(interpreter + import wall time {report['process_wall_ms']:.1f} ms)\n")
+
+    print("By top-level package (self time):")
+    for name, ms in list(report["by_top_level_package_ms"].items())[: args.top]:
+        print(f"  {ms:9.1f} ms  {name}")
+
+    print("\nSlowest direct imports of the target (cumulative):")
+    direct = [m for m in report["modules"] if m["depth"] == 1]
+    for m in sorted(direct, key=lambda m: -m["cumulative_ms"])[: args.top]:
+        print(f"  {m['cumulative_ms']:9.1f} ms  {m['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nFull report written to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
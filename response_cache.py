@@ -0,0 +1,107 @@
+# response_cache.py
+"""
+Response cache for repeated openers and FAQ-style first turns.
+
+Keys combine the normalized query, the turns so far, detected language,
+campus context, model and the current date, so cached answers never outlive
+the schedules they were generated from. The backend is pluggable: the
+in-process LRU + TTL cache below is the default; a shared store only needs to
+implement `ResponseCacheBackend`.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from sophia_prompt import current_date, detect_campuses, detect_language
+
+_PUNCT = re.compile(r"[^\w\s$]+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace ("Hi!!" == "hi")."""
+    return _SPACES.sub(" ", _PUNCT.sub(" ", (text or "").lower())).strip()
+
+
+def is_cacheable(history: List[Dict[str, Any]], max_history: int) -> bool:
+    """Only first turns and near-empty conversations are worth caching."""
+    return len(history or []) <= max_history
+
+
+def build_cache_key(
+    message: str, history: List[Dict[str, Any]], model: str, on: date = None
+) -> str:
+    # Both sides of the history: "yes" means something different after each question
+    turns = [
+        f"{(item.get('role') or '').strip().lower()}:{normalize_query(item.get('text'))}"
+        for item in history or []
+        if isinstance(item, dict)
+    ]
+    parts = [
+        (on or current_date()).isoformat(),
+        model,
+        detect_language(history, message),
+        ",".join(detect_campuses(history, message)),
+        "\x1f".join(turns),
+        normalize_query(message),
+    ]
+    return hashlib.sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCacheBackend:
+    """Interface for response cache stores."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class InMemoryResponseCache(ResponseCacheBackend):
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._counters["misses"] += 1
+                return None
+            value, expires_at = item
+            if expires_at <= now:
+                del self._data[key]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl_seconds)
+            self._data.move_to_end(key)
+            self._counters["sets"] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, size=len(self._data))
@@ -0,0 +1,225 @@
+# retrieval.py
+"""
+Explicit Vertex AI Search retrieval stage.
+
+`Retriever.retrieve(query, conversation_stage)` returns the top snippets and
+their sources for a user message, so retrieval can be timed, cached and run
+alongside prompt assembly instead of happening inside the model call.
+Results are cached per normalized query with a TTL. The backend is pluggable:
+`VertexSearchBackend` calls the Discovery Engine search API and
+`FakeSearchBackend` ranks a local document list (tests, offline runs).
+"""
+import html
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from response_cache import normalize_query
+
+_TAGS = re.compile(r"<[^>]+>")
+_WORDS = re.compile(r"\w+", re.UNICODE)
+_NO_SNIPPET = "no snippet is available"
+
+DISCOVERY_ENGINE_ENDPOINT = "https://discoveryengine.googleapis.com/v1"
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    snippet: str
+    source: str
+    title: str = ""
+
+
+class SearchBackend:
+    """Interface for search backends."""
+
+    def search(self, query: str, page_size: int) -> List[SearchResult]:
+        raise NotImplementedError
+
+
+class VertexSearchBackend(SearchBackend):
+    """
+    Vertex AI Search (Discovery Engine) over REST with application default
+    credentials. The authorized session is created on first use and reused,
+    so connections stay warm between requests.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+        timeout: float = 3.0,
+        session_factory: Callable[[], Any] = None,
+        endpoint: str = DISCOVERY_ENGINE_ENDPOINT,
+    ):
+        self.engine = engine
+        self.timeout = timeout
+        self.endpoint = endpoint
+        self._session_factory = session_factory or _authorized_session
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._session_factory()
+        return self._session
+
+    def search(self, query: str, page_size: int) -> List[SearchResult]:
+        resp = self._get_session().post(
+            f"{self.endpoint}/{self.engine}/servingConfigs/default_search:search",
+            json={
+                "query": query,
+                "pageSize": page_size,
+                "contentSearchSpec": {"snippetSpec": {"returnSnippet": True}},
+            },
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return parse_search_response(resp.json())
+
+
+def _authorized_session():
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+
+    credentials, _ = google.auth.default(
+        scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    )
+    return AuthorizedSession(credentials)
+
+
+def _clean_snippet(text: str) -> str:
+    return " ".join(html.unescape(_TAGS.sub("", text or "")).split())
+
+
+def parse_search_response(body: Dict[str, Any]) -> List[SearchResult]:
+    """Website-search results: one SearchResult per document with a usable snippet."""
+    results: List[SearchResult] = []
+    for item in body.get("results") or []:
+        data = (item.get("document") or {}).get("derivedStructData") or {}
+        snippets = [
+            _clean_snippet(s.get("snippet"))
+            for s in data.get("snippets") or []
+            if s.get("snippet") and _NO_SNIPPET not in s.get("snippet", "").lower()
+        ]
+        snippets = [s for s in snippets if s]
+        if not snippets:
+            continue
+        results.append(
+            SearchResult(
+                snippet=" … ".join(snippets),
+                source=data.get("link") or item.get("id", ""),
+                title=_clean_snippet(data.get("title")),
+            )
+        )
+    return results
+
+
+class FakeSearchBackend(SearchBackend):
+    """Ranks local documents by word overlap with the query."""
+
+    def __init__(self, documents: Sequence[SearchResult], latency: float = 0.0):
+        self.documents = list(documents)
+        self.latency = latency
+        self.calls: List[str] = []
+        self._words = [set(_WORDS.findall(f"{d.title} {d.snippet}".lower())) for d in self.documents]
+
+    def search(self, query: str, page_size: int) -> List[SearchResult]:
+        self.calls.append(query)
+        if self.latency:
+            time.sleep(self.latency)
+        terms = set(_WORDS.findall(query.lower()))
+        scored = [
+            (len(terms & words), i) for i, words in enumerate(self._words) if terms & words
+        ]
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [self.documents[i] for _, i in scored[:page_size]]
+
+
+class Retriever:
+    def __init__(
+        self,
+        backend: SearchBackend,
+        cache: Any = None,
+        max_snippets: int = 3,
+        max_snippets_by_stage: Optional[Dict[str, int]] = None,
+        max_snippet_chars: int = 600,
+        retry_after_seconds: float = 30.0,
+        clock=time.monotonic,
+    ):
+        # `cache` is any get/set store, e.g. response_cache.InMemoryResponseCache
+        self.backend = backend
+        self.cache = cache
+        self.max_snippets = max_snippets
+        self.max_snippets_by_stage = max_snippets_by_stage or {}
+        self.max_snippet_chars = max_snippet_chars
+        # After a failed search the backend is skipped for a while, so an
+        # outage or missing credentials never adds latency to every request
+        self.retry_after_seconds = retry_after_seconds
+        self._clock = clock
+        self._failed_until = 0.0
+        self._page_size = max([max_snippets, *self.max_snippets_by_stage.values()])
+        self._lock = threading.Lock()
+        self.stats = {
+            "searches": 0,
+            "cache_hits": 0,
+            "errors": 0,
+            "skipped": 0,
+            "search_seconds": 0.0,
+        }
+
+    def _count(self, name: str, n=1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def retrieve(self, query: str, conversation_stage: str = "active") -> Tuple[List[str], List[str]]:
+        """Top snippets and their (deduplicated) source URLs for `query`."""
+        limit = self.max_snippets_by_stage.get(conversation_stage, self.max_snippets)
+        key = normalize_query(query)
+        if limit <= 0 or not key:
+            return [], []
+
+        results = self.cache.get(key) if self.cache is not None else None
+        if results is not None:
+            self._count("cache_hits")
+        else:
+            if self._clock() < self._failed_until:
+                self._count("skipped")
+                raise SearchUnavailable("search backend failed recently")
+            started = time.perf_counter()
+            try:
+                results = self.backend.search(query, self._page_size)
+            except Exception:
+                self._count("errors")
+                self._failed_until = self._clock() + self.retry_after_seconds
+                raise
+            finally:
+                self._count("search_seconds", time.perf_counter() - started)
+            self._count("searches")
+            if self.cache is not None:
+                self.cache.set(key, results)
+
+        snippets: List[str] = []
+        sources: List[str] = []
+        for result in results[:limit]:
+            snippets.append(result.snippet[: self.max_snippet_chars])
+            if result.source and result.source not in sources:
+                sources.append(result.source)
+        return snippets, sources
+
+
+def format_snippets(snippets: List[str], sources: List[str]) -> str:
+    """Reference block placed before the user's message in the current turn."""
+    lines = ["Reference material from the Christine Valmy website (use only if relevant):"]
+    for i, snippet in enumerate(snippets, 1):
+        lines.append(f"[{i}] {snippet}")
+    if sources:
+        lines.append("Sources: " + ", ".join(sources))
+    return "\n".join(lines)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Replay recorded conversations and score every assistant reply against the
+prompt's Final Validation Checklist (see compliance.py).
+
+Input is streamed JSONL, so dumps with millions of turns never have to fit in
+memory. Accepted lines:
+    {"history": [{"role", "text"}, ...], "date"?}       a whole conversation
+    {"message", "response", "history"?, "latency"?}     one turn (batch_eval output)
+    Cloud Logging exports of user_message / assistant_reply events, either
+    bare or wrapped in {"jsonPayload": ..., "timestamp": ...}; each reply is
+    paired with the last user message seen on its thread
+
+Lines are grouped into batches and scored in a process pool, with a bounded
+number of batches in flight. The report has per-rule pass rates, violation
+counts with a few examples, and word-count / latency percentiles; --violations
+writes every failing turn as JSONL.
+
+Usage:
+    python score_compliance.py dump.jsonl > report.json
+    python score_compliance.py logs.jsonl -j 8 --violations bad.jsonl
+    python batch_eval.py items.jsonl --local | python score_compliance.py -
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from compliance import RULES, score_reply
+
+MAX_EXAMPLES = 5
+
+
+def _as_of(value: Any, default: date) -> date:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return default
+
+
+def iter_turns(record: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """One {id, reply, message, history, latency, date} per assistant reply in `record`."""
+    if "response" in record or "reply" in record:
+        yield {
+            "id": record.get("id"),
+            "reply": record.get("response") or record.get("reply") or "",
+            "message": record.get("message") or "",
+            "history": record.get("history") or [],
+            "latency": record.get("latency", record.get("total_latency")),
+            "date": record.get("date"),
+        }
+        return
+    history = record.get("history") or []
+    for i, item in enumerate(history):
+        if (item.get("role") or "").lower() not in ("assistant", "model"):
+            continue
+        # The user turn this reply answers, and everything before it
+        j = i - 1
+        while j >= 0 and (history[j].get("role") or "").lower() != "user":
+            j -= 1
+        yield {
+            "id": f"{record.get('id', '')}#{i}",
+            "reply": item.get("text") or "",
+            "message": (history[j].get("text") or "") if j >= 0 else "",
+            "history": history[:max(j, 0)],
+            "latency": item.get("latency"),
+            "date": record.get("date"),
+        }
+
+
+def score_batch(records: List[Dict[str, Any]], default_date: str) -> List[Dict[str, Any]]:
+    """Process-pool task: score every reply in `records`."""
+    default = date.fromisoformat(default_date)
+    results = []
+    for record in records:
+        for turn in iter_turns(record):
+            scored = score_reply(
+                turn["reply"], turn["message"], turn["history"], _as_of(turn["date"], default)
+            )
+            scored["id"] = turn["id"]
+            scored["latency"] = turn["latency"]
+            if scored["violations"]:
+                scored["reply"] = turn["reply"]
+                scored["message"] = turn["message"]
+            results.append(scored)
+    return results
+
+
+class LogPairer:
+    """
+    Turns a stream of user_message / assistant_reply log events into turn
+    records. Only the last user message per thread is kept, in a bounded LRU.
+    """
+
+    def __init__(self, max_threads: int = 100_000):
+        self.max_threads = max_threads
+        self._last_user: "OrderedDict[tuple, str]" = OrderedDict()
+
+    def feed(self, line: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        payload = line.get("jsonPayload") or line
+        event = payload.get("event")
+        if event not in ("user_message", "assistant_reply"):
+            return line if "jsonPayload" not in line else None
+        key = (payload.get("user_id"), payload.get("thread_id"))
+        if event == "user_message":
+            self._last_user[key] = payload.get("message") or ""
+            self._last_user.move_to_end(key)
+            if len(self._last_user) > self.max_threads:
+                self._last_user.popitem(last=False)
+            return None
+        return {
+            "id": line.get("insertId") or f"{key[0]}/{key[1]}",
+            "response": payload.get("message") or "",
+            "message": self._last_user.pop(key, ""),
+            "latency": payload.get("total_latency"),
+            "date": line.get("timestamp") or payload.get("timestamp"),
+        }
+
+
+def read_records(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Parsed JSONL records; log events come out already paired into turns."""
+    pairer = LogPairer()
+    for line in stream:
+        if not line.strip():
+            continue
+        record = pairer.feed(json.loads(line))
+        if record is not None:
+            yield record
+
+
+def _percentiles(counts: Counter) -> Dict[str, Any]:
+    total = sum(counts.values())
+    if not total:
+        return {}
+    out = {}
+    targets = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+    seen = 0
+    ordered = sorted(counts.items())
+    for value, n in ordered:
+        seen += n
+        for name, q in targets.items():
+            if name not in out and seen >= q * total:
+                out[name] = value
+    out["max"] = ordered[-1][0]
+    return out
+
+
+class Report:
+    """Streaming aggregate: memory grows with distinct values, not with turns."""
+
+    def __init__(self, violations_out: TextIO = None):
+        self.turns = 0
+        self.compliant = 0
+        self.failures: Counter = Counter()
+        self.examples: Dict[str, List[Dict[str, Any]]] = {rule: [] for rule in RULES}
+        self.words: Counter = Counter()
+        # Latency bucketed to 10 ms, so percentiles need no list of samples
+        self.latency_ms: Counter = Counter()
+        self.violations_out = violations_out
+
+    def add(self, scored: Dict[str, Any]) -> None:
+        self.turns += 1
+        self.words[scored["words"]] += 1
+        if isinstance(scored.get("latency"), (int, float)):
+            self.latency_ms[int(scored["latency"] * 100) * 10] += 1
+        violations = scored["violations"]
+        if not violations:
+            self.compliant += 1
+            return
+        for rule, detail in violations.items():
+            self.failures[rule] += 1
+            if len(self.examples[rule]) < MAX_EXAMPLES:
+                self.examples[rule].append({"id": scored["id"], "detail": detail})
+        if self.violations_out is not None:
+            self.violations_out.write(
+                json.dumps(
+                    {k: scored.get(k) for k in ("id", "message", "reply", "violations")},
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        turns = self.turns or 1
+        return {
+            "turns": self.turns,
+            "compliant": self.compliant,
+            "compliance_rate": round(self.compliant / turns, 4),
+            "rules": {
+                rule: {
+                    "pass_rate": round(1 - self.failures[rule] / turns, 4),
+                    "violations": self.failures[rule],
+                    "examples": self.examples[rule],
+                }
+                for rule in RULES
+            },
+            "words": _percentiles(self.words),
+            "latency_ms": _percentiles(self.latency_ms),
+        }
+
+
+def _batches(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def score_stream(
+    records: Iterable[Dict[str, Any]],
+    report: Report,
+    workers: int = None,
+    batch_size: int = 500,
+    as_of: date = None,
+) -> Report:
+    """
+    Score `records` into `report`. `workers=0` scores in this process;
+    otherwise a process pool with at most 2 batches per worker in flight,
+    so reading stays only slightly ahead of scoring.
+    """
+    default_date = (as_of or date.today()).isoformat()
+    if workers == 0:
+        for batch in _batches(records, batch_size):
+            for scored in score_batch(batch, default_date):
+                report.add(scored)
+        return report
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in _batches(records, batch_size):
+            pending.add(pool.submit(score_batch, batch, default_date))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for scored in future.result():
+                        report.add(scored)
+        for future in pending:
+            for scored in future.result():
+                report.add(scored)
+    return report
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSONL dump, or - for stdin")
+    parser.add_argument("-j", "--workers", type=int, help="scoring processes (default: CPU count; 0 = inline)")
+    parser.add_argument("--batch-size", type=int, default=500, help="records per pool task")
+    parser.add_argument("--as-of", type=date.fromisoformat, help="date for records without one (default: today)")
+    parser.add_argument("--violations", help="write failing turns here as JSONL")
+    args = parser.parse_args()
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    bad = open(args.violations, "w", encoding="utf-8") if args.violations else None
+    started = time.perf_counter()
+    try:
+        report = score_stream(read_records(src), Report(bad), args.workers, args.batch_size, args.as_of)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if bad is not None:
+            bad.close()
+
+    summary = report.summary()
+    summary["wall_seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,214 @@
+# single_flight.py
+"""
+Single-flight coalescing of identical in-flight generations.
+
+When many prospects send the same first message at once (a campaign email
+going out), only the first request (the leader) calls the model; identical
+requests that arrive while it is generating (followers) subscribe to its
+chunks as they stream in and all receive the same reply, or the same error.
+A leader whose own client goes away keeps generating while anyone still
+follows; a follower that goes away stops counting.
+
+Requests are identical when they share the normalized message, the exact
+history (usually empty), the system prompt (its hash is the prompt version),
+the routed model and the date. A flight is forgotten as soon as it finishes;
+replies that outlive it are the response cache's job.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from generation import DeadlineExceeded, GenerationCancelled, GenerationError
+from response_cache import normalize_query
+from sophia_prompt import current_date
+
+
+def flight_key(
+    message: str, history: List[Dict[str, Any]], system_prompt: str, model: str, on: date = None
+) -> str:
+    turns = [
+        f"{(item.get('role') or '').strip().lower()}:{(item.get('text') or '').strip()}"
+        for item in history or []
+        if isinstance(item, dict)
+    ]
+    parts = [
+        (on or current_date()).isoformat(),
+        model,
+        hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest(),
+        normalize_query(message),
+        "\x1f".join(turns),
+    ]
+    return hashlib.sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+
+
+class SharedGenerationError(GenerationError):
+    """The leader's failure as seen by a follower; the original is its __cause__."""
+
+
+def _for_follower(error: BaseException) -> BaseException:
+    # A fresh exception per follower: raising one shared object from many
+    # threads would keep extending (and racing on) its traceback
+    if isinstance(error, GenerationError):
+        return type(error)(str(error))
+    return SharedGenerationError(str(error))
+
+
+class Flight:
+    """Chunks of one generation, readable by any number of threads or coroutines."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._wakers = []
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.model: Optional[str] = None
+        # Followers still reading, and every follower that joined
+        self.waiters = 0
+        self.followers = 0
+
+    def _notify(self) -> None:
+        # Called with the lock held
+        self._cond.notify_all()
+        wakers, self._wakers = self._wakers, []
+        for wake in wakers:
+            try:
+                wake()
+            except RuntimeError:  # the follower's event loop is gone
+                pass
+
+    def publish(self, text: str) -> None:
+        with self._cond:
+            self.chunks.append(text)
+            self._notify()
+
+    def finish(self, model: str = None, error: BaseException = None) -> None:
+        with self._cond:
+            self.done = True
+            self.model = model
+            self.error = error
+            self._notify()
+
+    def _read(self, start: int) -> Tuple[List[str], bool]:
+        # Called with the lock held: chunks after `start`, and whether that is all of them
+        return self.chunks[start:], self.done
+
+    def leave(self) -> None:
+        """A follower stops reading (`follow` does this itself once started)."""
+        with self._cond:
+            self.waiters -= 1
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise _for_follower(self.error) from self.error
+
+    def follow(self, timeout: float, follower: bool = True):
+        """
+        Yield every chunk (past and future); raises the leader's error. A
+        `follower` stops counting in `waiters` once it stops reading.
+        """
+        try:
+            deadline = time.monotonic() + timeout
+            seen = 0
+            while True:
+                with self._cond:
+                    new, done = self._read(seen)
+                    while not new and not done:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise DeadlineExceeded("Timed out waiting for a shared generation.")
+                        self._cond.wait(remaining)
+                        new, done = self._read(seen)
+                seen += len(new)
+                yield from new
+                if done:
+                    self._raise_error()
+                    return
+        finally:
+            if follower:
+                self.leave()
+
+    async def afollow(self, timeout: float, follower: bool = True):
+        """`follow` for async callers; waits without blocking the event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            seen = 0
+            while True:
+                with self._cond:
+                    new, done = self._read(seen)
+                    if not new and not done:
+                        future = loop.create_future()
+                        self._wakers.append(
+                            lambda: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+                        )
+                seen += len(new)
+                for text in new:
+                    yield text
+                if done:
+                    self._raise_error()
+                    return
+                if not new:
+                    try:
+                        await asyncio.wait_for(future, deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded("Timed out waiting for a shared generation.") from None
+        finally:
+            if follower:
+                self.leave()
+
+
+class SingleFlight:
+    """In-flight generations by key; the first caller for a key leads, the rest follow."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._counters = {"leaders": 0, "followers": 0, "saved_calls": 0, "failed_flights": 0, "peak_waiters": 0}
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """(flight, is_leader) for `key`."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self._counters["leaders"] += 1
+                return flight, True
+            # waiters changes under the flight's lock too: followers leave through it
+            with flight._cond:
+                flight.waiters += 1
+                flight.followers += 1
+            self._counters["followers"] += 1
+            self._counters["peak_waiters"] = max(self._counters["peak_waiters"], flight.waiters)
+            return flight, False
+
+    def finish(self, key: str, flight: Flight, model: str = None, error: BaseException = None) -> None:
+        """End the leader's flight; later requests for `key` start a new one."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is None:
+                self._counters["saved_calls"] += flight.followers
+            else:
+                self._counters["failed_flights"] += 1
+        flight.finish(model, error)
+
+    def abandon(self, key: str, flight: Flight) -> bool:
+        """
+        Cancel the leader's flight if nobody follows it (True); False when it has
+        followers, so the generation should run on for them.
+        """
+        with self._lock, flight._cond:
+            if flight.waiters:
+                return False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error=GenerationCancelled("The request sharing this reply was cancelled."))
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._flights))
@@ -1,11 +1,15 @@
 import re
-import time
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
 from typing import List, Dict, Any, Tuple
 
+from course_data import CAMPUS_NJ, CAMPUS_NY, render_pricing, render_schedule
+
+
 # ---------- Dates ----------
-today = time.strftime("%Y-%m-%d")
-TODAY_DT = datetime.strptime(today, "%Y-%m-%d")
+def current_date() -> date:
+    """Today's date, evaluated per call so warm instances roll over at midnight."""
+    return date.today()
 
 
 def get_system_prompt_for_request(
@@ -15,19 +19,302 @@ def get_system_prompt_for_request(
 ) -> str:
     """
     Generate the system prompt for the AI assistant.
-    
+
+    Only the sections the current turn needs are included: schedules when the
+    user shows program/schedule interest, pricing only when cost is asked
+    about, and campus-specific data only for the campus named in the
+    conversation (both campuses when none is named yet).
+
     Args:
         request_data: Optional request data (currently unused but kept for compatibility)
         history: Optional conversation history
         **kwargs: Additional arguments like user_query
-    
+
     Returns:
         str: The formatted system prompt with current date
     """
-    return SYSTEM_PROMPT.replace("{today}", today)
-
-
-SYSTEM_PROMPT= """
+    user_query = kwargs.get("user_query") or ""
+    sections = select_prompt_sections(history or [], user_query)
+    return render_system_prompt(sections, current_date())
+
+
+# ---------- Section routing ----------
+
+_NY_PATTERN = re.compile(
+    r"\b(new york|ny|nyc|manhattan|broadway|esthetics?|aesthetics?|nails?|nail tech"
+    r"|waxing|makeup|make up|make-up|cidesco|estética|uñas|maquillaje)\b",
+    re.IGNORECASE,
+)
+_NJ_PATTERN = re.compile(
+    r"\b(new jersey|nj|wayne|barber(?:ing)?|barbería|skin ?care|manicure|manicura"
+    r"|teach(?:er|ing) training|instructor|cosmetology|cosmetología|hair|hairstyling)\b",
+    re.IGNORECASE,
+)
+_PRICING_PATTERN = re.compile(
+    r"\b(price|prices|pricing|cost|costs|tuition|fee|fees|pay|payment|afford|how much"
+    r"|costo|precio|precios|cuánto|cuanto|cuesta|matrícula)\b|\$",
+    re.IGNORECASE,
+)
+_SCHEDULE_PATTERN = re.compile(
+    r"\b(schedule|schedules|start|starts|starting|date|dates|when|class|classes"
+    r"|course|courses|program|programs|part[ -]time|full[ -]time|evening|weekend"
+    r"|morning|horario|fecha|fechas|cuándo|cuando|curso|cursos|programa|programas"
+    r"|clases)\b",
+    re.IGNORECASE,
+)
+_ENROLLMENT_PATTERN = re.compile(
+    r"\b(enroll|enrolling|enrollment|sign me up|sign up|apply|application|register"
+    r"|ready|tour|visit|advisor|contact|call me|inscrib\w*|inscripción|matricular\w*)\b",
+    re.IGNORECASE,
+)
+_CONTACT_INFO_PATTERN = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.-]+|\+?\d[\d\s().-]{8,}\d"
+)
+_SPANISH_PATTERN = re.compile(
+    r"\b(hola|gracias|por favor|buenos|días|cómo|está|dónde|cuándo|cuánto|cuesta"
+    r"|precio|programa|curso|español|matrícula|inscripción|quiero|puedo|tienen)\b|[ñ¿¡]",
+    re.IGNORECASE,
+)
+
+# Whole-message patterns (matched against the normalized message) for turns
+# that carry no question to ground: openers and the completion signals from
+# the "Completion Stage" section
+_GREETING_ONLY = re.compile(
+    r"(?:(?:hi|hello|hey|hiya|howdy|hola|buenas|buenos dias|buenos días|buenas tardes"
+    r"|buenas noches|good morning|good afternoon|good evening|there|sophia)\s*)+"
+)
+_ACK_ONLY = re.compile(
+    r"(?:(?:thanks|thank you|thank u|thx|ty|ok|okay|k|great|perfect|cool|awesome|nice"
+    r"|got it|sounds good|that s correct|thats correct|that s all|that s it|correct"
+    r"|yes|yeah|yep|sure|no|nope|no thanks|bye|goodbye|see you|gracias|muchas gracias"
+    r"|perfecto|vale|claro|sí|si|adiós|adios|de nada|listo|bien)\s*)+"
+)
+# Acknowledgements that close the exchange rather than accept an offer
+_CLOSING = re.compile(
+    r"\b(?:thanks|thank you|thank u|thx|ty|no|nope|bye|goodbye|see you|that s all|that s it"
+    r"|gracias|adiós|adios|de nada)\b"
+)
+_NAME_INTRO = re.compile(r"^(?:my name is|my name's|this is|me llamo|mi nombre es)\s", re.IGNORECASE)
+_ASKED_FOR_CONTACT = re.compile(
+    r"\b(name|phone|number|email|e-mail|nombre|teléfono|telefono|correo)\b", re.IGNORECASE
+)
+_NON_WORD = re.compile(r"[^\w\s]+", re.UNICODE)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _history_texts(history: List[Dict[str, Any]], role: str = None) -> List[str]:
+    """Text of each history item, optionally filtered by role."""
+    texts = []
+    for item in history or []:
+        if not isinstance(item, dict):
+            continue
+        if role and (item.get("role") or "").strip().lower() != role:
+            continue
+        text = (item.get("text") or "").strip()
+        if text:
+            texts.append(text)
+    return texts
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", (text or "").lower()).split())
+
+
+def _is_affirmation(text: str) -> bool:
+    """A bare "yes / sure / ok" that accepts whatever the assistant just offered."""
+    normalized = _normalize(text)
+    return bool(normalized) and bool(_ACK_ONLY.fullmatch(normalized)) and not _CLOSING.search(normalized)
+
+
+def _offered_topic(history: List[Dict[str, Any]]) -> str:
+    """The last assistant turn, which gives a bare affirmation its meaning ("" if none)."""
+    assistant_turns = _history_texts(history, role="assistant")
+    return assistant_turns[-1] if assistant_turns else ""
+
+
+def detect_campuses(history: List[Dict[str, Any]], user_query: str) -> Tuple[str, ...]:
+    """
+    Campuses relevant to this turn. The current query wins; otherwise the most
+    recent turn that names a campus (or a campus-only program) decides.
+    An empty tuple means no campus has been named yet.
+    """
+    for text in [user_query] + list(reversed(_history_texts(history))):
+        campuses = tuple(
+            campus
+            for campus, pattern in ((CAMPUS_NY, _NY_PATTERN), (CAMPUS_NJ, _NJ_PATTERN))
+            if pattern.search(text or "")
+        )
+        if campuses:
+            return campuses
+    return ()
+
+
+def detect_language(history: List[Dict[str, Any]], user_query: str) -> str:
+    """"es" when the user has written Spanish anywhere in the conversation, else "en"."""
+    user_text = " ".join(_history_texts(history, role="user") + [user_query or ""])
+    return "es" if _SPANISH_PATTERN.search(user_text) else "en"
+
+
+def select_prompt_sections(
+    history: List[Dict[str, Any]], user_query: str
+) -> Dict[str, Any]:
+    """Decide which optional prompt sections this turn needs."""
+    user_turns = _history_texts(history, role="user")
+    # The previous user turn is included so short follow-ups
+    # ("and for NJ?") keep the topic of the question they follow; a bare "yes"
+    # takes its topic from the offer it accepts ("see the start dates?")
+    recent = " ".join([user_query] + user_turns[-1:])
+    if _is_affirmation(user_query):
+        recent += " " + _offered_topic(history)
+    all_user_text = " ".join(user_turns + [user_query])
+
+    campuses = detect_campuses(history, user_query)
+    return {
+        "campuses": campuses or (CAMPUS_NY, CAMPUS_NJ),
+        "schedules": bool(
+            _SCHEDULE_PATTERN.search(recent)
+            or _NY_PATTERN.search(user_query)
+            or _NJ_PATTERN.search(user_query)
+        ),
+        "pricing": bool(_PRICING_PATTERN.search(recent)),
+        "enrollment": bool(
+            _ENROLLMENT_PATTERN.search(recent)
+            or _PRICING_PATTERN.search(user_query)
+            or _CONTACT_INFO_PATTERN.search(all_user_text)
+        ),
+        "spanish": detect_language(history, user_query) == "es",
+    }
+
+
+def route_grounding(history: List[Dict[str, Any]], user_query: str) -> Tuple[bool, str]:
+    """
+    Whether this turn needs search grounding, with the reason for the decision.
+
+    Deterministic, following the prompt's Stage Detection Logic: turns that
+    name a program, campus, schedule or price (or ask a question) are grounded;
+    greetings, completion/acknowledgement signals and contact-collection turns
+    (name, email, phone) are answered from the prompt alone. A bare "yes / sure"
+    accepting an offer that names a topic ("see the upcoming start dates?") is
+    grounded as a follow-up.
+    """
+    text = (user_query or "").strip()
+    if (
+        _SCHEDULE_PATTERN.search(text)
+        or _PRICING_PATTERN.search(text)
+        or _NY_PATTERN.search(text)
+        or _NJ_PATTERN.search(text)
+    ):
+        return True, "topic"
+
+    if _CONTACT_INFO_PATTERN.search(text):
+        # A few words around an email/phone ("sure, it's 555-...") is still contact info
+        if len(_WORD.findall(_CONTACT_INFO_PATTERN.sub(" ", text))) <= 8 and "?" not in text:
+            return False, "contact_info"
+        return True, "default"
+
+    words = _WORD.findall(text)
+    if _NAME_INTRO.match(text) and len(words) <= 6 and "?" not in text:
+        return False, "contact_info"
+
+    normalized = _normalize(text)
+    if not normalized or _GREETING_ONLY.fullmatch(normalized):
+        return False, "greeting"
+    if _ACK_ONLY.fullmatch(normalized):
+        offered = _offered_topic(history) if _is_affirmation(text) else ""
+        if offered and (
+            _SCHEDULE_PATTERN.search(offered)
+            or _PRICING_PATTERN.search(offered)
+            or _NY_PATTERN.search(offered)
+            or _NJ_PATTERN.search(offered)
+        ):
+            return True, "follow_up"
+        return False, "acknowledgement"
+
+    # A bare name answering "what's your name?"
+    assistant_turns = _history_texts(history, role="assistant")
+    if (
+        assistant_turns
+        and _ASKED_FOR_CONTACT.search(assistant_turns[-1])
+        and len(words) <= 4
+        and "?" not in text
+    ):
+        return False, "contact_info"
+    return True, "default"
+
+
+def render_system_prompt(sections: Dict[str, Any], on: date) -> str:
+    """Assembled prompt for `on` with `{today}` filled in, cached per section mix and day."""
+    return _render_cached(
+        tuple(sections.get("campuses") or (CAMPUS_NY, CAMPUS_NJ)),
+        bool(sections.get("schedules")),
+        bool(sections.get("pricing")),
+        bool(sections.get("enrollment")),
+        bool(sections.get("spanish")),
+        on,
+    )
+
+
+@lru_cache(maxsize=128)
+def _render_cached(
+    campuses: Tuple[str, ...],
+    schedules: bool,
+    pricing: bool,
+    enrollment: bool,
+    spanish: bool,
+    on: date,
+) -> str:
+    sections = {
+        "campuses": campuses,
+        "schedules": schedules,
+        "pricing": pricing,
+        "enrollment": enrollment,
+        "spanish": spanish,
+    }
+    return assemble_system_prompt(sections, on).replace("{today}", on.isoformat())
+
+
+def assemble_system_prompt(sections: Dict[str, Any], on: date) -> str:
+    """Concatenate the selected sections in the original prompt order."""
+    campuses = sections.get("campuses") or (CAMPUS_NY, CAMPUS_NJ)
+    ny = CAMPUS_NY in campuses
+    nj = CAMPUS_NJ in campuses
+
+    parts = [CORE_IDENTITY, "## Program Location Mapping - CRITICAL\n\n\n"]
+    if ny:
+        parts.append(NY_PROGRAMS)
+    if nj:
+        parts.append(NJ_PROGRAMS)
+
+    if sections.get("schedules"):
+        parts.append("## Course Schedules\n\n\n")
+        if ny:
+            parts.append(render_schedule(CAMPUS_NY, on))
+        if nj:
+            parts.append(render_schedule(CAMPUS_NJ, on))
+
+    if sections.get("pricing"):
+        parts.append("## Pricing Information\n\n\n")
+        if ny:
+            parts.append(render_pricing(CAMPUS_NY))
+        if nj:
+            parts.append(render_pricing(CAMPUS_NJ))
+
+    parts += ["## Critical Enforcement Rules\n\n\n", CONTACT_POLICY]
+    if sections.get("pricing"):
+        parts.append(PRICING_RULES)
+    if sections.get("schedules"):
+        parts.append(SCHEDULE_RULES)
+    parts.append(MAKEUP_CLARIFICATION)
+    parts.append(LANGUAGE_RULES if sections.get("spanish") else LANGUAGE_DEFAULT)
+    parts.append(CONVERSATION_STAGES)
+    if sections.get("enrollment"):
+        parts.append(ENROLLMENT_COLLECTION)
+    parts += [RESPONSE_RULES, FLOW_MANAGEMENT, VALIDATION_CHECKLIST]
+    return "".join(parts)
+
+
+# ---------- Prompt sections ----------
+CORE_IDENTITY = """
 Date: {today}
 
 
@@ -71,10 +358,9 @@ Every conversation must end with either:
 - If there is a conflict, system rules ALWAYS win
 
 
-## Program Location Mapping - CRITICAL
-
+"""
 
-### NEW YORK ONLY PROGRAMS
+NY_PROGRAMS = """### NEW YORK ONLY PROGRAMS
 **Location**: '1501 Broadway Suite 700, New York, NY 10036'
 - Esthetics/Aesthetics
 - Nails/Nail Tech
@@ -83,7 +369,9 @@ Every conversation must end with either:
 - CIDESCO
 
 
-### NEW JERSEY ONLY PROGRAMS
+"""
+
+NJ_PROGRAMS = """### NEW JERSEY ONLY PROGRAMS
 **Location**: '201 Willowbrook Blvd 8th Floor, Wayne, NJ 07470'
 - Barbering/Barber
 - Skin Care/Skincare
@@ -92,278 +380,9 @@ Every conversation must end with either:
 - Cosmetology/Hair/Hairstyling
 
 
-## Course Schedules
-
-
-### New York Schedule Data (Year 2025)
-
-
-#### September 2025
-**Esthetics English:**
-- Monday and Tuesday: 9/8/2025 to 6/23/2026
-- Part Time Evening: 9/16/2025 to 7/7/2026
-- Wednesday, Thursday, Friday: 9/17/2025 to 7/10/2026
-- Full Time: 9/22/2025 to 1/30/2026
-
-
-**Nails English:**
-- Part Time Evening: 9/23/2025 to 1/28/2026
-- Monday and Tuesday: 9/29/2025 to 2/2/2026
-
-
-**Makeup English:**
-- Full Time Day: 9/1/2025 to 9/12/2025
-- Full Time Day: 9/16/2025 to 9/29/2025
-- Full Time Day: 9/30/2025 to 10/13/2025
-- Monday Tuesday: 9/2/2025 to 10/6/2025
-- Part Time Evening: 9/15/2025 to 10/20/2025
-- Part Time Weekend: 9/27/2025 to 10/26/2025
-
-
-**Makeup Spanish:**
-- Part Time: 9/16/2025 to 10/3/2025
-
-
-#### October 2025
-**Esthetics English:**
-- Part Time Weekend: 10/11/2025 to 7/19/2026
-- Full Time: 10/22/2025 to 3/4/2026
-
-
-**Nails English:**
-- Part Time Weekend: 10/11/2025 to 2/8/2026
-
-
-**Waxing English:**
-- Sunday: 10/5/2025 to 11/10/2025
-
-
-**Makeup English:**
-- Full Time Day: 10/16/2025 to 10/29/2025
-- Full Time Day: 10/30/2025 to 11/12/2025
-- Monday Tuesday: 10/7/2025 to 11/10/2025
-- Wednesday Thursday Friday: 10/15/2025 to 11/13/2025
-
-
-**Makeup Spanish:**
-- Part Time: 10/6/2025 to 10/23/2025
-
-
-#### November 2025
-**Esthetics English:**
-- Monday and Tuesday: 11/17/2025 to 9/1/2026
-
-
-**Esthetics Spanish:**
-- Part Time Spanish: 11/3/2025 to 5/4/2026
-
-
-**CIDESCO English:**
-- AE CIDESCO: 11/10/2025 to 12/16/2025
-
-
-**Makeup English:**
-- Full Time Day: 11/17/2025 to 12/2/2025
-- Monday Tuesday: 11/18/2025 to 12/22/2025
-- Wednesday Thursday Friday: 11/26/2025 to 1/2/2026
-- Part Time Weekend: 11/1/2025 to 11/30/2025
-
-
-#### December 2025
-**Esthetics English:**
-- Part Time Evening: 12/1/2025 to 9/21/2026
-- Full Time: 12/1/2025 to 4/10/2026
-- Wednesday Thursday Friday: 12/3/2025 to 9/23/2026
-
-
-**Nails English:**
-- Monday and Tuesday: 12/1/2025 to 4/7/2026
-- Part Time Evening: 12/1/2025 to 4/8/2026
-
-
-**Makeup English:**
-- Full Time Day: 12/3/2025 to 12/16/2025
-- Full Time Day: 12/18/2025 to 1/6/2026
-- Monday Tuesday: 12/23/2025 to 1/26/2026
-- Part Time Evening: 12/1/2025 to 1/6/2026
-- Part Time Weekend: 12/13/2025 to 1/11/2026
-
-
-**Makeup Spanish:**
-- Part Time: 12/15/2025 to 1/7/2026
-
-
-### New Jersey Schedule Data (Year 2025)
-
-
-#### September 2025
-**Teaching Training English:**
-- Part Time Evening: 9/8/2025 to 9/9/2026
-
-
-#### October 2025
-**Skin Care English:**
-- Full Time Day: 10/6/2025 to 2/13/2026
-- Part Time Day: 10/6/2025 to 4/23/2026
-- Part Time Evening: 10/6/2025 to 7/13/2026
-
-
-**Skin Care Spanish:**
-- Part Time Evening: 10/6/2025 to 7/13/2026
-
-
-**Manicure English:**
-- Full Time Mon-Thu: 10/6/2025 to 12/18/2025
-
-
-**Barbering English:**
-- Full Time Day: 10/6/2025 to 4/16/2026
-
-
-**Teaching Training English:**
-- Full Time Day: 10/6/2025 to 2/13/2026
-- Part Time Day: 10/6/2025 to 5/4/2026
-- Part Time Evening: 10/6/2025 to 10/7/2026
-
+"""
 
-#### November 2025
-**Skin Care English:**
-- Full Time Day: 11/3/2025 to 3/16/2026
-- Part Time Day: 11/3/2025 to 5/21/2026
-- Part Time Evening: 11/3/2025 to 8/10/2026
-
-
-**Skin Care Spanish:**
-- Part Time Evening: 11/3/2025 to 8/10/2026
-
-
-**Barbering English:**
-- Full Time Day: 11/3/2025 to 5/14/2026
-
-
-**Teaching Training English:**
-- Full Time Day: 11/3/2025 to 3/16/2026
-- Part Time Day: 11/3/2025 to 7/2/2026
-- Part Time Evening: 11/3/2025 to 11/4/2026
-
-
-**Cosmetology English:**
-- Full Time Day: 11/3/2025 to 7/17/2026
-- Part Time Evening: 11/3/2025 to 3/17/2027
-
-
-**Cosmetology Spanish:**
-- Part Time Evening: 11/3/2025 to 3/17/2027
-
-
-#### December 2025
-**Skin Care English:**
-- Full Time Day: 12/8/2025 to 4/16/2026
-- Part Time Day: 12/8/2025 to 6/25/2026
-- Part Time Evening: 12/8/2025 to 9/10/2026
-
-
-**Skin Care Spanish:**
-- Part Time Evening: 12/8/2025 to 9/10/2026
-
-
-**Barbering English:**
-- Full Time Day: 12/8/2025 to 6/17/2026
-
-
-**Teaching Training English:**
-- Full Time Day: 12/8/2025 to 4/16/2026
-- Part Time Day: 12/8/2025 to 7/7/2026
-- Part Time Evening: 12/8/2025 to 12/9/2026
-
-
-## Pricing Information
-
-
-### New York Pricing (2025)
-
-
-**Esthetics (Hybrid)** - 600 hours - $10,990
-- Registration: $100
-- Technology: $150
-- Educational Material: $350
-- Kits/Supplies: $500
-- Tuition: $9,890
-
-
-**Nails Specialty (Hybrid)** - 250 hours - $3,125
-- Registration: $100
-- Technology: $75
-- Educational Material: $200
-- Kits/Supplies: $350
-- Tuition: $2,400
-
-
-**CIDESCO Beauty Therapy RPL** - 75 hours - $2,775
-- Registration: $100
-- Technology: $75
-- Kits: $100
-- Tuition: $2,500-$2,700
-
-
-**Waxing (In-Person)** - 75 hours - $1,600
-- Registration: $100
-- Educational Material: $200
-- Tuition: $1,300
-
-
-**Nails + Waxing Bundle** - 325 hours - $4,625
-- Registration: $100
-- Technology: $75
-- Educational Material: $400
-- Kits/Supplies: $350
-- Tuition: $3,700
-
-
-**Basic & Advanced Makeup (In-Person)** - 70 hours - $1,600
-- Registration: $100
-- Educational Material: $200
-- Kits/Supplies: $150
-- Tuition: $1,200
-
-
-### New Jersey Pricing (2025)
-
-
-**Cosmetology & Hairstyling** - 1200 hours - $17,500
-- Registration: $100
-- Books/Kit: $975
-- Tuition: $16,425
-
-
-**Skin Care** - 600 hours - $13,000
-- Registration: $100
-- Books/Kit: $685
-- Tuition: $12,215
-
-
-**Barbering** - 900 hours - $14,900
-- Registration: $100
-- Books/Kit: $850
-- Tuition: $13,950
-
-
-**Manicure** - 300 hours - $4,700
-- Registration: $100
-- Books/Kit: $500
-- Tuition: $4,100
-
-
-**Teacher Training** - 600 hours - $6,995
-- Registration: $100
-- Books/Kit: $875
-- Tuition: $6020
-
-
-## Critical Enforcement Rules
-
-
-### 1. CONTACT POLICY - NEVER VIOLATED
+CONTACT_POLICY = """### 1. CONTACT POLICY - NEVER VIOLATED
 **When user asks for school contact information:**
 -  NEVER provide school phone numbers
 -  NEVER provide school email addresses
@@ -372,7 +391,9 @@ Every conversation must end with either:
 -  Collect user: Full name, Email address, Phone number
 
 
-### 2. PRICING RULES
+"""
+
+PRICING_RULES = """### 2. PRICING RULES
 - ONLY mention pricing if user explicitly asks using words: "price", "cost", "tuition", "fee", "costo", "precio", "cuánto"
 - If user has not asked about pricing, completely ignore any pricing information
 - When pricing is requested:
@@ -380,7 +401,9 @@ Every conversation must end with either:
  - NJ programs - Use NJ pricing only
 
 
-### 3. SCHEDULE DISPLAY FORMAT
+"""
+
+SCHEDULE_RULES = """### 3. SCHEDULE DISPLAY FORMAT
 **CORRECT Format:** "Course runs [Days] [Time], from [Start Date] to [End Date]"
 - Example: "Course runs Monday-Thursday 8am-6pm, from September 16th 2025 to June 23rd 2026"
 
@@ -391,19 +414,23 @@ Every conversation must end with either:
 
 
 ### 4. DATE VALIDATION
-- ONLY show dates AFTER today (2025-9-17)
+- ONLY show dates AFTER today ({today})
 - NEVER show past dates or {today} date
 - Show EXACTLY TWO upcoming future start dates maximum
 - Order dates from soonest to latest
 
 
-### 5. MAKEUP CLARIFICATION
+"""
+
+MAKEUP_CLARIFICATION = """### 5. MAKEUP CLARIFICATION
 When user mentions "makeup hours" or "make up hours":
 - FIRST clarify: "Are you asking about making up missed class hours due to absences? For attendance and makeup policies, I'd recommend speaking with our enrollment advisor."
 - If they mean the Makeup Program, then provide program information
 
 
-### 6. LANGUAGE DETECTION
+"""
+
+LANGUAGE_RULES = """### 6. LANGUAGE DETECTION
 Detect user language from these indicators:
 
 
@@ -416,7 +443,15 @@ Detect user language from these indicators:
 Respond in the detected language. Default to English if unclear.
 
 
-### 7. CONVERSATION STAGES
+"""
+
+LANGUAGE_DEFAULT = """### 6. LANGUAGE DETECTION
+Respond in the language the user writes in. Default to English if unclear.
+
+
+"""
+
+CONVERSATION_STAGES = """### 7. CONVERSATION STAGES
 
 
 Detect and respond according to these stages:
@@ -431,7 +466,9 @@ Detect and respond according to these stages:
 **Completion Stage:** User confirms completion ("no", "nope", "sounds good", "that's correct")
 
 
-### 8. ENROLLMENT COLLECTION PROCESS
+"""
+
+ENROLLMENT_COLLECTION = """### 8. ENROLLMENT COLLECTION PROCESS
 
 
 When user shows enrollment readiness:
@@ -452,7 +489,9 @@ When user shows enrollment readiness:
   - Best time to call
 
 
-### 9. RESPONSE RULES
+"""
+
+RESPONSE_RULES = """### 9. RESPONSE RULES
 - Keep responses under 75 words
 - End with ONE follow-up question (unless completing)
 - Never repeat identical information from conversation history
@@ -460,7 +499,9 @@ When user shows enrollment readiness:
 - Check conversation history before asking for location
 
 
-## Conversation Flow Management
+"""
+
+FLOW_MANAGEMENT = """## Conversation Flow Management
 
 
 ### Stage Detection Logic
@@ -487,7 +528,9 @@ When user shows enrollment readiness:
 - For payment plans: Only discuss if specifically asked
 
 
-## Final Validation Checklist
+"""
+
+VALIDATION_CHECKLIST = """## Final Validation Checklist
 
 
 Before EVERY response, verify:
@@ -504,4 +547,16 @@ Before EVERY response, verify:
 
 
 
-"""
\ No newline at end of file
+"""
+
+
+def full_system_prompt(on: date = None) -> str:
+    """Prompt with every section: both campuses, schedules, pricing and all rules."""
+    sections = {
+        "campuses": (CAMPUS_NY, CAMPUS_NJ),
+        "schedules": True,
+        "pricing": True,
+        "enrollment": True,
+        "spanish": True,
+    }
+    return render_system_prompt(sections, on or current_date())
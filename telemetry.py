@@ -0,0 +1,57 @@
+# telemetry.py
+"""
+Per-request stage timings and token counts.
+
+`Spans` records how long each named stage took (a perf_counter read per
+boundary, nothing else) and renders them for the structured log, the JSON
+response and a standard `Server-Timing` header. `usage_counts` flattens a
+Gemini `usage_metadata` into prompt / cached / tool / output token counts.
+"""
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class Spans:
+    def __init__(self):
+        self._ms: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float) -> None:
+        """Record `seconds` for `name`; repeated stages accumulate."""
+        self._ms[name] = self._ms.get(name, 0.0) + seconds * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """Stage durations in milliseconds, in the order stages first ran."""
+        return {name: round(ms, 1) for name, ms in self._ms.items()}
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value, e.g. `prompt;dur=1.2, model;dur=812.0`."""
+        return ", ".join(
+            f"{_TOKEN_UNSAFE.sub('_', name)};dur={ms:.1f}" for name, ms in self._ms.items()
+        )
+
+
+def usage_counts(usage: Any) -> Optional[Dict[str, int]]:
+    """Token counts from a response's `usage_metadata` (None when absent)."""
+    if usage is None:
+        return None
+    counts = {
+        "prompt": getattr(usage, "prompt_token_count", None),
+        "cached": getattr(usage, "cached_content_token_count", None),
+        "tool": getattr(usage, "tool_use_prompt_token_count", None),
+        "output": getattr(usage, "candidates_token_count", None),
+        "thoughts": getattr(usage, "thoughts_token_count", None),
+        "total": getattr(usage, "total_token_count", None),
+    }
+    return {k: v or 0 for k, v in counts.items()}
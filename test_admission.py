@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Tests for token buckets, the in-flight cap and its wait queue, and the 429
+responses from the entrypoints
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+import main
+from admission import AdmissionController, AdmissionRejected, InMemoryRateLimitBackend, admission_key
+from log_pipeline import BackgroundLogger, ListSink
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = Clock()
+    backend = InMemoryRateLimitBackend(clock=clock)
+    assert [backend.take("u", rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert backend.take("u", rate=2, burst=3) == pytest.approx(0.5)
+    clock.now = 0.5
+    assert backend.take("u", rate=2, burst=3) == 0
+    # Other keys have their own bucket
+    assert backend.take("v", rate=2, burst=3) == 0
+
+
+def test_user_and_global_buckets():
+    clock = Clock()
+    controller = AdmissionController(
+        user_rate=1, user_burst=2, global_rate=1, global_burst=3, clock=clock
+    )
+    controller.check("user:a")
+    controller.check("user:a")
+    with pytest.raises(AdmissionRejected) as e:
+        controller.check("user:a")
+    assert e.value.reason == "user_rate" and e.value.retry_after_header() == "1"
+
+    controller.check("user:b")
+    with pytest.raises(AdmissionRejected) as e:
+        controller.check("user:c")
+    assert e.value.reason == "global_rate"
+    stats = controller.stats()
+    assert stats["rejected_user_rate"] == 1 and stats["rejected_global_rate"] == 1
+
+    assert admission_key("u1", "10.0.0.1") == "user:u1"
+    assert admission_key("unknown", "10.0.0.1") == admission_key(None, "10.0.0.1") == "addr:10.0.0.1"
+
+
+def test_in_flight_cap_queues_in_order_and_rejects_when_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=5)
+    first = controller.acquire()
+    order = []
+
+    def wait(name):
+        slot = controller.acquire()
+        order.append(name)
+        slot.release()
+
+    threads = []
+    for name in ("a", "b"):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        while controller.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+
+    with pytest.raises(AdmissionRejected) as e:
+        controller.acquire()
+    assert e.value.reason == "queue_full" and e.value.retry_after > 0
+
+    first.release()
+    first.release()  # idempotent
+    for t in threads:
+        t.join(2)
+    assert order == ["a", "b"]
+    stats = controller.stats()
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+    assert stats["admitted"] == 3 and stats["queued"] == 2 and stats["rejected_queue_full"] == 1
+    assert stats["peak_in_flight"] == 1
+
+
+def test_queue_timeout_and_async_acquire():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+
+    async def run():
+        held = await controller.aacquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.aacquire()
+        assert e.value.reason == "queue_timeout"
+
+        waiter = asyncio.ensure_future(controller.aacquire(timeout=2))
+        await asyncio.sleep(0.01)
+        held.release()
+        slot = await waiter
+        assert slot.waited > 0
+        slot.release()
+
+        # A waiter cancelled while queued leaves no slot behind
+        held = await controller.aacquire()
+        cancelled = asyncio.ensure_future(controller.aacquire(timeout=2))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        held.release()
+
+    asyncio.run(run())
+    stats = controller.stats()
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+    assert stats["rejected_queue_timeout"] == 1
+
+
+@pytest.fixture
+def asgi(monkeypatch):
+    async def generate_content_stream(model, contents, config):
+        await asyncio.sleep(0.1)
+
+        async def chunks():
+            yield SimpleNamespace(text="Hello!", usage_metadata=None)
+
+        return chunks()
+
+    models = SimpleNamespace(generate_content_stream=generate_content_stream)
+    monkeypatch.setattr(main, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    sink = ListSink()
+    monkeypatch.setattr(main, "logger", BackgroundLogger(sink))
+    monkeypatch.setattr(main, "CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "SEARCH_RETRIEVAL_ENABLED", False)
+    app = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test"), sink
+
+
+def test_entrypoint_rate_limit_429(asgi, monkeypatch):
+    client, sink = asgi
+    monkeypatch.setattr(main, "admission", AdmissionController(user_rate=0.1, user_burst=2))
+
+    async def run():
+        async with client:
+            return [await client.post("/", json={"message": "hi", "user_id": "bot"}) for _ in range(3)], (
+                await client.post("/", json={"message": "hi", "user_id": "prospect"})
+            )
+
+    (ok1, ok2, limited), other = asyncio.run(run())
+    assert ok1.status_code == ok2.status_code == other.status_code == 200
+    assert limited.status_code == 429 and limited.headers["Retry-After"] == "10"
+    main.logger.flush()
+    rejected = [info for info, _ in sink.entries if info["event"] == "admission_rejected"]
+    assert rejected[0]["user_id"] == "bot" and rejected[0]["reason"] == "user_rate"
+
+
+def test_entrypoint_in_flight_cap(asgi, monkeypatch):
+    client, _ = asgi
+    controller = AdmissionController(max_in_flight=2, max_queue=2, queue_timeout=5)
+    monkeypatch.setattr(main, "admission", controller)
+
+    async def run():
+        async with client:
+            return await asyncio.gather(
+                *(client.post("/", json={"message": f"q{i}", "user_id": f"u{i}", "timings": True})
+                  for i in range(6))
+            )
+
+    responses = asyncio.run(run())
+    codes = sorted(r.status_code for r in responses)
+    # Two generating, two queued, the rest turned away at once
+    assert codes == [200, 200, 200, 200, 429, 429]
+    stats = controller.stats()
+    assert stats["peak_in_flight"] == 2 and stats["in_flight"] == 0
+    waited = [r.json()["timings"]["stages_ms"].get("admission_wait") for r in responses if r.status_code == 200]
+    assert sum(1 for w in waited if w) == 2
+
+
+def test_spoofed_forwarded_for_shares_a_bucket(monkeypatch):
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 1)
+    spoofed = [
+        SimpleNamespace(headers={"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"}, remote_addr="169.254.1.1")
+        for i in range(3)
+    ]
+    assert {main.client_address(req) for req in spoofed} == {"203.0.113.7"}
+    # No front end in the way: the peer address
+    assert main.client_address(SimpleNamespace(headers={}, remote_addr="198.51.100.2")) == "198.51.100.2"
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 0)
+    assert main.client_address(spoofed[0]) == "169.254.1.1"
+
+    controller = AdmissionController(user_rate=0.1, user_burst=1)
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 1)
+    controller.check(admission_key(None, main.client_address(spoofed[0])))
+    with pytest.raises(AdmissionRejected):
+        controller.check(admission_key(None, main.client_address(spoofed[1])))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the batch evaluation runner against a fake sender
+"""
+
+import asyncio
+import io
+import json
+import time
+
+import httpx
+
+from batch_eval import RateLimiter, evaluate, http_sender, read_items, request_body
+
+
+def run_batch(items, send, **kwargs):
+    out = io.StringIO()
+    summary = asyncio.run(evaluate(items, send, out, **kwargs))
+    return summary, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_bounded_concurrency_and_completion_order():
+    in_flight, peak = 0, 0
+
+    async def send(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(item["delay"])
+        in_flight -= 1
+        return {"status_code": 200, "response": item["message"].upper(), "model": "m"}
+
+    items = [{"id": i, "message": f"m{i}", "delay": 0.05 * (5 - i)} for i in range(5)]
+    started = time.monotonic()
+    summary, results = run_batch(items, send, concurrency=5)
+
+    assert time.monotonic() - started < 0.4
+    assert peak == 5
+    assert [r["id"] for r in results] == [4, 3, 2, 1, 0]
+    assert results[0]["response"] == "M4" and results[0]["latency"] >= 0
+    assert summary["items"] == 5 and summary["ok"] == 5
+
+    peak = 0
+    run_batch(items, send, concurrency=2)
+    assert peak == 2
+
+
+def test_errors_are_reported_per_item():
+    async def send(item):
+        if item["id"] == 1:
+            raise ConnectionError("reset")
+        if item["id"] == 2:
+            return {"status_code": 504, "error": "no reply within 25s"}
+        return {"status_code": 200, "response": "ok"}
+
+    summary, results = run_batch([{"id": i, "message": "x"} for i in range(3)], send)
+    by_id = {r["id"]: r for r in results}
+    assert by_id[1]["error"] == "ConnectionError: reset" and by_id[1]["status"] is None
+    assert by_id[2]["status"] == 504
+    assert summary["ok"] == 1 and summary["errors"] == 2
+
+
+def test_rate_limit():
+    async def acquire_all(n):
+        limiter = RateLimiter(rate=20, burst=1)
+        for _ in range(n):
+            await limiter.acquire()
+
+    started = time.monotonic()
+    asyncio.run(acquire_all(5))
+    assert time.monotonic() - started >= 0.19
+
+
+def test_read_items_jsonl_and_list(tmp_path):
+    jsonl = tmp_path / "items.jsonl"
+    jsonl.write_text('{"message": "hi"}\n\n{"id": "x", "message": "yo", "history": []}\n')
+    assert [i["id"] for i in read_items(str(jsonl))] == [0, "x"]
+
+    listing = tmp_path / "items.json"
+    listing.write_text(json.dumps([{"message": "hi"}]))
+    assert list(read_items(str(listing))) == [{"message": "hi", "id": 0}]
+
+
+def test_per_item_users_and_429_retry():
+    assert request_body({"id": 1, "message": "hi"})["user_id"] != request_body({"id": 2, "message": "hi"})["user_id"]
+    calls, waits = [], []
+
+    def handler(request):
+        calls.append(json.loads(request.content)["user_id"])
+        if len(calls) < 3:
+            return httpx.Response(429, json={"error": "Too many requests"}, headers={"Retry-After": "2"})
+        return httpx.Response(200, json={"response": "ok"})
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://t") as client:
+            return await http_sender(client, "/", None, sleep=fake_sleep)({"id": 7, "message": "hi"})
+
+    payload = asyncio.run(run())
+    assert payload["response"] == "ok" and payload["status_code"] == 200
+    assert waits == [2.0, 2.0] and calls == ["batch-eval-7"] * 3
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only per-thread chat history
+"""
+
+import json
+import os
+
+from chat_history import ThreadLog, migrate_json
+
+
+def fill(log, n):
+    for i in range(n):
+        log.append("user" if i % 2 == 0 else "assistant", f"turn {i}")
+
+
+def test_append_tail_and_reopen(tmp_path):
+    log = ThreadLog(str(tmp_path), "t1")
+    fill(log, 10)
+    assert len(log) == 10
+    assert [t["text"] for t in log.tail(3)] == ["turn 7", "turn 8", "turn 9"]
+    assert log.tail(0) == [] and len(log.tail()) == 10
+    log.close()
+
+    again = ThreadLog(str(tmp_path), "t1")
+    assert len(again) == 10 and again.tail(1) == [{"role": "assistant", "text": "turn 9"}]
+    assert os.path.getsize(again.index_path) == 10 * 8
+
+
+def test_recovers_torn_line_and_lagging_index(tmp_path):
+    log = ThreadLog(str(tmp_path), "t1")
+    fill(log, 4)
+    log.close()
+    # A line whose index entry never made it, then a torn write
+    with open(log.path, "ab") as f:
+        f.write(json.dumps({"role": "user", "text": "turn 4"}).encode() + b"\n")
+        f.write(b'{"role": "assis')
+
+    again = ThreadLog(str(tmp_path), "t1")
+    assert len(again) == 5
+    assert again.tail(2) == [{"role": "assistant", "text": "turn 3"}, {"role": "user", "text": "turn 4"}]
+    again.append("assistant", "turn 5")
+    assert again.tail(1)[0]["text"] == "turn 5"
+
+    # An index that belongs to another log is rebuilt from scratch
+    again.close()
+    with open(again.index_path, "wb") as f:
+        f.write((3).to_bytes(8, "little"))
+    rebuilt = ThreadLog(str(tmp_path), "t1")
+    assert len(rebuilt) == 6 and rebuilt.tail(1)[0]["text"] == "turn 5"
+
+
+def test_compact_keeps_tail_atomically(tmp_path):
+    log = ThreadLog(str(tmp_path), "t1")
+    fill(log, 20)
+    assert log.compact(keep_last=4) == 4
+    assert [t["text"] for t in log.tail()] == ["turn 16", "turn 17", "turn 18", "turn 19"]
+    log.append("user", "after")
+    log.close()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    assert [t["text"] for t in ThreadLog(str(tmp_path), "t1").tail(2)] == ["turn 19", "after"]
+
+
+def test_migrate_legacy_json(tmp_path):
+    legacy = tmp_path / "history.json"
+    legacy.write_text(json.dumps([{"role": "user", "text": "hi"}, {"role": "assistant", "text": "hello"}]))
+    log = ThreadLog(str(tmp_path / "history"), "12")
+
+    assert migrate_json(str(legacy), log) == 2
+    assert log.tail() == [{"role": "user", "text": "hi"}, {"role": "assistant", "text": "hello"}]
+    # The legacy file stays where it was (it is tracked, and bench_load reads it)
+    assert sorted(os.listdir(tmp_path)) == ["history", "history.json"]
+    assert migrate_json(str(legacy), log) == 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the validation-checklist scorer and the streaming replay CLI
+"""
+
+import io
+import json
+from datetime import date
+
+from compliance import campus_mismatches, find_dates, score_reply
+from score_compliance import Report, read_records, score_stream
+
+AS_OF = date(2025, 9, 1)
+
+
+def failed(result):
+    return sorted(rule for rule, ok in result["passed"].items() if not ok)
+
+
+def test_compliant_reply_passes_every_rule():
+    reply = (
+        "We offer Skin Care, Cosmetology, Manicure and Barbering in New Jersey. "
+        "The next start date is September 8, 2025. What sparks your interest?"
+    )
+    assert failed(score_reply(reply, "what courses are in NJ", [], AS_OF)) == []
+
+
+def test_dates_ranges_and_past_dates():
+    found = find_dates("From Sept 16th 2025 to June 23rd 2026, or 10/6/2025 – 5/4/2026", AS_OF)
+    assert found == [
+        (date(2025, 9, 16), False),
+        (date(2026, 6, 23), True),
+        (date(2025, 10, 6), False),
+        (date(2026, 5, 4), True),
+    ]
+    assert find_dates("empieza el 8 de septiembre de 2025", AS_OF) == [(date(2025, 9, 8), False)]
+    # No year: the next occurrence
+    assert find_dates("starts Jan 5", AS_OF) == [(date(2026, 1, 5), False)]
+
+    three = "Start dates: September 8, 2025, October 6, 2025 and November 3, 2025."
+    assert failed(score_reply(three, "", [], AS_OF)) == ["max_two_dates"]
+    assert failed(score_reply("We started on August 4, 2025.", "", [], AS_OF)) == ["no_past_dates"]
+
+
+def test_contact_info_campus_language_and_length():
+    leaked = score_reply("Call us at (212) 555-1234 or email info@school.edu.", "", [], AS_OF)
+    assert leaked["violations"]["no_school_contact"] == ["info@school.edu", "(212) 555-1234"]
+    # Echoing the user's own number back is fine
+    echoed = score_reply("Thanks, we have 973-555-0000 on file.", "my number is 973 555 0000", [], AS_OF)
+    assert failed(echoed) == []
+
+    assert campus_mismatches("Esthetics is offered in Wayne, NJ.") == ["Esthetics @ NJ"]
+    assert campus_mismatches("In New York we teach Makeup; Barbering is in New Jersey.") == []
+
+    english = score_reply("Hello! We have esthetics programs in New York.", "hola, qué cursos tienen", [], AS_OF)
+    assert english["violations"]["language"] == {"expected": "es", "actual": "en"}
+
+    assert failed(score_reply("word " * 80, "", [], AS_OF)) == ["word_limit"]
+
+
+def test_stream_pairs_log_events_and_aggregates():
+    lines = [
+        {"jsonPayload": {"event": "user_message", "user_id": "u", "thread_id": "t", "message": "hola"},
+         "timestamp": "2025-09-01T10:00:00Z"},
+        {"jsonPayload": {"event": "assistant_reply", "user_id": "u", "thread_id": "t",
+                         "message": "Hello! We have programs in New York for you.", "total_latency": 1.2},
+         "timestamp": "2025-09-01T10:00:01Z"},
+        {"id": "c1", "date": "2025-09-01", "history": [
+            {"role": "user", "text": "hi"},
+            {"role": "assistant", "text": "Hi! How can I help you today?", "latency": 0.4},
+        ]},
+        {"id": "b1", "message": "hi", "response": "Call 212-555-1234.", "latency": 0.8, "date": "2025-09-01"},
+    ]
+    stream = io.StringIO("\n".join(json.dumps(line) for line in lines) + "\n")
+    bad = io.StringIO()
+    report = score_stream(read_records(stream), Report(bad), workers=0, batch_size=2)
+    summary = report.summary()
+
+    assert summary["turns"] == 3 and summary["compliant"] == 1
+    assert summary["rules"]["language"]["violations"] == 1
+    assert summary["rules"]["no_school_contact"]["examples"][0]["id"] == "b1"
+    assert summary["latency_ms"]["max"] == 1200
+    assert [json.loads(line)["id"] for line in bad.getvalue().splitlines()] == ["u/t", "b1"]
+
+
+def test_process_pool_matches_inline():
+    records = [
+        {"id": i, "message": "hi", "response": "Esthetics is in Wayne, NJ." if i % 3 else "Hi there!", "latency": 0.1}
+        for i in range(30)
+    ]
+    inline = score_stream(iter(records), Report(), workers=0, batch_size=4, as_of=AS_OF).summary()
+    pooled = score_stream(iter(records), Report(), workers=2, batch_size=4, as_of=AS_OF).summary()
+    assert pooled["turns"] == inline["turns"] == 30
+    assert pooled["rules"]["campus_programs"]["violations"] == inline["rules"]["campus_programs"]["violations"] == 20
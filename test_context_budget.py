@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the history window, rolling summary cache and output token caps
+"""
+
+from context_budget import ContextBudgeter, estimate_tokens, output_token_cap, thinking_token_budget
+from response_cache import InMemoryResponseCache
+
+
+def conversation(n):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "text": f"turn {i}. More words here."}
+        for i in range(n)
+    ]
+
+
+def test_short_history_sent_verbatim():
+    budgeter = ContextBudgeter(keep_recent=12)
+    history = conversation(10)
+    assert budgeter.window(history) == (None, history)
+
+
+def test_window_moves_in_steps_and_starts_on_user_turn():
+    budgeter = ContextBudgeter(InMemoryResponseCache(), keep_recent=12, fold_step=6)
+    sizes = []
+    for n in range(13, 41):
+        summary, recent = budgeter.window(conversation(n))
+        sizes.append(len(recent))
+        assert recent[0]["role"] == "user"
+        assert summary.startswith("- User: turn 0.")
+    # Verbatim turns stay between keep_recent - step and keep_recent
+    assert min(sizes) >= 6 and max(sizes) <= 12
+
+
+def test_summary_recomputed_only_when_window_moves():
+    calls = []
+
+    def summarize(previous, turns):
+        calls.append(len(turns))
+        return (previous + " " if previous else "") + "|".join(t["text"][:6] for t in turns)
+
+    budgeter = ContextBudgeter(InMemoryResponseCache(), keep_recent=12, fold_step=6, summarize=summarize)
+    for n in range(2, 41, 2):  # one request per user turn
+        budgeter.window(conversation(n))
+    # 40 turns: blocks [0:6) … [24:30) folded, each summarized exactly once
+    assert calls == [6] * 5
+    assert budgeter.stats["summaries_computed"] == 5
+    assert budgeter.stats["summary_hits"] > 0
+
+
+def test_token_budget_folds_long_turns_and_trims_summary():
+    long_turn = [{"role": r, "text": "word " * 400} for r in ("user", "assistant") * 8]
+    budgeter = ContextBudgeter(keep_recent=12, fold_step=2, max_history_tokens=1200, max_summary_tokens=50)
+    summary, recent = budgeter.window(long_turn)
+    # ~500 tokens per turn: only the last exchange fits in 1200
+    assert len(recent) == 2 and sum(estimate_tokens(t["text"]) for t in recent) <= 1200
+    # Oldest summary lines dropped to fit 50 tokens
+    assert summary.count("\n") == 0 and summary.startswith("- Sophia:")
+
+
+def test_output_token_cap():
+    assert output_token_cap("completion", 1000) == 256
+    assert output_token_cap("interest", 500) == 500
+    assert output_token_cap(None, 1000) == 1000
+    assert thinking_token_budget(512, "gemini-2.5-flash") == 320
+    assert thinking_token_budget(100, "gemini-2.5-flash") == 0
+    # Clamped to the model's range; none for models that do not think by default
+    assert thinking_token_budget(256, "publishers/google/models/gemini-2.5-pro") == 128
+    assert thinking_token_budget(512, "gemini-2.5-flash-lite") is None
+    assert thinking_token_budget(512, "gemini-2.0-flash") is None
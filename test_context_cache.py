@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for ContextCacheManager against a local fake caches API
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from google.genai.types import Retrieval, Tool, VertexAISearch
+
+from context_cache import ContextCacheManager
+
+TOOLS = [Tool(retrieval=Retrieval(vertex_ai_search=VertexAISearch(engine="engine")))]
+
+
+class FakeCaches:
+    def __init__(self, clock, fail=False):
+        self.clock = clock
+        self.fail = fail
+        self.created = []
+        self.updated = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("minimum token count not met")
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append((model, config))
+        ttl = int(config.ttl.rstrip("s"))
+        return SimpleNamespace(name=name, expire_time=datetime.fromtimestamp(self.clock() + ttl))
+
+    def update(self, name, config):
+        self.updated.append(name)
+        ttl = int(config.ttl.rstrip("s"))
+        return SimpleNamespace(name=name, expire_time=datetime.fromtimestamp(self.clock() + ttl))
+
+
+class Clock:
+    def __init__(self, now=datetime(2025, 10, 1, 9, 0).timestamp()):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _manager(fail=False):
+    clock = Clock()
+    caches = FakeCaches(clock, fail=fail)
+    manager = ContextCacheManager(
+        lambda: SimpleNamespace(caches=caches), ttl_seconds=600, refresh_margin_seconds=60, clock=clock
+    )
+    return manager, caches, clock
+
+
+def test_reuses_entry_for_same_prompt():
+    manager, caches, _ = _manager()
+    first = manager.get("gemini-2.5-flash", "prompt", TOOLS)
+    second = manager.get("gemini-2.5-flash", "prompt", TOOLS)
+    assert first == second == "cachedContents/0"
+    assert len(caches.created) == 1
+    assert manager.get("gemini-2.5-flash", "other prompt", TOOLS) == "cachedContents/1"
+
+
+def test_refreshes_before_expiry():
+    manager, caches, clock = _manager()
+    name = manager.get("gemini-2.5-flash", "prompt", TOOLS)
+    clock.now += 570  # inside the refresh margin
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) == name
+    assert caches.updated == [name]
+    assert len(caches.created) == 1
+
+
+def test_new_day_gets_new_entry():
+    manager, caches, clock = _manager()
+    manager.get("gemini-2.5-flash", "prompt", TOOLS)
+    clock.now += 24 * 3600
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) == "cachedContents/1"
+
+
+def test_create_failure_falls_back_and_backs_off():
+    manager, caches, clock = _manager(fail=True)
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) is None
+    caches.fail = False
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) is None
+    clock.now += manager.retry_after_seconds + 1
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) == "cachedContents/0"
+
+
+def test_invalidate_forces_recreate():
+    manager, caches, _ = _manager()
+    name = manager.get("gemini-2.5-flash", "prompt", TOOLS)
+    manager.invalidate(name)
+    assert manager.get("gemini-2.5-flash", "prompt", TOOLS) == "cachedContents/1"
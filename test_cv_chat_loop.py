@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for the smoke-test client: token caching, SSE parsing and the pooled
+session, against an in-process mock transport
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+
+import httpx
+import pytest
+
+import cv_chat_loop
+from cv_chat_loop import IdentityToken, iter_sse, send_message, token_expiry
+
+
+def jwt(exp):
+    body = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"h.{body}.s"
+
+
+def sse(*frames):
+    return "".join(f"event: {e}\ndata: {json.dumps(p)}\n\n" for e, p in frames)
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    monkeypatch.delenv("CV_ID_TOKEN", raising=False)
+    minted = []
+
+    def fetch():
+        minted.append(len(minted))
+        return jwt(10_000)
+
+    store = IdentityToken(fetch=fetch, clock=lambda: 1_000.0)
+    monkeypatch.setattr(cv_chat_loop, "tokens", store)
+    return minted
+
+
+def test_token_cached_until_refresh_margin(monkeypatch):
+    monkeypatch.delenv("CV_ID_TOKEN", raising=False)
+    now = [0.0]
+    fetched = []
+    store = IdentityToken(fetch=lambda: fetched.append(1) or jwt(3600), clock=lambda: now[0], refresh_margin=300)
+
+    assert token_expiry(jwt(3600)) == 3600
+    store.get()
+    now[0] = 3000
+    store.get()
+    assert len(fetched) == 1
+    now[0] = 3301  # inside the refresh margin
+    store.get()
+    assert len(fetched) == 2
+    store.invalidate()
+    store.get()
+    assert len(fetched) == 3
+
+
+def test_iter_sse_frames():
+    lines = sse(("chunk", {"text": "Hi"}), ("done", {"response": "Hi!"})).split("\n")
+    assert list(iter_sse(lines)) == [("chunk", {"text": "Hi"}), ("done", {"response": "Hi!"})]
+
+
+def test_streamed_reply_and_401_retry(tokens):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(401)
+        body = sse(("chunk", {"text": "Hel"}), ("chunk", {"text": "lo"}), ("done", {"response": "Hello", "model": "m"}))
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    chunks = []
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        reply = send_message("hi", [], on_chunk=chunks.append, client=client)
+
+    assert chunks == ["Hel", "lo"]
+    assert reply.text == "Hello" and reply.status == 200 and reply.ttft is not None
+    assert len(tokens) == 2  # re-minted after the 401
+    sent = json.loads(calls[-1].content)
+    assert sent["stream"] is True and calls[-1].headers["accept"] == "text/event-stream"
+
+
+def test_json_reply_without_stream(tokens):
+    def handler(request):
+        return httpx.Response(200, json={"response": "Hi there", "total_latency": 0.5})
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        reply = send_message("hi", [], stream=False, client=client)
+    assert reply.text == "Hi there" and reply.error is None
+    assert "server 0.50s" in reply.timing_line()
+
+
+def test_sessions_share_one_async_client(tokens, monkeypatch):
+    seen = []
+
+    async def handler(request):
+        body = json.loads(request.content)
+        seen.append((body["thread_id"], len(body["history"])))
+        # The new message is sent once, not also as the last history turn
+        assert body["message"] not in [turn["text"] for turn in body["history"] if turn["role"] == "user"]
+        await asyncio.sleep(0.01)
+        return httpx.Response(
+            200, text=sse(("done", {"response": f"ok {body['message']}"})),
+            headers={"content-type": "text/event-stream"},
+        )
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        cv_chat_loop.httpx, "AsyncClient",
+        lambda **kw: real_client(transport=httpx.MockTransport(handler)),
+    )
+    replies = asyncio.run(cv_chat_loop.run_sessions(["hi", "tell me about nails"], sessions=3))
+
+    assert len(replies) == 6 and all(r.text.startswith("ok") for r in replies)
+    assert sorted(seen) == sorted((f"12-s{i}", n) for i in range(3) for n in (0, 2))
+    assert len(tokens) == 1
+
+
+def test_long_history_sent_gzipped(tokens):
+    bodies = []
+
+    def handler(request):
+        bodies.append((request.headers.get("content-encoding"), request.content))
+        return httpx.Response(200, json={"response": "ok"})
+
+    history = [{"role": "user", "text": "tell me about the esthetics program"}] * 40
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        send_message("hi", [], stream=False, client=client)
+        send_message("and nails?", history, stream=False, client=client)
+
+    assert bodies[0][0] is None
+    encoding, raw = bodies[1]
+    assert encoding == "gzip" and json.loads(gzip.decompress(raw))["history"] == history
+    assert len(raw) < len(json.dumps(history)) / 5
+
+
+def test_429_retried_after_retry_after(tokens, monkeypatch):
+    waits, seen = [], []
+    monkeypatch.setattr(cv_chat_loop.time, "sleep", waits.append)
+
+    def handler(request):
+        seen.append(json.loads(request.content)["user_id"])
+        if len(seen) == 1:
+            return httpx.Response(429, json={"error": "slow down"}, headers={"Retry-After": "3"})
+        return httpx.Response(200, json={"response": "ok"})
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        reply = send_message("hi", [], stream=False, client=client, user_id="12-s1")
+    assert reply.text == "ok" and reply.status == 200
+    assert waits == [3.0] and seen == ["12-s1", "12-s1"]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for GenerationExecutor against a fault-injecting fake models API
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from google.genai import errors
+from google.genai.types import GenerateContentConfig
+
+from generation import DeadlineExceeded, GenerationCancelled, GenerationExecutor, is_cache_miss, is_retryable
+
+
+def api_error(code, message="fake"):
+    return errors.APIError(code, {"error": {"code": code, "message": message, "status": "FAKE"}})
+
+
+class FakeModels:
+    """
+    Each call to generate_content_stream takes the next script entry: an
+    exception to raise, or (first_chunk_delay, [texts]) to stream.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+        self.closed = []
+
+    def generate_content_stream(self, model, contents, config):
+        index = len(self.calls)
+        self.calls.append(config)
+        step = self.script[min(index, len(self.script) - 1)]
+        if isinstance(step, Exception):
+            raise step
+        delay, texts = step
+        return self._stream(index, delay, texts)
+
+    def _stream(self, index, delay, texts):
+        try:
+            time.sleep(delay)
+            for text in texts:
+                yield SimpleNamespace(text=text)
+                time.sleep(0.01)
+        finally:
+            self.closed.append(index)
+
+
+def make_executor(models, **kwargs):
+    client = SimpleNamespace(models=models)
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("min_attempt_seconds", 0.05)
+    kwargs.setdefault("poll_interval", 0.01)
+    return GenerationExecutor(lambda: client, **kwargs)
+
+
+CONFIG = GenerateContentConfig(cached_content="cachedContents/1")
+FALLBACK = GenerateContentConfig(system_instruction="inline prompt")
+
+
+def test_is_retryable_classification():
+    assert is_retryable(api_error(503))
+    assert is_retryable(api_error(429))
+    assert not is_retryable(api_error(400))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ValueError())
+
+
+def test_transient_error_is_retried_and_timeout_set():
+    models = FakeModels([api_error(503), (0, ["Hello", " there"])])
+    executor = make_executor(models)
+
+    assert executor.generate_text("m", [], FALLBACK) == "Hello there"
+    assert len(models.calls) == 2
+    assert executor.counters["retries"] == 1
+    # Every attempt is bounded by the remaining deadline
+    assert all(0 < c.http_options.timeout <= 25_000 for c in models.calls)
+
+
+def test_client_error_is_not_retried():
+    models = FakeModels([api_error(400), (0, ["unreachable"])])
+    executor = make_executor(models)
+
+    with pytest.raises(errors.APIError):
+        executor.generate_text("m", [], FALLBACK)
+    assert len(models.calls) == 1
+
+
+def test_cache_miss_falls_back_to_inline_config():
+    models = FakeModels([api_error(404, "CachedContent not found (or permission denied)"), (0, ["ok"])])
+    executor = make_executor(models)
+    seen = []
+
+    text = executor.generate_text(
+        "m", [], CONFIG, fallback_config=FALLBACK, on_fallback=seen.append
+    )
+    assert text == "ok"
+    assert models.calls[0].cached_content == "cachedContents/1"
+    assert models.calls[1].system_instruction == "inline prompt"
+    assert len(seen) == 1 and executor.counters["fallbacks"] == 1
+
+
+def test_cache_miss_falls_back_on_the_last_attempt():
+    models = FakeModels([api_error(404, "CachedContent not found"), (0, ["ok"])])
+    executor = make_executor(models, max_attempts=1)
+    assert executor.generate_text("m", [], CONFIG, fallback_config=FALLBACK) == "ok"
+    assert executor.counters["fallbacks"] == 1
+
+
+def test_http_timeout_is_a_deadline():
+    models = FakeModels([httpx.ReadTimeout("read timed out")])
+    executor = make_executor(models, max_attempts=1)
+    with pytest.raises(DeadlineExceeded) as e:
+        executor.generate_text("m", [], FALLBACK)
+    assert isinstance(e.value.__cause__, httpx.ReadTimeout)
+
+
+def test_other_failures_keep_the_cached_config():
+    assert is_cache_miss(api_error(400, "Cached content is expired"))
+    assert not is_cache_miss(api_error(400)) and not is_cache_miss(api_error(503, "cache backend"))
+
+    models = FakeModels([api_error(503), (0, ["ok"])])
+    executor = make_executor(models)
+    seen = []
+    assert executor.generate_text("m", [], CONFIG, fallback_config=FALLBACK, on_fallback=seen.append) == "ok"
+    # A transient error takes the normal retry, still on the cached entry
+    assert [c.cached_content for c in models.calls] == ["cachedContents/1"] * 2
+    assert not seen and executor.counters["fallbacks"] == 0 and executor.counters["retries"] == 1
+
+    models = FakeModels([api_error(400), (0, ["unreachable"])])
+    executor = make_executor(models)
+    with pytest.raises(errors.APIError):
+        executor.generate_text("m", [], CONFIG, fallback_config=FALLBACK, on_fallback=seen.append)
+    assert len(models.calls) == 1 and not seen
+
+
+def test_deadline_exceeded():
+    models = FakeModels([(1.0, ["too late"])])
+    executor = make_executor(models, deadline_seconds=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        executor.generate_text("m", [], FALLBACK)
+    assert time.monotonic() - started < 0.6
+    assert executor.counters["deadline_exceeded"] == 1
+
+
+def test_hedge_wins_when_first_attempt_is_slow():
+    models = FakeModels([(1.0, ["slow"]), (0, ["fast"])])
+    executor = make_executor(models, hedge_enabled=True, hedge_min_delay=0.05)
+    for _ in range(20):
+        executor.ttft.add(0.05)
+
+    assert executor.generate_text("m", [], FALLBACK) == "fast"
+    assert executor.counters["hedges"] == 1
+    assert executor.counters["hedge_wins"] == 1
+
+
+def test_cancel_event_and_generator_close_stop_attempts():
+    cancel = threading.Event()
+    models = FakeModels([(0, ["a", "b", "c", "d"])])
+    executor = make_executor(models)
+
+    stream = executor.stream("m", [], FALLBACK, cancel_event=cancel)
+    assert next(stream) == "a"
+    cancel.set()
+    with pytest.raises(GenerationCancelled):
+        list(stream)
+
+    stream = executor.stream("m", [], FALLBACK)
+    assert next(stream) == "a"
+    stream.close()
+    time.sleep(0.1)
+    assert 1 in models.closed  # the upstream stream of the closed request was released
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental stage and lead-field tracking
+"""
+
+from lead_state import LeadState, LeadTracker, consume
+
+CONVERSATION = [
+    ("hi", "Hi! What interests you about beauty?"),
+    ("what nails programs do you have", "Our Nails program is in New York. Would you like to enroll?"),
+    ("how much is it", "Tuition is listed here. Can I get your name, email and phone?"),
+    ("I'm interested! Ana Lopez", "Thanks Ana! What's your email and phone?"),
+    ("ana@example.com, 973-555-1234", "Perfect! I have all your information."),
+    ("sounds good", "Great, talk soon!"),
+]
+
+
+def test_stages_and_fields_follow_the_conversation():
+    tracker = LeadTracker()
+    history, stages = [], []
+    for user, assistant in CONVERSATION:
+        state = tracker.observe("u:t", history, user)
+        stages.append(state.stage)
+        history += [{"role": "user", "text": user}, {"role": "assistant", "text": assistant}]
+
+    assert stages == [
+        "initial",
+        "interest",
+        "pricing",
+        "enrollment_collection",
+        "enrollment_ready",
+        "completion",
+    ]
+    assert (state.name, state.email, state.phone) == ("Ana Lopez", "ana@example.com", "973-555-1234")
+    assert state.campus is None and state.campus_hint == "NY"
+    assert state.missing == ("campus",)
+    assert "Programs discussed are at the NY campus" in state.summary()
+
+
+def test_only_new_turns_are_consumed():
+    tracker = LeadTracker()
+    history = []
+    for user, assistant in CONVERSATION:
+        tracker.observe("u:t", history, user)
+        history += [{"role": "user", "text": user}, {"role": "assistant", "text": assistant}]
+    # Each request consumed the previous reply and the new message
+    assert tracker.stats["turns_consumed"] == 2 * len(CONVERSATION) - 1
+    assert tracker.stats["hits"] == len(CONVERSATION) - 1
+
+    # A restarted or truncated history is replayed from the start
+    tracker.observe("u:t", [{"role": "user", "text": "hola"}] + history[1:], "gracias")
+    tracker.observe("u:t", history[:2], "what about NJ?")
+    assert tracker.stats["replays"] == 2
+
+
+def test_sliding_window_resumes_without_replay():
+    tracker = LeadTracker()
+    history = []
+    for i in range(30):
+        state = tracker.observe("u:t", history[-10:], f"question {i} about nails")
+        history += [{"role": "user", "text": f"question {i} about nails"}, {"role": "assistant", "text": f"answer {i}"}]
+    # Once the window is full the oldest turns drop off, but each request still
+    # consumes just the previous reply and the new message
+    assert tracker.stats["replays"] == 0 and tracker.stats["hits"] == 29
+    assert tracker.stats["turns_consumed"] == 2 * 30 - 1
+    assert state == tracker.observe(None, history[:-2], "question 29 about nails")
+
+
+def test_name_extraction():
+    assert consume(LeadState(), "user", "my name is maria garcia and my email is m@g.com").name == "Maria Garcia"
+    assert consume(LeadState(), "user", "me llamo José").name == "José"
+    assert consume(LeadState(), "user", "I'm looking for barbering").name is None
+    asked = LeadState(asked_for=("name",))
+    assert consume(asked, "user", "maria").name == "Maria"
+    assert consume(asked, "user", "yes please").name is None
+    assert consume(asked, "user", "I want info").name is None
+
+
+def test_sentences_are_not_names():
+    asked = LeadState(asked_for=("name",))
+    for text in ("I'm curious about esthetics", "I am excited to learn more", "this is great, thanks"):
+        for state in (LeadState(), asked):
+            after = consume(state, "user", text)
+            assert after.name is None, text
+            assert after.stage != "enrollment_collection", text
+    # "I'm ..." introduces a name only when the assistant asked for it
+    assert consume(LeadState(), "user", "I'm Ana Lopez").name is None
+    assert consume(asked, "user", "I'm Ana Lopez").name == "Ana Lopez"
+    assert consume(asked, "user", "this is Ana").name == "Ana"
+    assert consume(asked, "user", "Maria Luisa Perez Gomez").name is None
+
+
+def test_lru_bound():
+    tracker = LeadTracker(max_threads=2)
+    for key in ("a", "b", "c"):
+        tracker.observe(key, [], "hi")
+    assert list(tracker._threads) == ["b", "c"]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the background logging pipeline against a local sink
+"""
+
+import threading
+
+from log_pipeline import BackgroundLogger, ListSink
+
+
+class BlockingSink(ListSink):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write_batch(self, entries):
+        self.release.wait(5)
+        super().write_batch(entries)
+
+
+def test_flush_writes_enqueued_entries_in_batches():
+    sink = ListSink()
+    log = BackgroundLogger(sink, batch_size=3, flush_interval=60)
+    for i in range(7):
+        log.log_struct({"event": "user_message", "n": i})
+    assert log.flush()
+    assert [info["n"] for info, _ in sink.entries] == list(range(7))
+    assert [len(b) for b in sink.batches][:2] == [3, 3]
+    log.close()
+
+
+def test_interval_flush_without_explicit_flush():
+    sink = ListSink()
+    log = BackgroundLogger(sink, batch_size=100, flush_interval=0.05)
+    log.log_struct({"event": "x"})
+    for _ in range(100):
+        if sink.entries:
+            break
+        threading.Event().wait(0.01)
+    assert len(sink.entries) == 1
+    log.close()
+
+
+def test_close_drains_queue():
+    sink = ListSink()
+    log = BackgroundLogger(sink, batch_size=100, flush_interval=60)
+    log.log_struct({"event": "a"}, severity="ERROR")
+    log.close()
+    assert sink.entries == [({"event": "a"}, "ERROR")]
+
+
+def test_full_queue_drops_and_counts():
+    sink = BlockingSink()
+    log = BackgroundLogger(sink, max_queue=2, batch_size=1, flush_interval=60)
+    for i in range(10):
+        log.log_struct({"n": i})
+    assert log.stats()["dropped"] > 0
+    sink.release.set()
+    log.close()
+    stats = log.stats()
+    assert stats["written"] + stats["dropped"] == 10
+
+
+def test_truncation_and_sampling():
+    sink = ListSink()
+    log = BackgroundLogger(sink, max_message_chars=5, sample_rate=0.0)
+    log.log_struct({"message": "x" * 20})  # sampled out
+    log.log_struct({"message": "x" * 20, "error": "boom"}, severity="ERROR")
+    log.close()
+    (info, severity), = sink.entries
+    assert info["message"].startswith("xxxxx…[truncated 15 chars]")
+    assert info["error"] == "boom"
+    assert log.stats()["sampled_out"] == 1
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Tests for the ASGI entrypoint against a fake async models API
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from google.genai import errors
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+import main
+from admission import AdmissionController
+from context_budget import REPLY_TOKENS
+from lead_state import LeadTracker
+from log_pipeline import BackgroundLogger, ListSink
+from response_cache import InMemoryResponseCache
+from retrieval import FakeSearchBackend, Retriever, SearchResult
+
+MODEL_DELAY = 0.2
+
+
+class FakeAsyncModels:
+    def __init__(self):
+        self.calls = 0
+        self.failing_models = set()
+        self.configs = []
+
+    async def generate_content_stream(self, model, contents, config):
+        self.calls += 1
+        self.last = (contents, config)
+        self.last_model = model
+        self.configs.append((model, config))
+        if model in self.failing_models:
+            raise errors.APIError(400, {"error": {"code": 400, "message": "unsupported"}})
+        await asyncio.sleep(MODEL_DELAY)
+        text = contents[-1].parts[-1].text
+
+        async def chunks():
+            for part in ("You said: **", text, "**"):
+                yield SimpleNamespace(text=part, usage_metadata=None)
+            yield SimpleNamespace(
+                text=None,
+                usage_metadata=SimpleNamespace(
+                    prompt_token_count=900, candidates_token_count=12, total_token_count=912
+                ),
+            )
+
+        return chunks()
+
+
+@pytest.fixture
+def asgi(monkeypatch):
+    models = FakeAsyncModels()
+    monkeypatch.setattr(main, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    models.log_sink = ListSink()
+    monkeypatch.setattr(main, "logger", BackgroundLogger(models.log_sink))
+    monkeypatch.setattr(main, "CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", False)
+    docs = [SearchResult("Esthetics classes start monthly.", "https://cv.edu/esthetics")]
+    monkeypatch.setattr(main, "retriever", Retriever(FakeSearchBackend(docs)))
+    monkeypatch.setattr(main, "lead_tracker", LeadTracker())
+    monkeypatch.setattr(main, "admission", AdmissionController())
+    app = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test"), models
+
+
+def test_json_contract(asgi):
+    client, _ = asgi
+
+    async def run():
+        async with client:
+            ok = await client.post("/", json={"message": "hi", "user_id": "u"})
+            bad = await client.post("/", json={"user_id": "u"})
+        return ok, bad
+
+    ok, bad = asyncio.run(run())
+    assert ok.status_code == 200
+    body = ok.json()
+    assert body["response"] == "You said: hi"
+    assert body["status_code"] == 200
+    assert body["model"] == main.model_router.tiers["lite"]  # a greeting goes to the lite tier
+    assert body["ttft"] is not None
+    assert bad.status_code == 400 and "Missing" in bad.json()["error"]
+
+
+def test_timings_and_server_timing_header(asgi):
+    client, _ = asgi
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "hi", "timings": True})
+
+    resp = asyncio.run(run())
+    timings = resp.json()["timings"]
+    assert timings["tokens"]["prompt"] == 900 and timings["tokens"]["output"] == 12
+    assert {"prompt", "model_first_chunk", "model", "markdown"} <= set(timings["stages_ms"])
+    header = resp.headers["server-timing"]
+    assert "model;dur=" in header and "total;dur=" in header
+
+
+def test_sse_stream(asgi):
+    client, _ = asgi
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "hello", "stream": True})
+
+    resp = asyncio.run(run())
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n", 1) for block in resp.text.strip().split("\n\n")]
+    assert [e[0] for e in events] == ["event: chunk"] * 3 + ["event: done"]
+    done = json.loads(events[-1][1][len("data: "):])
+    assert done["response"] == "You said: hello"
+
+
+def test_retrieved_snippets_injected(asgi):
+    client, models = asgi
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "when do esthetics classes start"})
+
+    assert asyncio.run(run()).status_code == 200
+    contents, config = models.last
+    reference, state, message = contents[-1].parts
+    assert "Esthetics classes start monthly." in reference.text
+    assert state.text.startswith("Conversation state (tracked): stage=interest")
+    assert message.text == "when do esthetics classes start"
+    # With snippets in hand the model does not search again through the tool
+    assert not config.tools
+
+
+def test_empty_search_falls_back_to_the_tool(asgi, monkeypatch):
+    client, models = asgi
+    monkeypatch.setattr(main, "retriever", Retriever(FakeSearchBackend([])))
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "when do esthetics classes start"})
+
+    assert asyncio.run(run()).status_code == 200
+    contents, config = models.last
+    assert len(contents[-1].parts) == 2  # state and message, no reference block
+    assert config.tools and config.tools[0].retrieval.vertex_ai_search
+
+
+def test_lead_state_summary_sent_to_model(asgi):
+    client, models = asgi
+    history = [
+        {"role": "user", "text": "I want to enroll in nails"},
+        {"role": "assistant", "text": "Great! What's your name, email and phone?"},
+    ]
+
+    async def run():
+        async with client:
+            return await client.post(
+                "/", json={"message": "Ana Lopez, ana@example.com", "history": history, "thread_id": "lead-1"}
+            )
+
+    assert asyncio.run(run()).status_code == 200
+    contents, _ = models.last
+    state = contents[-1].parts[-2].text
+    assert "stage=enrollment_collection" in state
+    assert "name=Ana Lopez, email=ana@example.com" in state
+    assert "Still missing: phone, campus" in state
+    main.logger.flush()
+    entry = [e for e, _ in models.log_sink.entries if e["event"] == "assistant_reply"][-1]
+    assert entry["lead"]["stage"] == "enrollment_collection"
+
+
+def test_long_history_windowed_with_summary(asgi):
+    client, models = asgi
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "text": f"message {i}"} for i in range(40)
+    ]
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "thanks!", "history": history})
+
+    assert asyncio.run(run()).status_code == 200
+    contents, config = models.last
+    # Recent turns verbatim plus the current turn, not all 40
+    assert len(contents) <= main.HISTORY_KEEP_TURNS + 1
+    summary = contents[-1].parts[0].text
+    assert summary.startswith("Earlier in this conversation") and "- User: message 0" in summary
+    assert config.max_output_tokens <= main.MAX_OUTPUT_TOKENS
+    # The stage cap leaves the reply room after thinking
+    assert config.thinking_config.thinking_budget == config.max_output_tokens - REPLY_TOKENS
+    assert models.last_model == main.MODEL_NAME
+
+
+def test_greeting_skips_grounding(asgi):
+    client, models = asgi
+
+    async def run():
+        async with client:
+            return await client.post("/", json={"message": "hi there!"})
+
+    assert asyncio.run(run()).status_code == 200
+    contents, config = models.last
+    assert len(contents[-1].parts) == 1
+    assert not config.tools
+    assert main.retriever.backend.calls == []
+    # Lite only thinks when asked, so a capped lite turn sends no thinking budget
+    assert models.last_model == main.model_router.tiers["lite"] and config.thinking_config is None
+
+
+def test_failed_lite_call_falls_back_to_standard_model(asgi):
+    client, models = asgi
+    lite, standard = main.model_router.tiers["lite"], main.model_router.tiers["standard"]
+    models.failing_models.add(lite)
+
+    async def run():
+        async with client:
+            greeting = await client.post("/", json={"message": "hello"})
+            question = await client.post("/", json={"message": "what programs do you offer?"})
+        return greeting, question
+
+    greeting, question = asyncio.run(run())
+    assert greeting.status_code == 200 and greeting.json()["model"] == standard
+    assert models.last_model == standard
+    assert question.json()["model"] == standard
+    main.logger.flush()
+    replies = [info for info, _ in models.log_sink.entries if info["event"] == "assistant_reply"]
+    assert replies[0]["model_fallback_from"] == lite
+    # The standard model taking over gets its own thinking budget
+    (_, lite_config), (_, standard_config) = models.configs[:2]
+    assert lite_config.thinking_config is None
+    assert standard_config.thinking_config.thinking_budget == standard_config.max_output_tokens - REPLY_TOKENS
+    assert replies[1]["model_route"] == "needs_grounding"
+
+
+def test_response_cache_keys_on_the_routed_model(asgi, monkeypatch):
+    client, models = asgi
+    lite = main.model_router.tiers["lite"]
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "response_cache", InMemoryResponseCache())
+
+    async def run():
+        async with client:
+            first = await client.post("/", json={"message": "hi", "thread_id": "t1", "history": []})
+            cached = await client.post("/", json={"message": "hi", "thread_id": "t2", "history": []})
+            history = [{"role": "user", "text": "hi"}, {"role": "assistant", "text": cached.json()["response"]}]
+            follow_up = await client.post("/", json={"message": "ok thanks", "thread_id": "t2", "history": history})
+            # A reply from the fallback model is not cached under the lite key
+            models.failing_models.add(lite)
+            fallback = await client.post("/", json={"message": "hello", "history": []})
+            return first, cached, follow_up, fallback
+
+    first, cached, follow_up, fallback = asyncio.run(run())
+    assert first.json()["model"] == lite and "cached" not in first.json()
+    assert cached.json()["cached"] and cached.json()["model"] == lite
+    assert follow_up.status_code == 200 and fallback.json()["model"] != lite
+    assert models.calls == 4  # first, follow-up, the failed lite call and its fallback
+    # The cached turn was still tracked, so the thread's next turn resumes
+    assert main.lead_tracker.stats["hits"] == 1 and main.lead_tracker.stats["replays"] == 0
+    assert main.response_cache.stats()["sets"] == 2
+
+
+def test_concurrent_requests_overlap(asgi):
+    client, models = asgi
+    n = 30
+
+    async def run():
+        async with client:
+            return await asyncio.gather(
+                *(client.post("/", json={"message": f"question {i}"}) for i in range(n))
+            )
+
+    started = time.monotonic()
+    responses = asyncio.run(run())
+    elapsed = time.monotonic() - started
+    assert all(r.status_code == 200 for r in responses)
+    assert models.calls == n
+    # Serialized this would take n * MODEL_DELAY = 6s
+    assert elapsed < n * MODEL_DELAY / 3
+
+
+def test_asgi_stack_is_imported_only_for_the_asgi_target():
+    check = (
+        "import sys, main, functions_framework._function_registry as r; "
+        "print('starlette' in sys.modules, 'app_async' in r.ASGI_FUNCTIONS)"
+    )
+
+    def run(target):
+        env = dict(os.environ, FUNCTION_TARGET=target)
+        out = subprocess.run([sys.executable, "-c", check], env=env, capture_output=True, text=True, check=True)
+        return out.stdout.split()
+
+    assert run("app") == ["False", "False"]
+    assert run("app_async") == ["True", "True"]
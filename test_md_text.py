@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Golden-output tests for the single-pass markdown → text converter
+"""
+
+import json
+import os
+
+import pytest
+
+from md_text import markdown_to_text
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "md_text_golden.json")) as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=[c["name"] for c in GOLDEN])
+def test_golden(case):
+    assert markdown_to_text(case["markdown"]) == case["text"]
+
+
+def test_empty_and_none():
+    assert markdown_to_text("") == ""
+    assert markdown_to_text(None) == ""
+
+
+def test_long_input_is_linear():
+    # Pathological marker soup must not blow up (no backtracking / rescans)
+    text = "*_[`<" * 20000
+    assert markdown_to_text(text)
+    # Unclosed link targets, autolinks and code spans, and closers with no opener of their kind
+    for soup in ("[a](" * 20000, "<http://a " * 20000, "`x ``y " * 10000, "_a b* " * 10000):
+        assert markdown_to_text(soup)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for per-turn model routing
+"""
+
+import pytest
+
+from model_router import ModelRouter, parse_tiers
+
+TIERS = {"lite": "flash-lite", "standard": "flash"}
+
+
+def test_parse_tiers():
+    assert parse_tiers("lite=a, standard=b,bogus") == {"lite": "a", "standard": "b"}
+    assert parse_tiers("") == {}
+
+
+def test_simple_turns_go_to_lite_tier():
+    router = ModelRouter(TIERS, max_history=4, max_message_chars=40)
+    assert router.choose([], "hi", False, "greeting") == ("flash-lite", "greeting")
+    assert router.choose([], "my name is Ana", False, "contact_info") == ("flash-lite", "contact_info")
+    assert router.choose([], "how much is nails?", True, "topic") == ("flash", "needs_grounding")
+    assert router.choose([{}] * 5, "thanks", False, "acknowledgement") == ("flash", "long_history")
+    assert router.choose([], "thanks " * 10, False, "acknowledgement") == ("flash", "long_message")
+
+
+def test_slow_lite_tier_and_disabled_routing():
+    router = ModelRouter(TIERS, max_lite_p95_seconds=1.0)
+    for _ in range(20):
+        router.observe("flash-lite", 2.0)
+    assert router.choose([], "hi", False, "greeting") == ("flash", "lite_slow")
+
+    assert ModelRouter(TIERS, enabled=False).choose([], "hi", False, "greeting") == ("flash", "routing_disabled")
+    assert ModelRouter({"standard": "flash"}).choose([], "hi", False, "greeting")[0] == "flash"
+    with pytest.raises(ValueError):
+        ModelRouter({"lite": "flash-lite"})
+
+
+def test_slow_lite_tier_recovers_once_samples_age_out():
+    now = [0.0]
+    router = ModelRouter(TIERS, max_lite_p95_seconds=1.0, lite_window_seconds=60, clock=lambda: now[0])
+    for _ in range(20):
+        router.observe("flash-lite", 2.0)
+    assert router.choose([], "hi", False, "greeting") == ("flash", "lite_slow")
+    now[0] = 30.0
+    assert router.choose([], "hi", False, "greeting") == ("flash", "lite_slow")
+    # No lite turns meanwhile, so nothing fresh: the slow samples expire and lite is tried again
+    now[0] = 61.0
+    assert router.choose([], "hi", False, "greeting") == ("flash-lite", "greeting")
+    for _ in range(20):
+        router.observe("flash-lite", 0.4)
+    assert router.choose([], "hi", False, "greeting") == ("flash-lite", "greeting")
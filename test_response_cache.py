@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the response cache (key normalization, LRU and TTL eviction)
+"""
+
+from datetime import date
+
+from response_cache import InMemoryResponseCache, build_cache_key, is_cacheable
+
+DAY = date(2025, 10, 1)
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ignores_case_and_punctuation():
+    assert build_cache_key("Hi!!", [], "m", DAY) == build_cache_key("hi", [], "m", DAY)
+
+
+def test_key_varies_with_date_language_and_campus():
+    base = build_cache_key("what courses", [], "m", DAY)
+    assert base != build_cache_key("what courses", [], "m", date(2025, 10, 2))
+    assert base != build_cache_key("what courses", [], "other-model", DAY)
+    history = [{"role": "user", "text": "I live in New Jersey"}]
+    assert base != build_cache_key("what courses", history, "m", DAY)
+    assert build_cache_key("hola", [], "m", DAY) != build_cache_key("hello", [], "m", DAY)
+
+
+def test_key_includes_assistant_turns():
+    opener = {"role": "user", "text": "hi"}
+    dates = [opener, {"role": "assistant", "text": "Want to see start dates?"}]
+    enroll = [opener, {"role": "assistant", "text": "Shall I start your enrollment?"}]
+    assert build_cache_key("yes", dates, "m", DAY) != build_cache_key("yes", enroll, "m", DAY)
+    assert build_cache_key("yes", dates, "m", DAY) == build_cache_key("Yes!", list(dates), "m", DAY)
+
+
+def test_only_short_histories_are_cacheable():
+    assert is_cacheable([], 2)
+    assert not is_cacheable([{"role": "user", "text": "x"}] * 3, 2)
+
+
+def test_lru_eviction_and_counters():
+    cache = InMemoryResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"  # "b" is now least recently used
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["evictions"] == 1 and stats["size"] == 2
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = InMemoryResponseCache(max_entries=4, ttl_seconds=10, clock=clock)
+    cache.set("a", "A")
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
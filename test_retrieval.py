@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the retrieval stage against a local fake search backend
+"""
+
+import pytest
+
+from response_cache import InMemoryResponseCache
+from retrieval import (
+    FakeSearchBackend,
+    Retriever,
+    SearchResult,
+    SearchUnavailable,
+    format_snippets,
+    parse_search_response,
+)
+
+DOCS = [
+    SearchResult("The esthetics program covers facials and skin care.", "https://cv.edu/esthetics", "Esthetics"),
+    SearchResult("Barbering courses run in New Jersey.", "https://cv.edu/barbering", "Barbering"),
+    SearchResult("Makeup program course schedule and esthetic add-ons.", "https://cv.edu/makeup", "Makeup"),
+]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_top_snippets_and_sources():
+    retriever = Retriever(FakeSearchBackend(DOCS), max_snippets=2)
+    snippets, sources = retriever.retrieve("esthetic program courses schedule", "active")
+    assert len(snippets) == 2
+    assert sources == ["https://cv.edu/makeup", "https://cv.edu/esthetics"]
+    assert retriever.retrieve("", "active") == ([], [])
+
+
+def test_results_cached_per_normalized_query_with_ttl():
+    clock = Clock()
+    backend = FakeSearchBackend(DOCS)
+    retriever = Retriever(backend, cache=InMemoryResponseCache(ttl_seconds=60, clock=clock))
+
+    first = retriever.retrieve("Barbering in NJ?", "initial")
+    assert retriever.retrieve("barbering in nj", "active") == first
+    assert len(backend.calls) == 1 and retriever.stats["cache_hits"] == 1
+
+    clock.now += 61
+    retriever.retrieve("barbering in nj", "active")
+    assert len(backend.calls) == 2
+
+
+def test_stage_limits():
+    retriever = Retriever(FakeSearchBackend(DOCS), max_snippets=3, max_snippets_by_stage={"initial": 1, "completion": 0})
+    assert len(retriever.retrieve("program", "initial")[0]) == 1
+    assert len(retriever.retrieve("program", "active")[0]) == 2
+    assert retriever.retrieve("program", "completion") == ([], [])
+
+
+def test_backend_failure_backs_off():
+    class Broken(FakeSearchBackend):
+        def search(self, query, page_size):
+            self.calls.append(query)
+            raise ConnectionError("down")
+
+    clock = Clock()
+    backend = Broken([])
+    retriever = Retriever(backend, retry_after_seconds=30, clock=clock)
+    with pytest.raises(ConnectionError):
+        retriever.retrieve("hours", "active")
+    with pytest.raises(SearchUnavailable):
+        retriever.retrieve("hours", "active")
+    clock.now += 31
+    with pytest.raises(ConnectionError):
+        retriever.retrieve("hours", "active")
+    assert len(backend.calls) == 2
+
+
+def test_parse_search_response_and_format():
+    body = {
+        "results": [
+            {
+                "id": "1",
+                "document": {
+                    "derivedStructData": {
+                        "link": "https://cv.edu/a",
+                        "title": "<b>Esthetics</b>",
+                        "snippets": [{"snippet": "Our <b>esthetics</b> program &amp; more"}],
+                    }
+                },
+            },
+            {
+                "id": "2",
+                "document": {
+                    "derivedStructData": {
+                        "link": "https://cv.edu/b",
+                        "snippets": [{"snippet": "No snippet is available for this page."}],
+                    }
+                },
+            },
+        ]
+    }
+    results = parse_search_response(body)
+    assert results == [SearchResult("Our esthetics program & more", "https://cv.edu/a", "Esthetics")]
+
+    block = format_snippets(["one", "two"], ["https://cv.edu/a"])
+    assert "[1] one" in block and "[2] two" in block and block.endswith("https://cv.edu/a")
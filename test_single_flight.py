@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing: the key, followers on threads and
+coroutines, and identical concurrent requests through both entrypoints
+"""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from flask import Flask, request
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+import main
+from admission import AdmissionController
+from generation import DeadlineExceeded, GenerationCancelled
+from log_pipeline import BackgroundLogger, ListSink
+from single_flight import SingleFlight, flight_key
+
+DAY = date(2025, 10, 1)
+
+
+def test_flight_key():
+    key = flight_key("Hi!", [], "prompt", "m", DAY)
+    assert key == flight_key("  hi ", [], "prompt", "m", DAY)
+    history = [{"role": "user", "text": "hello"}, {"role": "assistant", "text": "Hi there!"}]
+    assert flight_key("nails?", history, "prompt", "m", DAY) == flight_key("nails?", list(history), "prompt", "m", DAY)
+    others = {
+        flight_key("Hi!", history, "prompt", "m", DAY),
+        flight_key("Hi!", [], "prompt v2", "m", DAY),
+        flight_key("Hi!", [], "prompt", "lite", DAY),
+        flight_key("Hi!", [], "prompt", "m", date(2025, 10, 2)),
+        flight_key("Hello!", [], "prompt", "m", DAY),
+    }
+    assert key not in others and len(others) == 5
+
+
+def test_followers_get_every_chunk_and_errors():
+    group = SingleFlight()
+    flight, leader = group.join("k")
+    assert leader
+    flight.publish("He")
+    # Followers joining mid-stream still see the chunks already published
+    followers = [group.join("k") for _ in range(3)]
+    assert not any(lead for _, lead in followers)
+
+    with ThreadPoolExecutor(3) as pool:
+        results = [pool.submit(lambda: list(flight.follow(2))) for _ in followers]
+        time.sleep(0.02)
+        flight.publish("llo")
+        group.finish("k", flight, model="m")
+    assert [r.result() for r in results] == [["He", "llo"]] * 3
+    assert flight.model == "m"
+    assert group.stats() == {
+        "leaders": 1, "followers": 3, "saved_calls": 3, "failed_flights": 0, "peak_waiters": 3, "in_flight": 0,
+    }
+
+    # A finished flight is gone; a failed one hands its error to followers
+    failed, leader = group.join("k")
+    assert leader
+    group.join("k")
+    group.finish("k", failed, error=DeadlineExceeded("slow"))
+    with pytest.raises(DeadlineExceeded):
+        list(failed.follow(1))
+    assert group.stats()["failed_flights"] == 1
+
+
+def test_followers_get_their_own_error_and_stop_counting_when_gone():
+    group = SingleFlight()
+    flight, _ = group.join("k")
+    quitter, stayer = group.join("k")[0].follow(1), group.join("k")[0].follow(1)
+    flight.publish("Hi")
+    assert next(quitter) == "Hi" and next(stayer) == "Hi"
+    quitter.close()  # this follower's client went away
+    assert flight.waiters == 1 and not group.abandon("k", flight)
+
+    original = DeadlineExceeded("slow")
+    group.finish("k", flight, error=original)
+    with pytest.raises(DeadlineExceeded) as first:
+        list(stayer)
+    with pytest.raises(DeadlineExceeded) as second:
+        list(flight.follow(1, follower=False))
+    assert first.value is not second.value and first.value.__cause__ is original
+    assert flight.waiters == 0
+
+    # Once every follower has gone, the leader's generation can be dropped
+    flight, _ = group.join("k")
+    follower = group.join("k")[0].follow(1)
+    flight.publish("Hi")
+    next(follower)
+    follower.close()
+    assert group.abandon("k", flight) and isinstance(flight.error, GenerationCancelled)
+
+
+def test_async_follow_and_timeout():
+    group = SingleFlight()
+
+    async def run():
+        flight, _ = group.join("k")
+
+        async def follow():
+            return [text async for text in flight.afollow(2)]
+
+        task = asyncio.ensure_future(follow())
+        for piece in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            flight.publish(piece)
+        group.finish("k", flight)
+        assert await task == ["a", "b", "c"]
+
+        stuck, _ = group.join("stuck")
+        with pytest.raises(DeadlineExceeded):
+            [text async for text in stuck.afollow(0.05)]
+
+    asyncio.run(run())
+
+
+class SlowModels:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def generate_content_stream(self, model, contents, config):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        if self.fail:
+            raise ValueError("model exploded")
+
+        async def chunks():
+            for part in ("Welcome ", "to **Christine Valmy**!"):
+                await asyncio.sleep(0.01)
+                yield SimpleNamespace(text=part, usage_metadata=None)
+
+        return chunks()
+
+
+@pytest.fixture
+def patched(monkeypatch):
+    sink = ListSink()
+    monkeypatch.setattr(main, "logger", BackgroundLogger(sink))
+    monkeypatch.setattr(main, "CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "SEARCH_RETRIEVAL_ENABLED", False)
+    monkeypatch.setattr(main, "admission", AdmissionController())
+    monkeypatch.setattr(main, "single_flight", SingleFlight())
+    return sink
+
+
+def asgi_client(monkeypatch, models):
+    monkeypatch.setattr(main, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    app = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_identical_requests_share_one_generation(patched, monkeypatch):
+    models = SlowModels()
+    client = asgi_client(monkeypatch, models)
+
+    async def run():
+        async with client:
+            posts = [client.post("/", json={"message": "Hi!", "user_id": f"u{i}"}) for i in range(4)]
+            posts.append(client.post("/", json={"message": "hi", "user_id": "s", "stream": True}))
+            posts.append(client.post("/", json={"message": "What about nails?", "user_id": "other"}))
+            return await asyncio.gather(*posts)
+
+    *json_replies, streamed, other = asyncio.run(run())
+    assert models.calls == 2  # one shared flight + the different question
+    assert {r.json()["response"] for r in json_replies} == {"Welcome to Christine Valmy!"}
+    assert "event: chunk" in streamed.text and "Welcome to Christine Valmy!" in streamed.text
+    assert other.status_code == 200
+
+    stats = main.single_flight.stats()
+    assert stats["followers"] == 4 and stats["saved_calls"] == 4 and stats["in_flight"] == 0
+    main.logger.flush()
+    replies = [info for info, _ in patched.entries if info["event"] == "assistant_reply"]
+    assert sum(1 for r in replies if r.get("single_flight") == {"follower": True}) == 4
+    assert [r["single_flight"] for r in replies if "waiters" in r.get("single_flight", {})] == [{"waiters": 4}]
+
+
+def test_leader_failure_reaches_followers(patched, monkeypatch):
+    models = SlowModels(fail=True)
+    client = asgi_client(monkeypatch, models)
+    # No lite → standard retry, so the model is called once per flight
+    monkeypatch.setattr(main.model_router, "enabled", False)
+
+    async def run():
+        async with client:
+            return await asyncio.gather(*(client.post("/", json={"message": "Hi!"}) for _ in range(3)))
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [500] * 3
+    assert all("model exploded" in r.json()["error"] for r in responses)
+    assert models.calls == 1
+    assert main.single_flight.stats()["failed_flights"] == 1
+
+
+def test_sync_entrypoint_coalesces_threads(patched, monkeypatch):
+    calls = []
+
+    def slow_chunks(*args, **kwargs):
+        calls.append(1)
+        time.sleep(0.2)
+        yield from ("Hello ", "there!")
+
+    monkeypatch.setattr(main, "iter_reply_chunks", slow_chunks)
+    flask_app = Flask("single_flight")
+    flask_app.add_url_rule("/", "app", lambda: main.app(request), methods=["POST"])
+    barrier = threading.Barrier(5)
+
+    def post(i):
+        client = flask_app.test_client()
+        barrier.wait()
+        return client.post("/", json={"message": "Hi", "user_id": f"u{i}"})
+
+    with ThreadPoolExecutor(5) as pool:
+        responses = list(pool.map(post, range(5)))
+    assert [json.loads(r.data)["response"] for r in responses] == ["Hello there!"] * 5
+    assert len(calls) == 1
+
+
+def test_unread_stream_gives_back_slot_and_flight(patched, monkeypatch):
+    monkeypatch.setattr(main, "iter_reply_chunks", lambda *args, **kwargs: iter(["Hello!"]))
+    flask_app = Flask("single_flight")
+
+    with flask_app.test_request_context("/", method="POST", json={"message": "Hi", "stream": True}):
+        response = main.app(request)
+    assert main.admission.stats()["in_flight"] == 1
+    response.close()  # the client went away before the first byte
+    assert main.admission.stats()["in_flight"] == 0
+    assert main.single_flight.stats()["in_flight"] == 0
+
+
+def test_asgi_disconnect_before_body_gives_back_slot_and_flight(patched, monkeypatch):
+    from starlette.requests import ClientDisconnect, Request
+
+    monkeypatch.setattr(main, "_client", SimpleNamespace(aio=SimpleNamespace(models=SlowModels())))
+    body = json.dumps({"message": "Hi", "stream": True}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "path": "/", "query_string": b"", "client": ("203.0.113.7", 5000),
+        "headers": [(b"content-type", b"application/json")],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    async def run():
+        response = await main.app_async(Request(scope, receive))
+        assert main.admission.stats()["in_flight"] == 1
+        with pytest.raises(ClientDisconnect):
+            await response(scope, receive, send)
+
+    asyncio.run(run())
+    assert main.admission.stats()["in_flight"] == 0
+    assert main.single_flight.stats()["in_flight"] == 0
+
+
+def has_follower():
+    return any(flight.waiters for flight in main.single_flight._flights.values())
+
+
+def test_followers_outlive_a_disconnected_sync_leader(patched, monkeypatch):
+    resume = threading.Event()
+
+    def chunks(*args, **kwargs):
+        yield "Hello "
+        resume.wait(2)
+        yield "there!"
+
+    monkeypatch.setattr(main, "iter_reply_chunks", chunks)
+    flask_app = Flask("single_flight")
+    flask_app.add_url_rule("/", "app", lambda: main.app(request), methods=["POST"])
+
+    with flask_app.test_request_context("/", method="POST", json={"message": "Hi", "stream": True}):
+        leader = main.app(request)
+        body = iter(leader.response)
+        assert "Hello " in next(body)
+
+    with ThreadPoolExecutor(1) as pool:
+        follower = pool.submit(lambda: flask_app.test_client().post("/", json={"message": "Hi", "user_id": "f"}))
+        while not has_follower():
+            time.sleep(0.005)
+        leader.close()  # the leader's client goes away mid-reply
+        resume.set()
+        reply = follower.result(2)
+    assert json.loads(reply.data)["response"] == "Hello there!"
+    assert main.single_flight.stats()["failed_flights"] == 0
+    deadline = time.monotonic() + 2
+    while main.admission.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert main.admission.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("cut_at", ["http.response.start", "http.response.body"])
+def test_followers_outlive_a_disconnected_async_leader(patched, monkeypatch, cut_at):
+    from starlette.requests import ClientDisconnect, Request
+
+    models = SlowModels()
+    client = asgi_client(monkeypatch, models)
+    body = json.dumps({"message": "Hi!", "stream": True}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "path": "/", "query_string": b"", "client": ("203.0.113.7", 5000),
+        "headers": [(b"content-type", b"application/json")],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == cut_at:
+            raise OSError("connection reset")
+
+    async def run():
+        leader = await main.app_async(Request(scope, receive))
+        async with client:
+            follower = asyncio.ensure_future(client.post("/", json={"message": "Hi!", "user_id": "f"}))
+            while not has_follower():
+                await asyncio.sleep(0.005)
+            with pytest.raises(ClientDisconnect):
+                await leader(scope, receive, send)
+            return await follower
+
+    reply = asyncio.run(run())
+    assert reply.status_code == 200 and reply.json()["response"] == "Welcome to Christine Valmy!"
+    assert models.calls == 1
+    assert main.admission.stats()["in_flight"] == 0
+
+
+def test_unread_follower_stops_counting(patched, monkeypatch):
+    resume = threading.Event()
+
+    def chunks(*args, **kwargs):
+        resume.wait(2)
+        yield "Hello!"
+
+    monkeypatch.setattr(main, "iter_reply_chunks", chunks)
+    flask_app = Flask("single_flight")
+    flask_app.add_url_rule("/", "app", lambda: main.app(request), methods=["POST"])
+
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(lambda: flask_app.test_client().post("/", json={"message": "Hi"}))
+        while not main.single_flight.stats()["in_flight"]:
+            time.sleep(0.005)
+        with flask_app.test_request_context("/", method="POST", json={"message": "Hi", "stream": True}):
+            follower = main.app(request)
+        assert has_follower()
+        follower.close()  # gone before reading a byte
+        assert not has_follower()
+        resume.set()
+        assert json.loads(leader.result(2).data)["response"] == "Hello!"
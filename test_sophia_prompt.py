@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request system prompt assembly in sophia_prompt and the
+schedule/pricing store in course_data
+"""
+
+from datetime import date
+
+import sophia_prompt
+from course_data import CAMPUS_NJ, CAMPUS_NY, next_starts, render_pricing, render_schedule
+from sophia_prompt import full_system_prompt, get_system_prompt_for_request
+
+NY_PRICING = render_pricing(CAMPUS_NY)
+NJ_PRICING = render_pricing(CAMPUS_NJ)
+
+
+def _freeze_today(monkeypatch, day):
+    monkeypatch.setattr(sophia_prompt, "current_date", lambda: day)
+
+
+def test_greeting_gets_no_schedules_or_pricing(monkeypatch):
+    _freeze_today(monkeypatch, date(2025, 9, 17))
+    prompt = get_system_prompt_for_request(history=[], user_query="hi")
+    assert "Schedule Data" not in prompt
+    assert "Pricing (2025)" not in prompt
+    assert len(prompt) < len(full_system_prompt(date(2025, 9, 17))) / 2
+
+
+def test_pricing_only_for_named_campus():
+    prompt = get_system_prompt_for_request(
+        history=[{"role": "user", "text": "I'm interested in barbering"}],
+        user_query="how much does it cost?",
+    )
+    assert NJ_PRICING in prompt
+    assert NY_PRICING not in prompt
+
+
+def test_schedule_for_campus_in_query(monkeypatch):
+    _freeze_today(monkeypatch, date(2025, 9, 17))
+    prompt = get_system_prompt_for_request(history=[], user_query="what courses in NJ")
+    assert render_schedule(CAMPUS_NJ, date(2025, 9, 17)) in prompt
+    assert "New York Schedule Data" not in prompt
+    assert "Pricing (2025)" not in prompt
+
+
+def test_spanish_turn_gets_language_rules():
+    prompt = get_system_prompt_for_request(history=[], user_query="hola, cuánto cuesta?")
+    assert "Spanish indicators" in prompt
+    assert NY_PRICING in prompt and NJ_PRICING in prompt
+
+
+def test_today_follows_the_calendar(monkeypatch):
+    _freeze_today(monkeypatch, date(2025, 10, 1))
+    first = get_system_prompt_for_request(history=[], user_query="hi")
+    _freeze_today(monkeypatch, date(2025, 10, 2))
+    second = get_system_prompt_for_request(history=[], user_query="hi")
+    assert "{today}" not in first
+    assert "2025-10-01" in first and "2025-10-02" in second
+
+
+def test_next_starts_skips_past_and_today():
+    key = (CAMPUS_NJ, "Skin Care", "English", "Full Time Day")
+    starts = [s.start for s in next_starts(key, date(2025, 10, 6))]
+    assert starts == [date(2025, 11, 3), date(2025, 12, 8)]
+    assert next_starts(key, date(2025, 12, 8)) == []
+
+
+def test_schedule_fragment_drops_past_dates():
+    fragment = render_schedule(CAMPUS_NY, date(2025, 11, 20))
+    assert "9/8/2025" not in fragment
+    assert "12/1/2025" in fragment
+    assert "No upcoming start dates" in render_schedule(CAMPUS_NY, date(2027, 1, 1))
+
+
+def test_route_grounding():
+    from sophia_prompt import route_grounding
+
+    asked_name = [{"role": "assistant", "text": "Great! What's your full name?"}]
+    assert route_grounding([], "hi there!") == (False, "greeting")
+    assert route_grounding([], "ok, sounds good, thanks") == (False, "acknowledgement")
+    assert route_grounding([], "ana@example.com") == (False, "contact_info")
+    assert route_grounding([], "my name is Ana") == (False, "contact_info")
+    assert route_grounding(asked_name, "Ana Lopez") == (False, "contact_info")
+    assert route_grounding([], "Ana Lopez") == (True, "default")
+    assert route_grounding([], "hi, what programs do you have?") == (True, "topic")
+    assert route_grounding([], "is parking available?") == (True, "default")
+
+
+def test_yes_to_an_offer_follows_its_topic(monkeypatch):
+    from sophia_prompt import route_grounding
+
+    _freeze_today(monkeypatch, date(2025, 9, 17))
+    offer = [
+        {"role": "user", "text": "I'm interested in the nails program"},
+        {"role": "assistant", "text": "Would you like to see the upcoming start dates?"},
+    ]
+    for reply in ("yes", "Sure!", "ok"):
+        assert route_grounding(offer, reply) == (True, "follow_up")
+    prompt = get_system_prompt_for_request(history=offer, user_query="yes")
+    assert render_schedule(CAMPUS_NY, date(2025, 9, 17)) in prompt
+
+    # Closing signals and offers without a topic are still plain acknowledgements
+    assert route_grounding(offer, "no thanks") == (False, "acknowledgement")
+    assert route_grounding(offer, "ok bye") == (False, "acknowledgement")
+    ask_email = [{"role": "assistant", "text": "Can I get your email?"}]
+    assert route_grounding(ask_email, "sure") == (False, "acknowledgement")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for stage spans and token usage extraction
+"""
+
+import time
+from types import SimpleNamespace
+
+from telemetry import Spans, usage_counts
+
+
+def test_spans_accumulate_and_render():
+    spans = Spans()
+    with spans.span("prompt"):
+        time.sleep(0.01)
+    spans.add("model first", 0.5)
+    spans.add("log", 0.001)
+    spans.add("log", 0.001)
+
+    stages = spans.as_dict()
+    assert list(stages) == ["prompt", "model first", "log"]
+    assert stages["prompt"] >= 10 and stages["model first"] == 500.0 and stages["log"] == 2.0
+    assert spans.server_timing() == (
+        f"prompt;dur={stages['prompt']:.1f}, model_first;dur=500.0, log;dur=2.0"
+    )
+
+
+def test_usage_counts():
+    usage = SimpleNamespace(
+        prompt_token_count=1200,
+        cached_content_token_count=1000,
+        tool_use_prompt_token_count=None,
+        candidates_token_count=80,
+        thoughts_token_count=None,
+        total_token_count=1280,
+    )
+    assert usage_counts(usage) == {
+        "prompt": 1200, "cached": 1000, "tool": 0, "output": 80, "thoughts": 0, "total": 1280,
+    }
+    assert usage_counts(None) is None
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the server-side thread stores (in-memory LRU and SQLite)
+"""
+
+import pytest
+
+from thread_store import InMemoryThreadStore, SQLiteThreadStore, thread_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryThreadStore(max_threads=2, max_turns=4)
+    return SQLiteThreadStore(str(tmp_path / "threads.sqlite3"), max_turns=4)
+
+
+def test_append_and_load(store):
+    key = thread_key("u1", "t1")
+    store.append(key, "user", "hi")
+    store.append(key, "assistant", "Hello!")
+    history, contents = store.load(key)
+    assert history == [{"role": "user", "text": "hi"}, {"role": "assistant", "text": "Hello!"}]
+    assert [c.role for c in contents] == ["user", "model"]
+    assert contents[1].parts[0].text == "Hello!"
+
+
+def test_threads_are_scoped_per_user(store):
+    store.append(thread_key("u1", "t1"), "user", "hi")
+    assert store.history(thread_key("u2", "t1")) == []
+    # A separator inside an id cannot reach another caller's thread
+    store.append(thread_key("a:b", "c"), "user", "private")
+    assert store.history(thread_key("a", "b:c")) == []
+    assert thread_key('a","b', "c") != thread_key("a", 'b","c')
+
+
+def test_keeps_most_recent_turns(store):
+    key = thread_key("u1", "t1")
+    for i in range(6):
+        store.append(key, "user", f"m{i}")
+    assert [h["text"] for h in store.history(key)] == ["m2", "m3", "m4", "m5"]
+
+
+def test_loaded_contents_can_be_extended(store):
+    key = thread_key("u1", "t1")
+    store.append(key, "user", "hi")
+    store.contents(key).append("scratch")
+    assert len(store.contents(key)) == 1
+
+
+def test_memory_store_evicts_least_recent_thread():
+    store = InMemoryThreadStore(max_threads=2)
+    store.append("a", "user", "1")
+    store.append("b", "user", "1")
+    store.history("a")
+    store.append("c", "user", "1")
+    assert store.history("b") == []
+    assert store.history("a") != []
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for request decoding, size limits and response compression, on their
+own and through both entrypoints
+"""
+
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+from flask import Flask, request
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+import main
+from log_pipeline import BackgroundLogger, ListSink
+from wire import (
+    InvalidBody,
+    PayloadTooLarge,
+    UnsupportedEncoding,
+    accepts_gzip,
+    decode_body,
+    encode_body,
+    get_codec,
+    parse_json_object,
+)
+
+
+def test_decode_body_limits():
+    raw = json.dumps({"message": "hi"}).encode()
+    assert decode_body(gzip.compress(raw), "gzip", 1000) == raw
+    assert decode_body(raw, None, 1000) == raw
+    # A tiny compressed body that expands past the limit
+    bomb = gzip.compress(b" " * 100_000)
+    assert len(bomb) < 1000
+    with pytest.raises(PayloadTooLarge):
+        decode_body(bomb, "gzip", 10_000)
+    with pytest.raises(InvalidBody):
+        decode_body(b"not gzip", "gzip", 1000)
+    with pytest.raises(InvalidBody):
+        decode_body(gzip.compress(raw)[:-8], "gzip", 1000)
+    with pytest.raises(UnsupportedEncoding):
+        decode_body(raw, "br", 1000)
+
+
+def test_codecs_and_json_objects():
+    for name in ("json", "auto"):
+        dumps, loads = get_codec(name)
+        assert loads(dumps({"text": "¿Cuánto cuesta?"})) == {"text": "¿Cuánto cuesta?"}
+        assert parse_json_object(b"[1]", loads) == {} and parse_json_object(b"{bad", loads) == {}
+
+
+def test_response_negotiation():
+    body = b"x" * 2000
+    assert accepts_gzip("br, gzip;q=0.5") and not accepts_gzip("gzip;q=0") and not accepts_gzip(None)
+    compressed, headers = encode_body(body, "gzip, deflate", min_bytes=1024)
+    assert headers["Content-Encoding"] == "gzip" and gzip.decompress(compressed) == body
+    assert encode_body(b"small", "gzip", min_bytes=1024) == (b"small", {"Vary": "Accept-Encoding"})
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(main, "logger", BackgroundLogger(ListSink()))
+    monkeypatch.setattr(main, "iter_reply_chunks", lambda *a, **kw: iter(["Hello! " * 300]))
+    monkeypatch.setattr(main, "CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "SEARCH_RETRIEVAL_ENABLED", False)
+
+
+def test_flask_entrypoint_gzip_both_ways(fake_model, monkeypatch):
+    flask_app = Flask("wire")
+    flask_app.add_url_rule("/", "app", lambda: main.app(request), methods=["POST"])
+    client = flask_app.test_client()
+    history = [{"role": "user", "text": "tell me about nails " * 20}] * 10
+    body = gzip.compress(json.dumps({"message": "hi", "history": history}).encode())
+
+    resp = client.post(
+        "/", data=body, headers={"Content-Encoding": "gzip", "Content-Type": "application/json",
+                                 "Accept-Encoding": "gzip"},
+    )
+    assert resp.status_code == 200 and resp.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(resp.data))["response"].startswith("Hello!")
+
+    monkeypatch.setattr(main, "MAX_REQUEST_BYTES", 100)
+    too_big = client.post("/", json={"message": "x" * 200})
+    assert too_big.status_code == 413
+    bad = client.post("/", data=b"garbage", headers={"Content-Encoding": "gzip"})
+    assert bad.status_code == 400
+
+
+def test_asgi_entrypoint_limits(fake_model, monkeypatch):
+    monkeypatch.setattr(main, "MAX_REQUEST_BYTES", 64)
+    app = Starlette(routes=[Route("/", main.app_async, methods=["POST"])])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            too_big = await client.post("/", json={"message": "x" * 100})
+            unsupported = await client.post("/", content=b"{}", headers={"Content-Encoding": "br"})
+        return too_big, unsupported
+
+    too_big, unsupported = asyncio.run(run())
+    assert too_big.status_code == 413 and "limit" in too_big.json()["error"]
+    assert unsupported.status_code == 415
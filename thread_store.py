@@ -0,0 +1,150 @@
+# thread_store.py
+"""
+Server-side conversation threads, so clients can send only the new message.
+
+Turns are stored per (user_id, thread_id) in the request history format
+({"role": "user|assistant", "text": ...}) alongside ready-to-send google-genai
+`Content` objects. Two backends share the `ThreadStore` interface: an
+in-process LRU and SQLite (for a local disk / mounted volume).
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from google.genai.types import Content, Part
+
+_GENAI_ROLES = {"user": "user", "assistant": "model"}
+
+
+def thread_key(user_id: str, thread_id: str) -> str:
+    """Store key for a thread; JSON-encoded so no (user_id, thread_id) pair can spell another's."""
+    return json.dumps([user_id, thread_id], ensure_ascii=False, separators=(",", ":"))
+
+
+def _to_content(role: str, text: str) -> Content:
+    return Content(role=_GENAI_ROLES[role], parts=[Part(text=text)])
+
+
+class ThreadStore:
+    """Interface for thread stores."""
+
+    def history(self, key: str) -> List[Dict[str, str]]:
+        """Turns as request-style dicts, oldest first."""
+        raise NotImplementedError
+
+    def contents(self, key: str) -> List[Content]:
+        """Turns as google-genai `Content`, oldest first (a new list the caller may extend)."""
+        raise NotImplementedError
+
+    def load(self, key: str) -> Tuple[List[Dict[str, str]], List[Content]]:
+        """Both views at once: (history, contents)."""
+        return self.history(key), self.contents(key)
+
+    def append(self, key: str, role: str, text: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryThreadStore(ThreadStore):
+    """LRU over threads; each thread keeps at most `max_turns` recent turns."""
+
+    def __init__(self, max_threads: int = 10000, max_turns: int = 200):
+        self.max_threads = max_threads
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._threads: "OrderedDict[str, Tuple[List[Dict[str, str]], List[Content]]]" = OrderedDict()
+
+    def _get(self, key: str):
+        thread = self._threads.get(key)
+        if thread is not None:
+            self._threads.move_to_end(key)
+        return thread
+
+    def history(self, key: str) -> List[Dict[str, str]]:
+        with self._lock:
+            thread = self._get(key)
+            return list(thread[0]) if thread else []
+
+    def contents(self, key: str) -> List[Content]:
+        with self._lock:
+            thread = self._get(key)
+            return list(thread[1]) if thread else []
+
+    def load(self, key: str) -> Tuple[List[Dict[str, str]], List[Content]]:
+        with self._lock:
+            thread = self._get(key)
+            return (list(thread[0]), list(thread[1])) if thread else ([], [])
+
+    def append(self, key: str, role: str, text: str) -> None:
+        content = _to_content(role, text)
+        with self._lock:
+            thread = self._get(key)
+            if thread is None:
+                thread = ([], [])
+                self._threads[key] = thread
+                while len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+            items, contents = thread
+            items.append({"role": role, "text": text})
+            contents.append(content)
+            if len(items) > self.max_turns:
+                del items[: -self.max_turns]
+                del contents[: -self.max_turns]
+
+
+class SQLiteThreadStore(ThreadStore):
+    """Turns persisted in SQLite; reads return the `max_turns` most recent turns."""
+
+    def __init__(self, path: str, max_turns: int = 200):
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " thread_key TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS turns_by_thread ON turns (thread_key, seq)"
+            )
+
+    def _rows(self, key: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, text FROM turns WHERE thread_key = ?"
+                " ORDER BY seq DESC LIMIT ?",
+                (key, self.max_turns),
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def history(self, key: str) -> List[Dict[str, str]]:
+        return [{"role": role, "text": text} for role, text in self._rows(key)]
+
+    def contents(self, key: str) -> List[Content]:
+        return [_to_content(role, text) for role, text in self._rows(key)]
+
+    def load(self, key: str) -> Tuple[List[Dict[str, str]], List[Content]]:
+        rows = self._rows(key)
+        return (
+            [{"role": role, "text": text} for role, text in rows],
+            [_to_content(role, text) for role, text in rows],
+        )
+
+    def append(self, key: str, role: str, text: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO turns (thread_key, role, text, created_at) VALUES (?, ?, ?, ?)",
+                (key, role, text, time.time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,131 @@
+# wire.py
+"""
+Request and response bodies on the wire.
+
+- Request bodies may be sent with `Content-Encoding: gzip`; they are
+  decompressed with a hard cap on the decoded size, so a small compressed body
+  cannot expand into an arbitrarily large one. Size limits are checked before
+  anything is parsed.
+- JSON responses are gzip-compressed when the client's `Accept-Encoding`
+  allows it and the body is big enough to be worth it.
+- JSON is encoded/decoded with orjson when it is installed (optional), else
+  the standard library; `JSON_CODEC=json` forces the standard library.
+"""
+import gzip
+import json
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+
+class PayloadTooLarge(Exception):
+    """Request body over the configured limit (HTTP 413)."""
+
+
+class UnsupportedEncoding(ValueError):
+    """Content-Encoding the server does not decode (HTTP 415)."""
+
+
+class InvalidBody(ValueError):
+    """Body that does not decode as its Content-Encoding says (HTTP 400)."""
+
+
+# ---------- JSON codecs ----------
+def _std_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _std_loads(raw: bytes) -> Any:
+    return json.loads(raw)
+
+
+JSON_CODECS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    "json": (_std_dumps, _std_loads),
+}
+if orjson is not None:
+    JSON_CODECS["orjson"] = (orjson.dumps, orjson.loads)
+
+
+def get_codec(name: str = "auto") -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    """(dumps → bytes, loads) for `name`; "auto" prefers orjson."""
+    name = (name or "auto").lower()
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_CODECS else "json"
+    if name not in JSON_CODECS:
+        raise ValueError(f"unknown or unavailable JSON codec: {name}")
+    return JSON_CODECS[name]
+
+
+# ---------- request bodies ----------
+def check_length(content_length: Optional[int], max_bytes: int) -> None:
+    """Reject a declared body size over the limit before reading it."""
+    if content_length is not None and content_length > max_bytes:
+        raise PayloadTooLarge(f"Request body is {content_length} bytes; the limit is {max_bytes}.")
+
+
+def gunzip_limited(raw: bytes, max_bytes: int) -> bytes:
+    """Decompress gzip `raw`, failing once the output would exceed `max_bytes`."""
+    decompressor = zlib.decompressobj(wbits=31)
+    try:
+        out = decompressor.decompress(raw, max_bytes + 1)
+    except zlib.error as e:
+        raise InvalidBody(f"Invalid gzip body: {e}") from None
+    if len(out) > max_bytes or decompressor.unconsumed_tail:
+        raise PayloadTooLarge(f"Decompressed request body is over the {max_bytes} byte limit.")
+    if not decompressor.eof:
+        raise InvalidBody("Invalid gzip body: truncated")
+    return out
+
+
+def decode_body(raw: bytes, content_encoding: Optional[str], max_decoded_bytes: int) -> bytes:
+    """Raw request bytes → decoded bytes, per `Content-Encoding`."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        if len(raw) > max_decoded_bytes:
+            raise PayloadTooLarge(f"Request body is over the {max_decoded_bytes} byte limit.")
+        return raw
+    if encoding in ("gzip", "x-gzip"):
+        return gunzip_limited(raw, max_decoded_bytes)
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+def parse_json_object(raw: bytes, loads: Callable[[bytes], Any]) -> Dict[str, Any]:
+    """A JSON object from `raw`; anything else (empty, invalid, not an object) → {}."""
+    if not raw:
+        return {}
+    try:
+        data = loads(raw)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+# ---------- responses ----------
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether `Accept-Encoding` allows gzip (honours `q=0`)."""
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip().lower()
+            if q.startswith("q="):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+
+def encode_body(
+    body: bytes, accept_encoding: Optional[str], min_bytes: int, level: int = 5
+) -> Tuple[bytes, Dict[str, str]]:
+    """(body, extra headers): gzip when accepted and `body` is at least `min_bytes`."""
+    headers = {"Vary": "Accept-Encoding"}
+    if min_bytes >= 0 and len(body) >= min_bytes and accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(body, compresslevel=level, mtime=0), headers
+    return body, headers